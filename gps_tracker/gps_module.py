@@ -31,13 +31,25 @@ class SCRALGPS(SCRALModule):
         raise NotImplementedError("Implement runtime method in subclasses")
 
     def ogc_datastream_registration(self, device_id: str, description: str, unit_of_measure: Optional[str] = None,
-                                    catalog_key: Optional[str] = None) -> List[OGCDatastream]:
-        """ This method registers new DATASTREAMs in the OGC model. """
+                                    catalog_key: Optional[str] = None,
+                                    properties: Optional[dict] = None) -> List[OGCDatastream]:
+        """ This method registers new DATASTREAMs in the OGC model, replacing the resource catalog entry of the device.
 
+        :param properties: [OPT] Other fields stored in the resource catalog entry.
+        :return: The registered DATASTREAMs.
+        """
         if catalog_key is None:
             catalog_key = device_id
-        self._resource_catalog[catalog_key] = {}
+        entry = self._resource_catalog.register(
+            catalog_key, lambda: self._build_catalog_entry(device_id, description, unit_of_measure, properties))
+        return self._get_entry_datastreams(entry)
+
+    def _build_catalog_entry(self, device_id: str, description: str, unit_of_measure: Optional[str] = None,
+                             properties: Optional[dict] = None) -> Optional[dict]:
+        """ Register the DATASTREAMs of a device on the OGC server.
 
+        :return: The resource catalog entry of the device, None if no DATASTREAM was registered.
+        """
         # Collect OGC information needed to build DATASTREAMs payload
         thing = self._ogc_config.get_thing()
         thing_id = thing.get_id()
@@ -47,7 +59,7 @@ class SCRALGPS(SCRALModule):
         sensor_id = sensor.get_id()
         sensor_name = sensor.get_name()
 
-        datastream_list = []
+        entry = {}  # added to the resource catalog only when complete
         for observed_property in self._ogc_config.get_observed_properties():
             property_id = observed_property.get_id()
             property_name = observed_property.get_name()
@@ -64,8 +76,18 @@ class SCRALGPS(SCRALModule):
 
             else:
                 ds.set_id(datastream_id)
-                datastream_list.append(ds)
                 self._ogc_config.add_datastream(ds)
-                self._resource_catalog[catalog_key][property_name] = ds.get_id()
+                entry[property_name] = ds.get_id()
+
+        if not entry:
+            return None
+        if properties:
+            entry.update(properties)
+        return entry
 
-        return datastream_list
+    def _get_entry_datastreams(self, entry: Optional[dict]) -> List[OGCDatastream]:
+        """ The DATASTREAMs of a resource catalog entry (built by "_build_catalog_entry"). """
+        if not entry:
+            return []
+        return [self._ogc_config.get_datastream(entry[op.get_name()])
+                for op in self._ogc_config.get_observed_properties() if op.get_name() in entry]
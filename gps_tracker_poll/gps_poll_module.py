@@ -20,13 +20,12 @@ from typing import Dict
 
 import requests
 import paho.mqtt.client as mqtt
-import arrow
 from requests.exceptions import SSLError
 
 from scral_ogc import OGCObservation, OGCDatastream
 
 from scral_core.ogc_configuration import OGCConfiguration
-from scral_core import util, mqtt_util
+from scral_core import clock, log_util, util, mqtt_util
 from scral_core.constants import DEFAULT_KEEPALIVE, DEFAULT_MQTT_QOS, OGC_ID_KEY, CATALOG_FILENAME, \
                                  BROKER_DEFAULT_PORT, \
                                  MQTT_KEY, MQTT_SUB_BROKER_KEY, MQTT_SUB_BROKER_PORT_KEY, MQTT_SUB_BROKER_KEEP_KEY, \
@@ -50,10 +49,11 @@ class SCRALGPSPoll(SCRALGPS):
         super().__init__(ogc_config, connection_file, catalog_name)
 
         # Creating an MQTT Subscriber
-        self._mqtt_subscriber = mqtt.Client(BROKER_HAMBURG_CLIENT_ID)
-        self._mqtt_subscriber.on_connect = mqtt_util.on_connect
-        self._mqtt_subscriber.on_disconnect = mqtt_util.automatic_reconnection
+        self._mqtt_subscriber = self._create_mqtt_subscriber(BROKER_HAMBURG_CLIENT_ID)
         self._mqtt_subscriber.on_message = self.on_message_received
+        # network loop, reconnections and re-subscriptions are managed by a dedicated thread
+        self._reconnection = mqtt_util.ReconnectionManager(self._mqtt_subscriber, BROKER_HAMBURG_CLIENT_ID + "-network",
+                                                           mqtt_util.on_connect)
 
         # Loading broker info from connection file
         if connection_file:
@@ -100,7 +100,7 @@ class SCRALGPSPoll(SCRALGPS):
         logging.info("Try to connect to broker: %s:%d for LISTENING..."
                      % (self._sub_broker_address, self._sub_broker_port))
         logging.debug("Client id is: '" + BROKER_HAMBURG_CLIENT_ID + "'")
-        self._mqtt_subscriber.connect(self._sub_broker_address,  self._sub_broker_port, self._sub_broker_keepalive)
+        self._reconnection.connect(self._sub_broker_address, self._sub_broker_port, self._sub_broker_keepalive)
 
     # noinspection PyMethodOverriding
     def runtime(self, dynamic_discovery: bool = True):
@@ -115,10 +115,9 @@ class SCRALGPSPoll(SCRALGPS):
         if dynamic_discovery:
             th = Thread(target=self.dynamic_discovery)
             th.start()
-            self._mqtt_subscriber.loop_start()
             th.join()
         else:
-            self._mqtt_subscriber.loop_forever()
+            self._reconnection.join()
 
     def datastream_discovery(self):
         http_request = None
@@ -145,12 +144,10 @@ class SCRALGPSPoll(SCRALGPS):
             # if iot_id in self._resource_catalog:
             #   logging.info("Device: " + device_id + " already registered with id: " + iot_id)
             # else:
+            # Associating HAMBURG THING id to MONICA DATASTREAM id (plus HAMBURG device_id)
             datastreams = self.ogc_datastream_registration(
-                device_id, device_description, HAMBURG_UNIT_OF_MEASURE,iot_id)
+                device_id, device_description, HAMBURG_UNIT_OF_MEASURE, iot_id, {DEVICE_ID_KEY: device_id})
             if len(datastreams) > 0:
-                # Associating HAMBURG THING id to MONICA DATASTREAM id (plus HAMBURG device_id)
-                self._resource_catalog[iot_id][DEVICE_ID_KEY] = device_id
-
                 for ds in datastreams:  # right now there is only 1 Datastream for each dom device
                     ds.set_mqtt_topic(THINGS_SUBSCRIBE_TOPIC + "(" + iot_id + ")/Locations")
 
@@ -166,7 +163,7 @@ class SCRALGPSPoll(SCRALGPS):
         for ds in datastreams.values():
             top = ds.get_mqtt_topic()
             logging.debug("Subscribing to MQTT topic: " + top)
-            self._mqtt_subscriber.subscribe(top, DEFAULT_MQTT_QOS)
+            self._reconnection.subscribe(top, DEFAULT_MQTT_QOS)
 
     def dynamic_discovery(self):
         """ This method implements the dynamic discovery.
@@ -174,18 +171,26 @@ class SCRALGPSPoll(SCRALGPS):
         """
         while True:
             sleep(DYNAMIC_DISCOVERY_SLEEP)
-            logging.debug("Starting Dynamic Discovery!")
-            self.datastream_discovery()
+            if not self.begin_activity():
+                break  # the module is shutting down
+            try:
+                logging.debug("Starting Dynamic Discovery!")
+                self.datastream_discovery()
+            finally:
+                self.end_activity()
 
     def on_message_received(self, client, userdata, msg):
-        logging.debug("\nOn topic: "+msg.topic + " - message received:\n" + str(msg.payload))
-        observation_time = str(arrow.utcnow())
+        # each topic is a device: its messages are handled in order, the ones of different devices in parallel
+        self.submit_ordered(msg.topic, self._handle_message, msg)
+
+    def _handle_message(self, msg: mqtt.MQTTMessage):
+        if log_util.sampled(logging.DEBUG, "message", msg.topic):
+            logging.debug("\nOn topic: %s - message received:\n%s", msg.topic, msg.payload)
+        observation_time = clock.utc_now_iso()
         thing_id = str(msg.topic.split('(')[1].split(')')[0])  # Get the thing_id associated to the physical device
 
         datastream_id = self._resource_catalog[thing_id][LOCALIZATION]
         device_id = self._resource_catalog[thing_id][DEVICE_ID_KEY]
-        topic_prefix = self._topic_prefix
-        topic = topic_prefix + "Datastreams(" + str(datastream_id) + ")/Observations"
 
         # OBSERVATION result
         hamburg_obs_result = json.loads(msg.payload)["location"]["geometry"]  # Load the received message
@@ -197,8 +202,7 @@ class SCRALGPSPoll(SCRALGPS):
 
         # Create OGC Observation and publish
         ogc_observation = OGCObservation(datastream_id, observation_time, observation_result, observation_time)
-        observation_payload = json.dumps(dict(ogc_observation.get_rest_payload()))
-        ok = self.mqtt_publish(topic, observation_payload)
+        ok = self.ogc_observation_publish(ogc_observation, device_id=device_id, observed_property=LOCALIZATION)
         self._update_active_devices_counter()
         if not ok:
             logging.error("Impossible to send MQTT message")
@@ -55,5 +55,6 @@ if __name__ == '__main__':
     sys.stdout.flush()
 
     signal.signal(signal.SIGINT, util.signal_handler)
+    signal.signal(signal.SIGTERM, util.signal_handler)
     main()
     print(END_MESSAGE)
@@ -10,14 +10,14 @@
 # SCRAL is distributed under a BSD-style license -- See file LICENSE.md     #
 #                                                                           #
 #############################################################################
-import json
 import logging
 from typing import Union
 
-import arrow
-
 from scral_ogc import OGCObservation
+from scral_core import clock, log_util
+from scral_core.constants import PRIORITY_HIGH
 from scral_core.rest_module import SCRALRestModule
+from gps_tracker.constants import ALERT
 from gps_tracker.gps_module import SCRALGPS
 
 from gps_tracker_rest.constants import TAG_ID_KEY, TYPE_KEY, TIMESTAMP_KEY, GPS_UNIT_OF_MEASURE
@@ -25,14 +25,22 @@ from gps_tracker_rest.constants import TAG_ID_KEY, TYPE_KEY, TIMESTAMP_KEY, GPS_
 
 class SCRALGPSRest(SCRALRestModule, SCRALGPS):
 
-    def new_datastream(self, payload: dict) -> bool:
+    _default_priorities = {ALERT: PRIORITY_HIGH}
+
+    def new_datastream(self, payload: dict) -> Union[bool, None]:
+        """ Register a new GPS tag.
+
+        :return: True if the tag was registered, False if the registration failed, None if it was already registered.
+        """
         device_id = payload[TAG_ID_KEY]
         description = payload[TYPE_KEY]
-        datastream_list = self.ogc_datastream_registration(device_id, description, GPS_UNIT_OF_MEASURE)
-        if not datastream_list or len(datastream_list) < 1:
-            return False
+        # concurrent registrations of the same tag register its DATASTREAMs only once
+        entry, created = self._resource_catalog.register_if_absent(
+            device_id, lambda: self._build_catalog_entry(device_id, description, GPS_UNIT_OF_MEASURE))
+        if not created:
+            return None if entry is not None else False
         else:
-            self.update_file_catalog()
+            self.update_file_catalog(device_id)
             return True
 
     def ogc_observation_registration(self, observed_property: str, payload: dict) -> Union[bool, None]:
@@ -40,22 +48,20 @@ class SCRALGPSRest(SCRALRestModule, SCRALGPS):
         if gps_tag_id not in self._resource_catalog:
             return None
 
-        observation_time = str(arrow.utcnow())
+        observation_time = clock.utc_now_iso()
         try:
             phenomenon_time = payload[TIMESTAMP_KEY]
         except KeyError:
-            phenomenon_time = str(arrow.utcnow())
+            phenomenon_time = clock.utc_now_iso()
 
-        logging.info("GPS: '"+gps_tag_id+"', Observation:\n"+json.dumps(payload)+".")
+        if log_util.sampled(logging.INFO, "observation", gps_tag_id):
+            logging.info("GPS: '%s', Observation:\n%s.", gps_tag_id, log_util.LazyJSON(payload))
 
         datastream_id = self._resource_catalog[gps_tag_id][observed_property]
-        topic_prefix = self._topic_prefix
-        topic = topic_prefix + "Datastreams(" + str(datastream_id) + ")/Observations"
 
         # Create OGC Observation and publish
         ogc_observation = OGCObservation(datastream_id, phenomenon_time, payload, observation_time)
-        observation_payload = json.dumps(ogc_observation.get_rest_payload())
-
-        mqtt_response = self.mqtt_publish(topic, observation_payload)
+        mqtt_response = self.ogc_observation_publish(ogc_observation, device_id=gps_tag_id,
+                                                     observed_property=observed_property)
         self._update_active_devices_counter()
         return mqtt_response
@@ -59,7 +59,7 @@ def main():
 
 @flask_instance.route(URI_GPS_TAG_REGISTRATION, methods=["POST"])
 def new_gps_tag_request() -> Response:
-    logging.debug(new_gps_tag_request.__name__ + " method called from: "+request.remote_addr)
+    logging.debug("%s method called from: %s", new_gps_tag_request.__name__, request.remote_addr)
 
     ok, status = rest_util.tests_and_checks(DOC[MODULE_NAME_KEY], scral_module, request)
     if not ok:
@@ -68,18 +68,15 @@ def new_gps_tag_request() -> Response:
     gps_tag_id = request.json[TAG_ID_KEY]
 
     # -> ### DATASTREAM REGISTRATION ###
-    rc = scral_module.get_resource_catalog()
-    if gps_tag_id not in rc:
-        logging.info("GPS tag: '" + str(gps_tag_id) + "' registration.")
-        ok = scral_module.new_datastream(request.json)
-        if not ok:
-            return make_response(jsonify({ERROR_RETURN_STRING: INTERNAL_SERVER_ERROR}), 500)
-
-        return make_response(jsonify({SUCCESS_RETURN_STRING: "Ok"}), 201)
-
-    else:
+    logging.info("GPS tag: '" + str(gps_tag_id) + "' registration.")
+    ok = scral_module.new_datastream(request.json)
+    if ok is None:
         logging.error("Device already registered!")
         return make_response(jsonify({ERROR_RETURN_STRING: DUPLICATE_REQUEST}), 422)
+    elif not ok:
+        return make_response(jsonify({ERROR_RETURN_STRING: INTERNAL_SERVER_ERROR}), 500)
+
+    return make_response(jsonify({SUCCESS_RETURN_STRING: "Ok"}), 201)
 
 
 @flask_instance.route(URI_GPS_TAG_REGISTRATION, methods=["DELETE"])
@@ -89,7 +86,7 @@ def remove_gps_tag() -> Response:
 
     :return: An HTTP Response.
     """
-    logging.debug(remove_gps_tag.__name__ + ", " + request.method + " method called from: " + request.remote_addr)
+    logging.debug("%s, %s method called from: %s", remove_gps_tag.__name__, request.method, request.remote_addr)
 
     ok, status = rest_util.tests_and_checks(DOC[MODULE_NAME_KEY], scral_module, request)
     if not ok:
@@ -101,7 +98,7 @@ def remove_gps_tag() -> Response:
 
 @flask_instance.route(URI_GPS_TAG_LOCALIZATION, methods=["PUT"])
 def new_gps_tag_localization() -> Response:
-    logging.debug(new_gps_tag_alert.__name__ + " method called from: "+request.remote_addr)
+    logging.debug("%s method called from: %s", new_gps_tag_alert.__name__, request.remote_addr)
 
     response = put_observation(LOCALIZATION, request.json)
     return response
@@ -109,7 +106,7 @@ def new_gps_tag_localization() -> Response:
 
 @flask_instance.route(URI_GPS_TAG_ALERT, methods=["PUT"])
 def new_gps_tag_alert() -> Response:
-    logging.debug(new_gps_tag_alert.__name__ + " method called from: "+request.remote_addr)
+    logging.debug("%s method called from: %s", new_gps_tag_alert.__name__, request.remote_addr)
 
     response = put_observation(ALERT, request.json)
     return response
@@ -122,7 +119,9 @@ def put_observation(observed_property: str, payload: dict) -> Response:
         return make_response(jsonify({ERROR_RETURN_STRING: INTERNAL_SERVER_ERROR}), 500)
 
     gps_tag_id = payload[TAG_ID_KEY]
-    result = scral_module.ogc_observation_registration(observed_property, payload)
+    # OBSERVATIONs of the same device are published in order, the ones of different devices in parallel
+    result = scral_module.execute_ordered(gps_tag_id, scral_module.ogc_observation_registration,
+                                          observed_property, payload)
     if result is True:
         return make_response(jsonify({SUCCESS_RETURN_STRING: "Ok"}), 201)
     elif result is None:
@@ -138,7 +137,7 @@ def get_active_devices() -> Response:
     """ This endpoint gives access to the resource catalog.
     :return: A JSON containing thr resource catalog.
     """
-    logging.debug(get_active_devices.__name__ + " method called from: "+request.remote_addr)
+    logging.debug("%s method called from: %s", get_active_devices.__name__, request.remote_addr)
 
     to_ret = jsonify(scral_module.get_active_devices())
     return make_response(to_ret, 200)
@@ -147,7 +146,7 @@ def get_active_devices() -> Response:
 @flask_instance.route(URI_DEFAULT)
 def test_module() -> str:
     """ Checking if SCRAL is running. """
-    logging.debug(test_module.__name__ + " method called from: "+request.remote_addr)
+    logging.debug("%s method called from: %s", test_module.__name__, request.remote_addr)
 
     link = DOC[ENDPOINT_URL_KEY] + ":" + str(DOC[ENDPOINT_PORT_KEY])
     deletes = posts = (URI_GPS_TAG_REGISTRATION,)
@@ -162,5 +161,6 @@ if __name__ == '__main__':
     sys.stdout.flush()
 
     signal.signal(signal.SIGINT, util.signal_handler)
+    signal.signal(signal.SIGTERM, util.signal_handler)
     main()
     print(END_MESSAGE)
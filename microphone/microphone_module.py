@@ -11,13 +11,10 @@
 #                                                                           #
 #############################################################################
 import logging
-from threading import Lock
-
-import arrow
-import json
 
 from scral_ogc import OGCObservation, OGCObservedProperty, OGCDatastream
 
+from scral_core import clock
 from scral_core.ogc_configuration import OGCConfiguration
 from scral_core.constants import CATALOG_FILENAME, COORD
 from scral_core.rest_module import SCRALRestModule
@@ -26,12 +23,16 @@ from microphone.constants import NAME_KEY, SEQUENCES_KEY
 
 
 class SCRALMicrophone(SCRALRestModule):
-    """ Resource manager for integration of Phonometers. """
+    """ Resource manager for integration of Phonometers.
+        Each microphone is polled by its own thread: OBSERVATIONs are handed to the publishing pipeline
+        (enabled by default) and counted without a global lock, so threads do not serialize on publishing.
+    """
+
+    _default_publish_pipeline = True
 
     def __init__(self, ogc_config: OGCConfiguration, config_filename: str, catalog_name: str = CATALOG_FILENAME):
         super().__init__(ogc_config, config_filename, catalog_name)
         self._active_microphones = {}
-        self._publish_mutex = Lock()
 
     def _start_thread_pool(self, microphone_thread, locking: bool = False):
         """ This method starts a thread for each active microphone (Sound Level Meter).
@@ -62,9 +63,24 @@ class SCRALMicrophone(SCRALRestModule):
                     thread.join()
                 logging.error("All threads have been interrupted!")
 
+    def _build_catalog_entry(self, device_id: str, device_coordinates: COORD, device_description: str) -> dict:
+        """ Register a DATASTREAM for each OBSERVED PROPERTY of a microphone.
+
+        :return: The resource catalog entry of the microphone.
+        """
+        entry = {}
+        for ogc_property in self._ogc_config.get_observed_properties():
+            property_name = ogc_property.get_name()
+            if property_name not in entry:
+                datastream_id = self._new_datastream(ogc_property, device_id, device_coordinates, device_description)
+                entry[property_name] = datastream_id
+                logging.debug("Added Datastream: " + str(datastream_id) + " to the resource catalog for device: "
+                              + device_id + " and property: " + property_name)
+        return entry
+
     def _new_datastream(self, ogc_property: OGCObservedProperty, device_id: str,
                         device_coordinates: COORD, device_description: str):
-        """ This method creates a new DATASTREAM.
+        """ This method creates a new DATASTREAM (it is not stored in the resource catalog).
 
         :param ogc_property: The OBSERVED PROPERTY.
         :param device_id: The physical device ID.
@@ -95,12 +111,6 @@ class SCRALMicrophone(SCRALRestModule):
         datastream.set_id(datastream_id)
         self._ogc_config.add_datastream(datastream)
 
-        # Store device/property information in local resource catalog
-        if property_name not in self._resource_catalog[device_id].keys():
-            self._resource_catalog[device_id][property_name] = datastream_id
-            logging.debug("Added Datastream: " + str(datastream_id) + " to the resource catalog for device: "
-                          + device_id + " and property: " + property_name)
-
         return datastream_id
 
     def ogc_observation_registration(self, datastream_id: int, phenomenon_time: str, observation_result):
@@ -111,19 +121,11 @@ class SCRALMicrophone(SCRALRestModule):
         :param observation_result: The value of the OBSERVATION.
         :return: True if the message was send, False otherwise.
         """
-        # Preparing MQTT topic
-        topic = self._topic_prefix + "Datastreams(" + str(datastream_id) + ")/Observations"
-
         # Preparing Payload
-        observation = OGCObservation(datastream_id, phenomenon_time, observation_result, str(arrow.utcnow()))
-
-        to_ret = False
-        # Publishing
-        self._publish_mutex.acquire()
-        try:
-            to_ret = self.mqtt_publish(topic, json.dumps(observation.get_rest_payload()), to_print=True)
-            self._update_active_devices_counter()
-        finally:
-            self._publish_mutex.release()
+        observation = OGCObservation(datastream_id, phenomenon_time, observation_result, clock.utc_now_iso())
+
+        # Publishing (thread-safe: no lock is needed among microphone threads)
+        to_ret = self.ogc_observation_publish(observation, to_print=True)
+        self._update_active_devices_counter()
 
         return to_ret
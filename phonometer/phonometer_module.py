@@ -12,12 +12,10 @@
 #############################################################################
 import time
 
-import arrow
 import logging
-from threading import Thread, Lock
+from threading import Thread
 
 import requests
-from datetime import timedelta
 
 from flask import Flask
 from urllib3.exceptions import NewConnectionError, MaxRetryError
@@ -26,7 +24,7 @@ from scral_ogc import OGCDatastream, OGCObservedProperty
 
 from scral_core.constants import REST_HEADERS, CATALOG_FILENAME, COORD, LATITUDE_KEY, LONGITUDE_KEY, \
     START_DATASTREAMS_REGISTRATION, END_DATASTREAMS_REGISTRATION, START_OBSERVATION_REGISTRATION, ENABLE_CHERRYPY
-from scral_core import util
+from scral_core import clock, util
 from scral_core.ogc_configuration import OGCConfiguration
 
 from microphone.microphone_module import SCRALMicrophone
@@ -47,7 +45,6 @@ class SCRALPhonometer(SCRALMicrophone):
         :param config_filename: A file containing connection information.
         """
         super().__init__(ogc_config, config_filename, catalog_name)
-        self._publish_mutex = Lock()
 
     def runtime(self, flask_instance: Flask, mode: int = ENABLE_CHERRYPY):
         """ This method discovers active Phonometers from SDN cloud, registers them as OGC Datastreams into the MONICA
@@ -104,16 +101,13 @@ class SCRALPhonometer(SCRALMicrophone):
                     device_description = phono[DESCRIPTION_KEY]
 
                     # Check whether device has been already registered
-                    if device_id in self._resource_catalog:
+                    entry, created = self._resource_catalog.register_if_absent(
+                        device_id, lambda: self._build_catalog_entry(device_id, device_coordinates,
+                                                                     device_description))
+                    if not created:
                         logging.debug("Device: " + device_name + " already registered with id: " + device_id)
                     else:
-                        self._resource_catalog[device_id] = {}
                         self._active_microphones[device_id] = {}
-                        # Iterate over ObservedProperties
-                        for ogc_property in self._ogc_config.get_observed_properties():
-                            self._new_datastream(
-                                ogc_property, device_id, device_coordinates, device_description)
-
                         url_sequence = URL_CLOUD + '/' + device_id + '/' + FILTER_SDN_1
                         self._active_microphones[device_id][SEQUENCES_KEY] = url_sequence
                         self._active_microphones[device_id][NAME_KEY] = device_name
@@ -157,9 +151,9 @@ class SCRALPhonometer(SCRALMicrophone):
             self._logger.info(START_OBSERVATION_REGISTRATION)
             while True:
                 try:
-                    now = arrow.utcnow()
+                    now = clock.utc_now()
                     # change parameters of "from_utc_to_query" is milliseconds are required
-                    query_ts_start = util.from_utc_to_query(now - timedelta(seconds=UPDATE_INTERVAL), True, False)
+                    query_ts_start = util.from_utc_to_query(now - UPDATE_INTERVAL, True, False)
                     query_ts_end = util.from_utc_to_query(now, True, False)
 
                     time_token = query_ts_start + FILTER_SDN_2 + query_ts_end + FILTER_SDN_3
@@ -190,31 +184,36 @@ class SCRALPhonometer(SCRALMicrophone):
 
                             data_spectra.append(spectra)
 
-                        # Registering LAEq value in GOST
-                        datastream_id = rc[self._device_id][LAEQ_KEY]
-                        phenomenon_time = query_ts_start[:-1]+".000Z"
-                        response = {"value": [{
-                            "values": data_laeq,
-                            "startTime": phenomenon_time,
-                            "endTime": query_ts_end[:-1]+".000Z"
-                        }]}
-
-                        observation_result = {VALUE_TYPE_KEY: LAEQ_KEY, RESPONSE_KEY: response}
-                        self._phonometer_module.ogc_observation_registration(
-                            datastream_id, phenomenon_time, observation_result)
-
-                        # Registering spectra value in GOST (CBPLZeq)
-                        datastream_id = rc[self._device_id][SPECTRA_KEY]
-                        phenomenon_time = query_ts_start[:-1]+".000Z"
-                        response = {"value": [{
-                            "values": data_spectra,
-                            "startTime": phenomenon_time,
-                            "endTime": query_ts_end[:-1]+".000Z"
-                        }]}
-
-                        observation_result = {VALUE_TYPE_KEY: SPECTRA_KEY, RESPONSE_KEY: response}
-                        self._phonometer_module.ogc_observation_registration(
-                            datastream_id, phenomenon_time, observation_result)
+                        if not self._phonometer_module.begin_activity():
+                            break  # the module is shutting down
+                        try:
+                            # Registering LAEq value in GOST
+                            datastream_id = rc[self._device_id][LAEQ_KEY]
+                            phenomenon_time = query_ts_start[:-1]+".000Z"
+                            response = {"value": [{
+                                "values": data_laeq,
+                                "startTime": phenomenon_time,
+                                "endTime": query_ts_end[:-1]+".000Z"
+                            }]}
+
+                            observation_result = {VALUE_TYPE_KEY: LAEQ_KEY, RESPONSE_KEY: response}
+                            self._phonometer_module.ogc_observation_registration(
+                                datastream_id, phenomenon_time, observation_result)
+
+                            # Registering spectra value in GOST (CBPLZeq)
+                            datastream_id = rc[self._device_id][SPECTRA_KEY]
+                            phenomenon_time = query_ts_start[:-1]+".000Z"
+                            response = {"value": [{
+                                "values": data_spectra,
+                                "startTime": phenomenon_time,
+                                "endTime": query_ts_end[:-1]+".000Z"
+                            }]}
+
+                            observation_result = {VALUE_TYPE_KEY: SPECTRA_KEY, RESPONSE_KEY: response}
+                            self._phonometer_module.ogc_observation_registration(
+                                datastream_id, phenomenon_time, observation_result)
+                        finally:
+                            self._phonometer_module.end_activity()
                     else:
                         self._logger.error("Empty Payload!")
 
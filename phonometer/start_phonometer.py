@@ -57,7 +57,7 @@ def get_active_devices() -> Response:
     """ This endpoint gives access to the resource catalog.
     :return: A JSON containing thr resource catalog.
     """
-    logging.debug(get_active_devices.__name__ + " method called from: "+request.remote_addr)
+    logging.debug("%s method called from: %s", get_active_devices.__name__, request.remote_addr)
     return make_response(jsonify(scral_module.get_active_devices()), 200)
 
 
@@ -66,7 +66,7 @@ def test_module() -> str:
     """ Checking if SCRAL is running.
         :return: A str containing some information about possible endpoints.
     """
-    logging.debug(test_module.__name__ + " method called from: "+request.remote_addr)
+    logging.debug("%s method called from: %s", test_module.__name__, request.remote_addr)
 
     link = DOC[ENDPOINT_URL_KEY]+":"+str(DOC[ENDPOINT_PORT_KEY])
     gets = (URI_ACTIVE_DEVICES, )
@@ -79,5 +79,6 @@ if __name__ == '__main__':
     sys.stdout.flush()
 
     signal.signal(signal.SIGINT, util.signal_handler)
+    signal.signal(signal.SIGTERM, util.signal_handler)
     main()
     print(END_MESSAGE)
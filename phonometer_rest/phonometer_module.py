@@ -11,11 +11,11 @@
 #                                                                           #
 #############################################################################
 import json
-import arrow
 import logging
 
 from flask import make_response, jsonify
 
+from scral_core import clock
 from scral_core.constants import SUCCESS_RETURN_STRING, OGC_OBSERVED_AREA_KEY, \
     ERROR_RETURN_STRING, WRONG_REQUEST, DUPLICATE_REQUEST
 from microphone.constants import NAME_KEY
@@ -41,18 +41,14 @@ class SCRALPhonometerREST(SCRALMicrophone):
             logging.error("Missing key: "+str(ke))
             return make_response(jsonify({ERROR_RETURN_STRING: WRONG_REQUEST}), 400)
 
-        # Check whether device has been already registered
-        if device_name in self._resource_catalog:
+        # Check whether device has been already registered (concurrent requests register it only once)
+        entry, created = self._resource_catalog.register_if_absent(
+            device_name, lambda: self._build_catalog_entry(device_name, device_coordinates, device_description))
+        if not created:
             logging.debug("Device: " + device_name + " already registered with id: " + device_name)
             return make_response(jsonify({ERROR_RETURN_STRING: DUPLICATE_REQUEST}), 409)
 
-        self._resource_catalog[device_name] = {}
-        # Iterate over ObservedProperties
-        for ogc_property in self._ogc_config.get_observed_properties():
-            self._new_datastream(
-                ogc_property, device_name, device_coordinates, device_description)
-
-        self.update_file_catalog()
+        self.update_file_catalog(device_name)
         return make_response(jsonify({SUCCESS_RETURN_STRING: "Ok"}), 201)
 
     def observation_registration(self, raw_payload: json):
@@ -85,8 +81,8 @@ class SCRALPhonometerREST(SCRALMicrophone):
 
                         for s in samples:
                             try:
-                                sample_start_time = arrow.get(s[SAMPLE_START_TIME_KEY])
-                                sample_end_time = arrow.get(s[SAMPLE_END_TIME_KEY])
+                                sample_start_time = clock.format_iso(clock.parse_iso(s[SAMPLE_START_TIME_KEY]))
+                                sample_end_time = clock.format_iso(clock.parse_iso(s[SAMPLE_END_TIME_KEY]))
                                 sample_value = s[SAMPLE_VALUE_KEY]
 
                                 # In this moment there are no difference in sample managements
@@ -100,13 +96,13 @@ class SCRALPhonometerREST(SCRALMicrophone):
 
                                 response = {"value": [{
                                     "values": [sample_value],
-                                    "startTime": str(sample_start_time),
-                                    "endTime": str(sample_end_time)
+                                    "startTime": sample_start_time,
+                                    "endTime": sample_end_time
                                 }]}
                                 observation_result = {VALUE_TYPE_KEY: LAEQ_KEY, RESPONSE_KEY: response}
 
                                 self.ogc_observation_registration(
-                                    datastream_id, str(sample_start_time), observation_result)
+                                    datastream_id, sample_start_time, observation_result)
                                 successfully_processed = successfully_processed + 1
                             except KeyError as ke:
                                 logging.error("Missing key: " + str(ke))
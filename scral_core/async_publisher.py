@@ -0,0 +1,267 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#############################################################################
+#      _____ __________  ___    __                                          #
+#     / ___// ____/ __ \/   |  / /                                          #
+#     \__ \/ /   / /_/ / /| | / /                                           #
+#    ___/ / /___/ _, _/ ___ |/ /___                                         #
+#   /____/\____/_/ |_/_/  |_/_____/   Smart City Resource Adaptation Layer  #
+#                                                                           #
+# LINKS Foundation, (c) 2017-2020                                           #
+# developed by Jacopo Foglietti & Luca Mannella                             #
+# SCRAL is distributed under a BSD-style license -- See file LICENSE.md     #
+#                                                                           #
+#############################################################################
+"""
+    SCRAL - async_publisher
+    This file contains a publisher backend running on an asyncio event loop with an asyncio MQTT client (aiomqtt).
+    The event loop runs in a dedicated thread, the other threads submit messages through a thread-safe API.
+    aiomqtt is an optional dependency, it is imported only when this backend is selected.
+"""
+
+import asyncio
+import importlib
+import logging
+import time
+from threading import Thread, Lock, Condition
+from typing import Optional
+
+import paho.mqtt.client as mqtt
+from paho.mqtt.packettypes import PacketTypes
+from paho.mqtt.properties import Properties
+
+from scral_core.constants import DEFAULT_KEEPALIVE, DEFAULT_MAX_INFLIGHT_MESSAGES, DEFAULT_MAX_QUEUED_MESSAGES, \
+    ASYNC_MQTT_LIBRARY, MQTT_V311, MQTT_V5, NETWORK_LOOP_TIMEOUT, DEFAULT_SESSION_EXPIRY, ASYNC_PUBLISH_MAX_ATTEMPTS
+from scral_core.mqtt_publisher import PublisherBackend
+from scral_core.mqtt_util import ConnectionStats, backoff_delay
+
+
+class AsyncMQTTPublisher(PublisherBackend):
+    """ An asyncio MQTT client with a bounded in-flight window. """
+
+    def __init__(self, client_id: str, broker_address: str, broker_port: int, keepalive: int = DEFAULT_KEEPALIVE,
+                 max_inflight_messages: int = DEFAULT_MAX_INFLIGHT_MESSAGES,
+                 max_queued_messages: int = DEFAULT_MAX_QUEUED_MESSAGES, protocol_version: int = MQTT_V311,
+                 persistent_session: bool = False, session_expiry: int = DEFAULT_SESSION_EXPIRY):
+        """ Prepare the event loop, the connection is established only calling "connect".
+
+        :param client_id: The MQTT client id.
+        :param broker_address: The address of the MQTT broker.
+        :param broker_port: The port of the MQTT broker.
+        :param keepalive: The keepalive (in seconds) of the MQTT connection.
+        :param max_inflight_messages: How many messages can be published concurrently.
+        :param max_queued_messages: How many messages can be waiting to be published (in-flight included),
+                                    0 means unlimited.
+        :param protocol_version: The MQTT version (3 for MQTT v3.1.1 or 5 for MQTT v5).
+        :param persistent_session: If True the broker keeps the session (clean session/clean start disabled).
+        :param session_expiry: Used only with MQTT v5 and persistent session, how many seconds the broker keeps
+                               the session after a disconnection.
+        :raise ImportError: If the asyncio MQTT library is not installed.
+        """
+        self._aiomqtt = importlib.import_module(ASYNC_MQTT_LIBRARY)
+
+        self._client_id = client_id
+        self._broker_address = broker_address
+        self._broker_port = broker_port
+        self._keepalive = keepalive
+        self._max_inflight_messages = max(1, max_inflight_messages)
+        self._max_queued_messages = max_queued_messages
+        self._protocol_version = protocol_version
+        self._persistent_session = persistent_session
+        self._session_expiry = session_expiry
+
+        self._loop = asyncio.new_event_loop()
+        self._loop_thread = Thread(target=self._loop.run_forever, name=client_id + "-loop", daemon=True)
+        self._client = None
+        self._connected = None  # asyncio.Event created inside the event loop
+        self._inflight = None  # asyncio.Semaphore created inside the event loop
+        self._connection_stats = ConnectionStats()
+
+        self._pending_mutex = Lock()
+        self._room_available = Condition(self._pending_mutex)
+        self._pending = 0  # messages submitted and not yet completed
+        self._mid = 0
+        self._run_task = None  # asyncio.Task keeping the connection alive
+
+    def connect(self):
+        logging.info("Try to connect to broker: %s:%s for PUBLISHING (asyncio)..."
+                     % (self._broker_address, self._broker_port))
+        logging.debug("MQTT Client ID is: " + self._client_id)
+        self._loop_thread.start()
+        asyncio.run_coroutine_threadsafe(self._setup(), self._loop).result()
+
+    def disconnect(self, timeout: Optional[float] = None) -> int:
+        """ Wait (at most "timeout" seconds) for the pending messages to be published, then close the connection
+            and stop the event loop.
+
+        :return: The number of messages not published.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._room_available:
+            while self._pending and self.is_connected():
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    break
+                self._room_available.wait(NETWORK_LOOP_TIMEOUT if remaining is None
+                                          else min(remaining, NETWORK_LOOP_TIMEOUT))
+            undelivered = self._pending
+
+        if self._loop_thread.is_alive():
+            try:
+                asyncio.run_coroutine_threadsafe(self._stop(), self._loop).result(timeout)
+            except Exception as ex:
+                logging.error("Error closing the MQTT connection: {0}".format(ex))
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._loop_thread.join(timeout)
+        logging.info('MQTT publisher "' + self._client_id + '" disconnected, ' + str(undelivered) +
+                     " message(s) not published.")
+        return undelivered
+
+    async def _setup(self):
+        self._connected = asyncio.Event()
+        self._inflight = asyncio.Semaphore(self._max_inflight_messages)
+        self._run_task = asyncio.get_running_loop().create_task(self._run())
+
+    async def _stop(self):
+        """ Cancel the connection task: leaving the client context manager sends the DISCONNECT packet. """
+        self._run_task.cancel()
+        try:
+            await self._run_task
+        except asyncio.CancelledError:
+            pass
+
+    async def _run(self):
+        """ Keep the connection alive, reconnecting (with exponential backoff) when it is lost. """
+        attempt = 0
+        session_options = {}
+        if self._protocol_version == MQTT_V5:
+            protocol = self._aiomqtt.ProtocolVersion.V5
+            if self._persistent_session:
+                properties = Properties(PacketTypes.CONNECT)
+                properties.SessionExpiryInterval = self._session_expiry
+                session_options = {"clean_start": False, "properties": properties}
+        else:
+            protocol = self._aiomqtt.ProtocolVersion.V311
+            session_options = {"clean_session": not self._persistent_session}
+        while True:
+            try:
+                async with self._aiomqtt.Client(self._broker_address, self._broker_port, keepalive=self._keepalive,
+                                                identifier=self._client_id, protocol=protocol,
+                                                **session_options) as client:
+                    self._client = client
+                    self._connected.set()
+                    self._connection_stats.connected()
+                    attempt = 0
+                    logging.info("Connection with MQTT broker: '" + self._broker_address +
+                                 "' successfully established!")
+                    # no subscriptions: the iteration only ends (raising MqttError) when the connection is lost
+                    async for _ in client.messages:
+                        pass
+            except self._aiomqtt.MqttError as ex:
+                logging.error("MQTT connection error: " + str(ex))
+                if not self._connected.is_set():
+                    self._connection_stats.failed_attempt()
+            finally:
+                self._connected.clear()
+                self._connection_stats.disconnected()
+                self._client = None
+
+            delay = backoff_delay(attempt)
+            attempt += 1
+            logging.error("Broker connection lost! Try to re-connecting to '" + self._broker_address +
+                          "' in %.1f seconds..." % delay)
+            await asyncio.sleep(delay)
+
+    async def _publish(self, topic: str, payload, qos: int, content_type: Optional[str]):
+        """ Publish a message, QoS>0 messages are published again (at most ASYNC_PUBLISH_MAX_ATTEMPTS times)
+            only if the connection was lost during the publication.
+        """
+        properties = None
+        if content_type and self._protocol_version == MQTT_V5:
+            properties = Properties(PacketTypes.PUBLISH)
+            properties.ContentType = content_type
+        try:
+            async with self._inflight:
+                attempts = 0
+                while True:
+                    await self._connected.wait()
+                    client = self._client
+                    if client is None:  # the connection was lost meanwhile, wait for the next one
+                        continue
+                    try:
+                        await client.publish(topic, payload, qos=qos, properties=properties)
+                        break
+                    except self._aiomqtt.MqttError as ex:
+                        attempts += 1
+                        logging.error("Something wrong during MQTT publish: " + str(ex))
+                        lost = self._client is not client or not self._connected.is_set() \
+                            or getattr(ex, "rc", None) in (mqtt.MQTT_ERR_NO_CONN, mqtt.MQTT_ERR_CONN_LOST)
+                        if qos == 0 or not lost or attempts >= ASYNC_PUBLISH_MAX_ATTEMPTS:
+                            logging.error('Message on topic "' + topic + '" discarded after ' + str(attempts) +
+                                          " attempt(s).")
+                            break
+                        # the connection was lost during the publication: retry after the reconnection, with a
+                        # backoff in case the connection task has not noticed the disconnection yet
+                        await asyncio.sleep(backoff_delay(attempts - 1))
+        finally:
+            with self._room_available:
+                self._pending -= 1
+                self._room_available.notify()
+
+    def publish(self, topic: str, payload, qos: int, block: bool = False, timeout: Optional[float] = None,
+                content_type: Optional[str] = None) -> mqtt.MQTTMessageInfo:
+        """ Enqueue a message on the event loop, this method is thread-safe.
+
+        :param topic: The MQTT topic on which the client will publish the message.
+        :param payload: Data to send.
+        :param qos: The desired quality of service.
+        :param block: If True and the client is saturated, wait (at most "timeout" seconds) for room to be available.
+        :param timeout: Used only if block is True, None means forever.
+        :param content_type: [OPT] The format of the payload, sent as "Content Type" property (MQTT v5).
+        :return: An MQTTMessageInfo, its rc is MQTT_ERR_QUEUE_SIZE if the client is saturated.
+        """
+        with self._room_available:
+            if self._max_queued_messages > 0 and self._pending >= self._max_queued_messages:
+                deadline = None if timeout is None else time.monotonic() + timeout
+                while block and self._pending >= self._max_queued_messages:
+                    remaining = None if deadline is None else deadline - time.monotonic()
+                    if remaining is not None and remaining <= 0:
+                        break
+                    self._room_available.wait(remaining)
+                if self._pending >= self._max_queued_messages:
+                    info = mqtt.MQTTMessageInfo(0)
+                    info.rc = mqtt.MQTT_ERR_QUEUE_SIZE
+                    return info
+
+            self._mid += 1
+            info = mqtt.MQTTMessageInfo(self._mid)
+            # the same behaviour of Paho: without connection QoS 0 messages are discarded, the others wait for it
+            if qos == 0 and not self.is_connected():
+                info.rc = mqtt.MQTT_ERR_NO_CONN
+                return info
+            self._pending += 1
+
+        asyncio.run_coroutine_threadsafe(self._publish(topic, payload, qos, content_type), self._loop)
+        return info
+
+    def is_saturated(self) -> bool:
+        """ True if the client cannot accept new messages without exceeding its queue limit. """
+        return 0 < self._max_queued_messages <= self._pending
+
+    def is_connected(self) -> bool:
+        return self._connected is not None and self._connected.is_set()
+
+    def get_pending_messages(self) -> int:
+        return self._pending
+
+    def get_client_id(self) -> str:
+        return self._client_id
+
+    def get_connection_stats(self) -> Optional[dict]:
+        return self._connection_stats.get_stats()
+
+    def get_max_inflight_messages(self) -> int:
+        return self._max_inflight_messages
+
+    def get_max_queued_messages(self) -> int:
+        return self._max_queued_messages
@@ -0,0 +1,177 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#############################################################################
+#      _____ __________  ___    __                                          #
+#     / ___// ____/ __ \/   |  / /                                          #
+#     \__ \/ /   / /_/ / /| | / /                                           #
+#    ___/ / /___/ _, _/ ___ |/ /___                                         #
+#   /____/\____/_/ |_/_/  |_/_____/   Smart City Resource Adaptation Layer  #
+#                                                                           #
+# LINKS Foundation, (c) 2017-2020                                           #
+# developed by Jacopo Foglietti & Luca Mannella                             #
+# SCRAL is distributed under a BSD-style license -- See file LICENSE.md     #
+#                                                                           #
+#############################################################################
+"""
+    SCRAL - catalog_store
+    This file contains the persistence of the resource catalog of a SCRALModule.
+    The catalog file is a snapshot (the usual JSON object), while each registration or deletion of a device is only
+    appended to a journal (one JSON record for each line). When the journal grows, a new snapshot is written in a
+    temporary file and atomically renamed, then the journal is truncated: a crash never leaves a truncated catalog.
+    At startup the snapshot is loaded and the journal is replayed on it.
+"""
+
+import json
+import logging
+import os
+from threading import Lock
+from typing import Iterable, Optional
+
+from scral_core.constants import CATALOG_JOURNAL_SUFFIX, CATALOG_COMPACTION_THRESHOLD
+
+PUT_KEY = "put"
+DELETE_KEY = "delete"
+VALUE_KEY = "value"
+
+
+class JournaledCatalogStore(object):
+    """ A snapshot file of the resource catalog and an append-only journal of the changes applied after it. """
+
+    def __init__(self, path: str, compaction_threshold: int = CATALOG_COMPACTION_THRESHOLD, fsync: bool = False):
+        """
+        :param path: The snapshot file (the journal has the same name with ".journal" suffix).
+        :param compaction_threshold: The number of journal records that triggers a new snapshot.
+        :param fsync: If True each journal record is forced on disk (snapshots are always forced on disk).
+        """
+        self._path = path
+        self._journal_path = path + CATALOG_JOURNAL_SUFFIX
+        self._compaction_threshold = max(1, compaction_threshold)
+        self._fsync = fsync
+        self._mutex = Lock()
+        self._journal = None
+        self._records = 0  # records in the journal
+        folder = os.path.dirname(path)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+
+    def exists(self) -> bool:
+        return os.path.exists(self._path) or os.path.exists(self._journal_path)
+
+    def load(self) -> dict:
+        """ Read the snapshot and replay the journal on it.
+            A truncated last record (e.g. a crash while appending) is discarded.
+
+        :return: The resource catalog.
+        """
+        catalog = {}
+        if os.path.exists(self._path):
+            with open(self._path) as snapshot:
+                catalog = json.load(snapshot)
+
+        records = 0
+        if os.path.exists(self._journal_path):
+            with open(self._journal_path, "rb+") as journal:
+                valid_size = 0  # bytes of the complete records
+                for line_number, line in enumerate(journal, 1):
+                    try:
+                        record = json.loads(line.decode("utf-8")) if line.endswith(b"\n") else None
+                    except ValueError:
+                        record = None
+                    if record is None:
+                        if line.strip():
+                            logging.warning("Catalog journal <" + self._journal_path + "> truncated at line " +
+                                            str(line_number) + ", the following changes are discarded.")
+                            # the next records must not be appended to the partial one
+                            journal.truncate(valid_size)
+                        break
+                    valid_size += len(line)
+                    if PUT_KEY in record:
+                        catalog[record[PUT_KEY]] = record[VALUE_KEY]
+                    elif DELETE_KEY in record:
+                        catalog.pop(record[DELETE_KEY], None)
+                    records += 1
+            logging.debug(str(records) + " change(s) replayed from catalog journal <" + self._journal_path + ">.")
+        with self._mutex:
+            self._records = records
+        return catalog
+
+    def put(self, key: str, value):
+        """ Record the (new) value of a catalog entry. """
+        self._append({PUT_KEY: key, VALUE_KEY: value})
+
+    def delete(self, key: str):
+        """ Record the removal of a catalog entry. """
+        self._append({DELETE_KEY: key})
+
+    def _append(self, record: dict):
+        line = json.dumps(record, separators=(",", ":")) + "\n"
+        with self._mutex:
+            if self._journal is None:
+                self._journal = open(self._journal_path, "a")
+            self._journal.write(line)
+            self._journal.flush()
+            if self._fsync:
+                os.fsync(self._journal.fileno())
+            self._records += 1
+
+    def save(self, catalog: dict, keys: Optional[Iterable[str]] = None):
+        """ Record the current entries of some devices (or their removal), writing a new snapshot if the journal
+            is long enough.
+
+        :param catalog: The current resource catalog.
+        :param keys: [OPT] The changed entries, if not specified a snapshot of the whole catalog is written.
+        """
+        if keys is not None:
+            for key in keys:
+                entry = catalog.get(key)
+                if entry is None:
+                    self.delete(key)
+                else:
+                    self.put(key, dict(entry) if isinstance(entry, dict) else entry)
+            if not self.needs_compaction():
+                return
+        self.compact(catalog)
+
+    def needs_compaction(self) -> bool:
+        return self._records >= self._compaction_threshold
+
+    def compact(self, catalog: dict):
+        """ Write a new snapshot of the whole catalog and truncate the journal.
+
+        :param catalog: The current resource catalog.
+        """
+        tmp_path = self._path + ".tmp"
+        with self._mutex:
+            # copied holding the mutex: a change recorded before is in the copy, a change recorded after is journaled
+            entries = {key: dict(value) if isinstance(value, dict) else value for key, value in list(catalog.items())}
+            with open(tmp_path, "w") as snapshot:
+                for chunk in json.JSONEncoder().iterencode(entries):
+                    snapshot.write(chunk)
+                snapshot.flush()
+                os.fsync(snapshot.fileno())
+            os.replace(tmp_path, self._path)  # atomic: the previous snapshot is valid until now
+
+            # the journal is truncated only when the snapshot is in place (replaying it again would be harmless)
+            if self._journal is not None:
+                self._journal.close()
+                self._journal = None
+            if os.path.exists(self._journal_path):
+                os.remove(self._journal_path)
+            self._records = 0
+
+    def close(self):
+        with self._mutex:
+            if self._journal is not None:
+                self._journal.close()
+                self._journal = None
+
+    def get_path(self) -> str:
+        return self._path
+
+    def get_journal_path(self) -> str:
+        return self._journal_path
+
+    def get_records(self) -> int:
+        """ The number of changes in the journal (not yet in the snapshot). """
+        return self._records
+
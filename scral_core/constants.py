@@ -22,6 +22,17 @@ from typing import Optional, Union, List, Tuple
 
 CATALOG_FILENAME = "resource_catalog.json"
 CATALOG_FOLDER = "catalogs/"
+CATALOG_JOURNAL_SUFFIX = ".journal"  # changes appended after the last snapshot (the catalog file)
+CATALOG_COMPACTION_THRESHOLD = 1000  # journal records that trigger a new snapshot
+CATALOG_SQLITE_SUFFIX = ".sqlite"  # extension of the catalog database (it replaces the one of the catalog file)
+CATALOG_BACKEND_KEY = "catalog_backend"
+CATALOG_BACKEND_JSON = "json"
+CATALOG_BACKEND_SQLITE = "sqlite"
+DEFAULT_CATALOG_BACKEND = CATALOG_BACKEND_JSON
+CATALOG_REGISTRATION_LOCKS = 64  # locks serializing concurrent registrations (a device always uses the same one)
+CATALOG_CACHE_SIZE_KEY = "catalog_cache_size"  # SQLite backend: entries kept in memory (the most recently used)
+DEFAULT_CATALOG_CACHE_SIZE = 1000
+CATALOG_PAGE_SIZE = 500  # SQLite backend: entries read at a time when the whole catalog is listed
 
 # HTTP STRINGS
 REST_HEADERS = {'Content-Type': 'application/json'}
@@ -43,6 +54,9 @@ INVALID_DATASTREAM = "Invalid DATASTREAM"
 NO_DATASTREAM_ID = "Missing DATASTREAM ID"
 DEVICE_NOT_REGISTERED = "Device not registered"
 NO_MQTT_PUBLICATION = "Impossible to publish on MQTT broker"
+PUBLISHER_SATURATED = "MQTT publisher saturated, retry later"
+EXECUTOR_SATURATED = "Too many OBSERVATIONs waiting, retry later"
+SHUTTING_DOWN = "SCRAL is shutting down"
 METHOD_NOT_ALLOWED = "HTTP method not allowed"
 
 # Username and password necessary for accessing OGC server
@@ -59,6 +73,9 @@ DEFAULT_KEEPALIVE = 60
 # 1 --> At least one message will be received by the broker
 # 2 --> Exactly 1 message is received by the broker
 DEFAULT_MQTT_QOS = 1
+RECONNECTION_MIN_DELAY = 1  # seconds, the delay doubles at each failed attempt
+RECONNECTION_MAX_DELAY = 120  # seconds
+NETWORK_LOOP_TIMEOUT = 1.0  # seconds
 
 # MQTT connector & resource manager
 MQTT_KEY = "mqtt"
@@ -69,6 +86,158 @@ MQTT_SUB_BROKER_PORT_KEY = "sub_broker_port"
 MQTT_PUB_BROKER_KEEP_KEY = "pub_broker_keepalive"
 MQTT_SUB_BROKER_KEEP_KEY = "sub_broker_keepalive"
 
+# MQTT publishing pipeline (optional fields of the "mqtt" section, upper case in custom mode)
+PUBLISH_PIPELINE_KEY = "publish_pipeline"
+PIPELINE_QUEUE_SIZE_KEY = "pipeline_queue_size"
+PIPELINE_BATCH_SIZE_KEY = "pipeline_batch_size"
+PIPELINE_LINGER_KEY = "pipeline_linger"
+PIPELINE_WORKERS_KEY = "pipeline_workers"
+DEFAULT_PIPELINE_QUEUE_SIZE = 10000
+DEFAULT_PIPELINE_BATCH_SIZE = 100
+DEFAULT_PIPELINE_LINGER = 0.05  # seconds
+DEFAULT_PIPELINE_WORKERS = 1
+LAG_METRIC_KEY = "lag_metric"
+CONFLATION_KEY = "conflation"  # { "observed_property_name": min_publishing_interval_in_seconds }
+PRIORITIES_KEY = "priorities"  # { "observed_property_name": "high" | "normal" | "low" }
+PRIORITY_HIGH = "high"
+PRIORITY_NORMAL = "normal"
+PRIORITY_LOW = "low"
+PRIORITY_LANES = (PRIORITY_HIGH, PRIORITY_NORMAL, PRIORITY_LOW)  # in draining order
+DEFAULT_PRIORITY = PRIORITY_NORMAL
+
+# Ordered parallel execution (optional fields of the "mqtt" section, upper case in custom mode)
+ORDERED_WORKERS_KEY = "ordered_workers"  # threads handling OBSERVATIONs, the ones of a device are handled in order
+ORDERED_QUEUE_SIZE_KEY = "ordered_queue_size"  # maximum tasks waiting for each thread
+DEFAULT_ORDERED_WORKERS = 0  # 0 means that OBSERVATIONs are handled by the calling thread
+DEFAULT_ORDERED_QUEUE_SIZE = 1000
+ORDERED_SUBMIT_TIMEOUT_KEY = "ordered_submit_timeout"  # seconds a REST handler waits for room in a full queue
+DEFAULT_ORDERED_SUBMIT_TIMEOUT = 5.0
+ORDERED_EXECUTOR_KEY = "ordered_executor"
+CATALOG_FLUSH_INTERVAL_KEY = "catalog_flush_interval"  # seconds between resource catalog writes, 0 writes at once
+CATALOG_FLUSH_CHANGES_KEY = "catalog_flush_changes"  # changed devices that trigger a write before the interval
+DEFAULT_CATALOG_FLUSH_INTERVAL = 1.0
+DEFAULT_CATALOG_FLUSH_CHANGES = 100
+CATALOG_FLUSHER_KEY = "catalog_flusher"
+
+# Fairness among devices (optional fields of the "mqtt" section, upper case in custom mode)
+DEVICE_QUEUE_SIZE_KEY = "device_queue_size"
+DEVICE_WEIGHTS_KEY = "device_weights"  # { "device_id": weight }
+DEVICE_RATE_LIMIT_KEY = "device_rate_limit"
+DEVICE_BURST_KEY = "device_burst"
+DEFAULT_DEVICE_QUEUE_SIZE = 0  # maximum queued messages of each device, 0 means no limit
+DEFAULT_DEVICE_RATE_LIMIT = 0.0  # messages per second of each device, 0 means no limit
+DEFAULT_DEVICE_BURST = 10  # messages
+DEVICE_DROPS_KEY = "device_drops"
+
+# MQTT publisher backpressure (optional fields of the "mqtt" section, upper case in custom mode)
+MAX_INFLIGHT_MESSAGES_KEY = "max_inflight_messages"
+MAX_QUEUED_MESSAGES_KEY = "max_queued_messages"
+OVERFLOW_POLICY_KEY = "overflow_policy"
+OVERFLOW_BLOCK_TIMEOUT_KEY = "overflow_block_timeout"
+DEFAULT_MAX_INFLIGHT_MESSAGES = 20  # the same of Paho
+DEFAULT_MAX_QUEUED_MESSAGES = 10000  # in-flight messages included, 0 means unlimited
+OVERFLOW_BLOCK = "block"
+OVERFLOW_DROP_OLDEST = "drop_oldest"
+OVERFLOW_REJECT = "reject"
+OVERFLOW_POLICIES = (OVERFLOW_BLOCK, OVERFLOW_DROP_OLDEST, OVERFLOW_REJECT)
+DEFAULT_OVERFLOW_POLICY = OVERFLOW_REJECT
+DEFAULT_OVERFLOW_BLOCK_TIMEOUT = 1.0  # seconds
+SATURATION_RETRY_AFTER = 5  # seconds suggested to REST clients when the publisher is saturated
+
+# Dead-letter queue (optional fields of the "mqtt" section, upper case in custom mode)
+DEAD_LETTER_QUEUE_SIZE_KEY = "dead_letter_queue_size"
+DEAD_LETTER_REPLAY_RATE_KEY = "dead_letter_replay_rate"
+DEFAULT_DEAD_LETTER_QUEUE_SIZE = 10000  # messages, 0 means disabled
+DEFAULT_DEAD_LETTER_REPLAY_RATE = 50  # messages per second
+DEAD_LETTERS_KEY = "dead_letters"
+URI_DEAD_LETTERS = "/scral/v1.0/dead-letters"
+URI_DEAD_LETTERS_COUNT = URI_DEAD_LETTERS + "/count"
+URI_DEAD_LETTERS_REPLAY = URI_DEAD_LETTERS + "/replay"
+DEAD_LETTERS_DISABLED = "Dead-letter queue not enabled"
+REPLAY_IN_PROGRESS = "A replay is already in progress"
+
+# Reverse index of the resource catalog: DATASTREAM id -> device and OBSERVED PROPERTY
+URI_DATASTREAMS = "/scral/v1.0/datastreams"
+DATASTREAM_NOT_FOUND = "DATASTREAM not found in the resource catalog"
+
+# Graceful shutdown (optional field of the "mqtt" section, upper case in custom mode): on SIGINT/SIGTERM queued
+# messages are published waiting at most "shutdown_timeout" seconds (Docker kills a container 10 s after SIGTERM)
+SHUTDOWN_TIMEOUT_KEY = "shutdown_timeout"
+DEFAULT_SHUTDOWN_TIMEOUT = 8.0  # seconds
+
+# Mirror brokers (optional field of the "mqtt" section, upper case in custom mode): a list of objects containing
+# "pub_broker_uri", optionally "pub_broker_port", "pub_broker_keepalive", "name" and any optional MQTT preference
+# overriding the one of the primary broker (e.g. "overflow_policy", "pipeline_queue_size", "publisher_connections")
+MIRRORS_KEY = "mirrors"
+MIRROR_NAME_KEY = "name"
+DEFAULT_MIRROR_OVERFLOW_POLICY = OVERFLOW_DROP_OLDEST
+
+# MQTT publishing connections (optional fields of the "mqtt" section, upper case in custom mode)
+PUBLISHER_CONNECTIONS_KEY = "publisher_connections"
+DEFAULT_PUBLISHER_CONNECTIONS = 1
+PUBLISHER_BACKEND_KEY = "publisher_backend"
+PAHO_BACKEND = "paho"
+ASYNCIO_BACKEND = "asyncio"
+DEFAULT_PUBLISHER_BACKEND = PAHO_BACKEND
+ASYNC_MQTT_LIBRARY = "aiomqtt"
+ASYNC_PUBLISH_MAX_ATTEMPTS = 5  # a QoS>0 message is discarded after failing on this number of connections
+
+# MQTT protocol version and topic aliases (optional fields of the "mqtt" section, upper case in custom mode)
+PROTOCOL_VERSION_KEY = "protocol_version"
+TOPIC_ALIAS_MAXIMUM_KEY = "topic_alias_maximum"
+MQTT_V311 = 3
+MQTT_V5 = 5
+DEFAULT_PROTOCOL_VERSION = MQTT_V311
+DEFAULT_TOPIC_ALIAS_MAXIMUM = 1000
+
+# OBSERVATION payload encoding (optional fields of the "mqtt" section, upper case in custom mode)
+PAYLOAD_ENCODING_KEY = "payload_encoding"
+PAYLOAD_COMPRESSION_KEY = "payload_compression"
+ZSTD_DICTIONARY_KEY = "zstd_dictionary"
+ZSTD_LEVEL_KEY = "zstd_level"
+CONTENT_TYPE_MARKER_KEY = "content_type_marker"
+JSON_ENCODING = "json"
+MSGPACK_ENCODING = "msgpack"
+CBOR_ENCODING = "cbor"
+ZSTD_COMPRESSION = "zstd"
+CONTENT_TYPE_PROPERTY = "property"  # MQTT v5 only
+CONTENT_TYPE_TOPIC = "topic"
+DEFAULT_PAYLOAD_ENCODING = JSON_ENCODING
+DEFAULT_CONTENT_TYPE_MARKER = CONTENT_TYPE_PROPERTY
+DEFAULT_ZSTD_LEVEL = 3
+DEFAULT_ZSTD_DICTIONARY_SIZE = 16 * 1024  # bytes
+
+# MQTT store-and-forward spool (optional fields of the "mqtt" section, upper case in custom mode)
+SPOOL_KEY = "spool"
+SPOOL_FOLDER_KEY = "spool_folder"
+SPOOL_MAX_SIZE_KEY = "spool_max_size"
+SPOOL_MAX_AGE_KEY = "spool_max_age"
+SPOOL_SEGMENT_SIZE_KEY = "spool_segment_size"
+SPOOL_FSYNC_BATCH_KEY = "spool_fsync_batch"
+SPOOL_FSYNC_INTERVAL_KEY = "spool_fsync_interval"
+SPOOL_REPLAY_RATE_KEY = "spool_replay_rate"
+SPOOL_FOLDER = "spool/"
+DEFAULT_SPOOL_MAX_SIZE = 256 * 1024 * 1024  # bytes
+DEFAULT_SPOOL_MAX_AGE = 7 * 24 * 3600  # seconds
+DEFAULT_SPOOL_SEGMENT_SIZE = 4 * 1024 * 1024  # bytes
+DEFAULT_SPOOL_FSYNC_BATCH = 100  # records
+DEFAULT_SPOOL_FSYNC_INTERVAL = 1.0  # seconds
+DEFAULT_SPOOL_REPLAY_RATE = 100  # messages per second
+
+# Persistent MQTT sessions (optional fields of the "mqtt" section, upper case in custom mode), disabled by default.
+# With a persistent session the client ID is stable: "client_id" or MQTT_CLIENT_PREFIX-<module class>-<instance name>.
+# One of them is required: two instances sharing the same ID would disconnect each other.
+PERSISTENT_SESSION_KEY = "persistent_session"
+CLIENT_ID_KEY = "client_id"
+SUB_CLIENT_ID_KEY = "sub_client_id"  # client ID of the subscribing connection (modules listening on a broker)
+INSTANCE_NAME_KEY = "instance_name"
+SESSION_EXPIRY_KEY = "session_expiry"  # MQTT v5 only
+INFLIGHT_SNAPSHOT_INTERVAL_KEY = "inflight_snapshot_interval"
+DEFAULT_PERSISTENT_SESSION = False
+DEFAULT_SESSION_EXPIRY = 24 * 3600  # seconds
+DEFAULT_INFLIGHT_SNAPSHOT_INTERVAL = 1.0  # seconds
+INFLIGHT_FILE_SUFFIX = ".inflight"
+
 # Debug, graphic and similar
 START_DATASTREAMS_REGISTRATION = "\n\n--- Start OGC DATASTREAMs registration ---\n"
 END_DATASTREAMS_REGISTRATION = "--- End of OGC DATASTREAMs registration ---\n"
@@ -94,6 +263,14 @@ FILENAME_COMMAND_FILE = "preferences.json"
 
 # log
 DEFAULT_LOG_FORMATTER = "%(asctime)s.%(msecs)04d %(name)-7s %(levelname)s: %(message)s"
+DEFAULT_LOG_DATE_FORMAT = "(%b-%d) %H:%M:%S"
+# sampling of frequent messages (optional fields of the "mqtt" section, upper case in custom mode)
+LOG_SAMPLE_EVERY_KEY = "log_sample_every"  # one message every N of each device is logged
+LOG_SAMPLE_RATE_KEY = "log_sample_rate"  # maximum messages per second of each device
+DEFAULT_LOG_SAMPLE_EVERY = 1
+DEFAULT_LOG_SAMPLE_RATE = 0.0  # 0 means no limit
+LOG_SAMPLE_BURST = 5  # messages
+LOG_SAMPLE_MAX_KEYS = 10000  # sampling counters kept in memory, all of them are reset when the limit is reached
 
 # REST ENDPOINTS & KEYS
 ENABLE_FLASK = 0
@@ -133,6 +310,9 @@ COUNTER_KEY = "counter"
 LAST_UPDATE_KEY = "last_update"
 UPDATE_INTERVAL_KEY = "update_interval"
 
+# Clock
+CLOCK_RESYNC_INTERVAL = 1.0  # seconds between two readings of the system clock (see "clock.py")
+
 # Documentation
 MODULE_NAME_KEY = "module_name"
 ENDPOINT_PORT_KEY = "endpoint_port"
@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#############################################################################
+#      _____ __________  ___    __                                          #
+#     / ___// ____/ __ \/   |  / /                                          #
+#     \__ \/ /   / /_/ / /| | / /                                           #
+#    ___/ / /___/ _, _/ ___ |/ /___                                         #
+#   /____/\____/_/ |_/_/  |_/_____/   Smart City Resource Adaptation Layer  #
+#                                                                           #
+# LINKS Foundation, (c) 2017-2020                                           #
+# developed by Jacopo Foglietti & Luca Mannella                             #
+# SCRAL is distributed under a BSD-style license -- See file LICENSE.md     #
+#                                                                           #
+#############################################################################
+"""
+    SCRAL - counters
+    This file contains counters that can be incremented by many threads without a global lock:
+    each thread increments its own cell and the cells are summed only when the counter is read.
+    It contains also the counter of the activities in progress, waited for by the graceful shutdown.
+"""
+
+import time
+from threading import local, Lock, Condition
+from typing import Optional
+
+import arrow
+
+from scral_core.constants import ACTUAL_COUNTER_KEY, COUNTER_KEY, LAST_UPDATE_KEY, UPDATE_INTERVAL_KEY, \
+    DEFAULT_UPDATE_INTERVAL
+
+
+class ThreadLocalCounter(object):
+    """ A counter with a cell for each thread: an increment touches only the cell of the calling thread.
+        The mutex is taken only the first time that a thread increments the counter (to register its cell).
+    """
+
+    def __init__(self):
+        self._local = local()
+        self._cells = []  # a one-element list for each thread, written only by its thread
+        self._mutex = Lock()
+
+    def increment(self, value: int = 1):
+        cell = getattr(self._local, "cell", None)
+        if cell is None:
+            cell = self._local.cell = [0]
+            with self._mutex:
+                self._cells.append(cell)
+        cell[0] += value
+
+    def get_value(self) -> int:
+        """ The sum of the cells (threads that are still incrementing could be partially counted). """
+        with self._mutex:
+            cells = list(self._cells)
+        return sum(cell[0] for cell in cells)
+
+
+class ActivityCounter(object):
+    """ The number of OBSERVATIONs sent by a SCRALModule in the current and in the previous update interval. """
+
+    def __init__(self, update_interval: int = DEFAULT_UPDATE_INTERVAL):
+        """
+        :param update_interval: The length (in seconds) of an interval.
+        """
+        self._update_interval = update_interval
+        self._total = ThreadLocalCounter()
+        self._rollover_mutex = Lock()
+        self._interval_start = time.monotonic()
+        self._interval_start_total = 0  # total value at the beginning of the current interval
+        self._previous_count = None  # OBSERVATIONs of the last completed interval
+        self._last_update = arrow.utcnow()
+
+    def increment(self):
+        """ Count an OBSERVATION, when the interval is elapsed a new one begins.
+            Only one thread closes the interval, the other ones never wait for it.
+        """
+        if time.monotonic() - self._interval_start >= self._update_interval \
+                and self._rollover_mutex.acquire(blocking=False):
+            try:
+                if time.monotonic() - self._interval_start >= self._update_interval:
+                    total = self._total.get_value()
+                    self._previous_count = total - self._interval_start_total
+                    self._interval_start_total = total
+                    self._interval_start = time.monotonic()
+                    self._last_update = arrow.utcnow()
+            finally:
+                self._rollover_mutex.release()
+        self._total.increment()
+
+    def get_update_interval(self) -> int:
+        return self._update_interval
+
+    def get_stats(self) -> dict:
+        """ The counters in the "active_devices" format. """
+        stats = {ACTUAL_COUNTER_KEY: self._total.get_value() - self._interval_start_total,
+                 LAST_UPDATE_KEY: self._last_update, UPDATE_INTERVAL_KEY: self._update_interval}
+        if self._previous_count is not None:
+            stats[COUNTER_KEY] = self._previous_count
+        return stats
+
+
+class InFlightCounter(object):
+    """ The number of activities in progress (e.g. REST requests), new activities are refused once it is closed. """
+
+    def __init__(self):
+        self._count = 0
+        self._closed = False
+        self._idle = Condition()
+
+    def enter(self) -> bool:
+        """ Start an activity.
+
+        :return: False if the counter is closed (the activity must not be started).
+        """
+        with self._idle:
+            if self._closed:
+                return False
+            self._count += 1
+            return True
+
+    def exit(self):
+        """ End an activity started by a successful "enter". """
+        with self._idle:
+            self._count -= 1
+            if self._count <= 0:
+                self._idle.notify_all()
+
+    def close(self, timeout: Optional[float] = None) -> int:
+        """ Refuse new activities and wait (at most "timeout" seconds) for the ones in progress.
+
+        :return: The number of activities still in progress.
+        """
+        with self._idle:
+            self._closed = True
+            self._idle.wait_for(lambda: self._count <= 0, timeout)
+            return self._count
+
+    def get_value(self) -> int:
+        return self._count
@@ -0,0 +1,205 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#############################################################################
+#      _____ __________  ___    __                                          #
+#     / ___// ____/ __ \/   |  / /                                          #
+#     \__ \/ /   / /_/ / /| | / /                                           #
+#    ___/ / /___/ _, _/ ___ |/ /___                                         #
+#   /____/\____/_/ |_/_/  |_/_____/   Smart City Resource Adaptation Layer  #
+#                                                                           #
+# LINKS Foundation, (c) 2017-2020                                           #
+# developed by Jacopo Foglietti & Luca Mannella                             #
+# SCRAL is distributed under a BSD-style license -- See file LICENSE.md     #
+#                                                                           #
+#############################################################################
+"""
+    SCRAL - dead_letters
+    This file contains the dead-letter queue of a SCRALModule: messages that could not be published are kept
+    (in memory, up to a maximum number) with the failure reason, so that they can be inspected and replayed.
+"""
+
+import base64
+import logging
+import time
+from collections import OrderedDict
+from threading import Thread, Lock
+from typing import Callable, Iterable, List, Optional
+
+import arrow
+
+from scral_core.constants import DEFAULT_DEAD_LETTER_QUEUE_SIZE, DEFAULT_DEAD_LETTER_REPLAY_RATE
+from scral_core.publish_pipeline import PublishItem
+
+
+class DeadLetter(object):
+    """ A message that could not be published. """
+
+    __slots__ = ("id", "item", "reason", "attempts", "first_failure", "last_failure")
+
+    def __init__(self, letter_id: int, item: PublishItem, reason: str, attempts: int = 1):
+        self.id = letter_id
+        self.item = item
+        self.reason = reason
+        self.attempts = attempts
+        self.first_failure = self.last_failure = str(arrow.utcnow())
+
+    def to_dict(self) -> dict:
+        """ A JSON serializable representation (binary payloads are encoded in base64). """
+        payload = self.item.payload
+        letter = {"id": self.id, "topic": self.item.topic, "qos": self.item.qos, "reason": self.reason,
+                  "attempts": self.attempts, "first_failure": self.first_failure, "last_failure": self.last_failure,
+                  "device_id": self.item.device_id, "observed_property": self.item.observed_property}
+        if isinstance(payload, (bytes, bytearray)):
+            letter["payload"] = base64.b64encode(payload).decode("ascii")
+            letter["payload_encoding"] = "base64"
+        else:
+            letter["payload"] = payload
+        if self.item.content_type:
+            letter["content_type"] = self.item.content_type
+        return letter
+
+
+class DeadLetterQueue(object):
+    """ A bounded store of DeadLetter: when it is full, the oldest letter is discarded. """
+
+    def __init__(self, max_size: int = DEFAULT_DEAD_LETTER_QUEUE_SIZE):
+        self._max_size = max_size
+        self._letters = OrderedDict()  # id -> DeadLetter, the oldest first
+        self._mutex = Lock()
+        self._last_id = 0
+        self._dropped = 0
+        self._replayer = None
+        self._replay_mutex = Lock()
+
+    def add(self, item: PublishItem, reason: str):
+        """ Store a message that could not be published.
+
+        :param item: The message.
+        :param reason: A description of the failure.
+        """
+        with self._mutex:
+            self._last_id += 1
+            self._append(DeadLetter(self._last_id, item, reason))
+
+    def _append(self, letter: DeadLetter):
+        if len(self._letters) >= self._max_size:
+            self._letters.popitem(last=False)
+            self._dropped += 1
+        self._letters[letter.id] = letter
+
+    def retry_failed(self, letter: DeadLetter, reason: str):
+        """ A replayed letter failed again: it is stored again (with the same id) incrementing its attempts. """
+        with self._mutex:
+            letter.reason = reason
+            letter.attempts += 1
+            letter.last_failure = str(arrow.utcnow())
+            self._append(letter)
+
+    def get_letters(self, offset: int = 0, limit: Optional[int] = None,
+                    device_id: Optional[str] = None) -> List[DeadLetter]:
+        """ Retrieve the stored letters, the oldest first.
+
+        :param offset: How many (matching) letters have to be skipped.
+        :param limit: The maximum number of letters returned, None means all.
+        :param device_id: [OPT] Only the letters of this device are returned.
+        """
+        with self._mutex:
+            letters = [letter for letter in self._letters.values()
+                       if device_id is None or letter.item.device_id == device_id]
+        return letters[offset:None if limit is None else offset + limit]
+
+    def take(self, ids: Optional[Iterable[int]] = None, limit: Optional[int] = None) -> List[DeadLetter]:
+        """ Remove and return some letters (e.g. to replay them).
+
+        :param ids: [OPT] The ids of the letters, if not specified the oldest ones are taken.
+        :param limit: The maximum number of letters, None means all.
+        """
+        with self._mutex:
+            if ids is None:
+                ids = list(self._letters.keys())
+            taken = []
+            for letter_id in ids:
+                if limit is not None and len(taken) >= limit:
+                    break
+                letter = self._letters.pop(letter_id, None)
+                if letter:
+                    taken.append(letter)
+            return taken
+
+    def purge(self, ids: Optional[Iterable[int]] = None) -> int:
+        """ Discard some letters (all of them if ids are not specified).
+
+        :return: The number of discarded letters.
+        """
+        with self._mutex:
+            if ids is None:
+                purged = len(self._letters)
+                self._letters.clear()
+                return purged
+            return len([letter_id for letter_id in ids if self._letters.pop(letter_id, None)])
+
+    def replay(self, publish_function: Callable[[PublishItem], bool], rate: float = DEFAULT_DEAD_LETTER_REPLAY_RATE,
+               ids: Optional[Iterable[int]] = None, limit: Optional[int] = None) -> Optional[int]:
+        """ Start replaying some letters in background, at most "rate" messages per second.
+            Letters that fail again are stored back in the queue.
+
+        :param publish_function: The function that publishes a message, it returns True on success.
+        :param rate: The maximum number of messages replayed per second.
+        :param ids: [OPT] The ids of the letters, if not specified the oldest ones are replayed.
+        :param limit: The maximum number of letters replayed, None means all.
+        :return: The number of letters scheduled for replay, None if a replay is already running.
+        """
+        with self._replay_mutex:
+            if self.is_replaying():
+                return None
+            letters = self.take(ids, limit)
+            self._replayer = DeadLetterReplayer(self, letters, publish_function, rate)
+            self._replayer.start()
+            return len(letters)
+
+    def is_replaying(self) -> bool:
+        return bool(self._replayer and self._replayer.is_alive())
+
+    def count(self) -> int:
+        return len(self._letters)
+
+    def get_max_size(self) -> int:
+        return self._max_size
+
+    def get_stats(self) -> dict:
+        return {"count": len(self._letters), "max_size": self._max_size, "dropped": self._dropped,
+                "replaying": self.is_replaying()}
+
+
+class DeadLetterReplayer(Thread):
+    """ This thread publishes again some dead letters with a throttled rate, so the live traffic is not swamped. """
+
+    def __init__(self, queue: DeadLetterQueue, letters: List[DeadLetter],
+                 publish_function: Callable[[PublishItem], bool], rate: float):
+        super().__init__(name="dead-letter-replayer", daemon=True)
+        self._queue = queue
+        self._letters = letters
+        self._publish_function = publish_function
+        self._interval = 1.0 / rate if rate > 0 else 0.0
+
+    def run(self):
+        replayed = failed = 0
+        next_publish = time.monotonic()
+        for letter in self._letters:
+            delay = next_publish - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            next_publish = max(next_publish, time.monotonic()) + self._interval
+
+            try:
+                ok = self._publish_function(letter.item)
+            except Exception as ex:
+                logging.error("Exception caught replaying a dead letter: {0}".format(ex))
+                ok = False
+            if ok:
+                replayed += 1
+            else:
+                failed += 1
+                self._queue.retry_failed(letter, "replay failed")
+
+        logging.info("Dead letters replay completed: " + str(replayed) + " published, " + str(failed) + " failed.")
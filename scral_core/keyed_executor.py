@@ -0,0 +1,193 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#############################################################################
+#      _____ __________  ___    __                                          #
+#     / ___// ____/ __ \/   |  / /                                          #
+#     \__ \/ /   / /_/ / /| | / /                                           #
+#    ___/ / /___/ _, _/ ___ |/ /___                                         #
+#   /____/\____/_/ |_/_/  |_/_____/   Smart City Resource Adaptation Layer  #
+#                                                                           #
+# LINKS Foundation, (c) 2017-2020                                           #
+# developed by Jacopo Foglietti & Luca Mannella                             #
+# SCRAL is distributed under a BSD-style license -- See file LICENSE.md     #
+#                                                                           #
+#############################################################################
+"""
+    SCRAL - keyed_executor
+    This file contains an executor that runs tasks in parallel preserving the order of the tasks with the same key:
+    each key (e.g. a DATASTREAM, a device id or a topic) is always handled by the same thread, in submission order.
+    It can be used by REST handlers, MQTT "on_message_received" callbacks and pollers, so that OBSERVATIONs of the
+    same DATASTREAM reach the broker in phenomenon time order while different DATASTREAMs are handled in parallel.
+"""
+
+import logging
+import time
+import zlib
+from collections import deque
+from concurrent.futures import Future
+from threading import Thread, Condition
+from typing import Callable, Hashable, List, Optional
+
+from scral_core.constants import DEFAULT_ORDERED_QUEUE_SIZE, DEFAULT_ORDERED_SUBMIT_TIMEOUT
+
+
+class ExecutorFullError(RuntimeError):
+    """ Raised when a task is refused because the queue of its thread is full. """
+
+
+class KeyedExecutor(object):
+    """ A fixed set of threads, each one with its own FIFO queue: the tasks of a key are queued on the same thread. """
+
+    def __init__(self, workers: int, queue_size: int = DEFAULT_ORDERED_QUEUE_SIZE, name: str = "keyed",
+                 submit_timeout: float = DEFAULT_ORDERED_SUBMIT_TIMEOUT):
+        """ Prepare the executor, the threads are started only calling "start".
+
+        :param workers: The number of threads.
+        :param queue_size: The maximum number of tasks waiting for each thread (0 means no limit).
+        :param name: A name used for the threads.
+        :param submit_timeout: How many seconds "submit" waits for room in a full queue ("post" never waits).
+        """
+        self._name = name
+        self._workers = [KeyedWorker(name + "-" + str(i + 1), queue_size) for i in range(max(1, workers))]
+        self._submit_timeout = max(0.0, submit_timeout)
+        self._stopped = False
+
+    def start(self):
+        logging.info('Starting ordered executor "' + self._name + '" with ' + str(len(self._workers)) + " thread(s).")
+        for worker in self._workers:
+            worker.start()
+
+    def get_worker(self, key: Hashable) -> "KeyedWorker":
+        """ Retrieve the thread in charge of a key (the same one for the whole life of the executor). """
+        if len(self._workers) == 1:
+            return self._workers[0]
+        return self._workers[zlib.crc32(str(key).encode("utf-8")) % len(self._workers)]
+
+    def submit(self, key: Hashable, function: Callable, *args, **kwargs) -> Future:
+        """ Schedule a task after the tasks already submitted with the same key.
+            If the queue of the thread is full, the caller waits at most "submit_timeout" seconds.
+
+        :param key: The key of the task (e.g. a device id).
+        :param function: The function to execute, with its positional and keyword arguments.
+        :return: A Future of the result of the function.
+        :raise RuntimeError: If the executor was stopped (ExecutorFullError if the queue is still full).
+        """
+        future = Future()
+        self._put(key, (future, function, args, kwargs), self._submit_timeout)
+        return future
+
+    def post(self, key: Hashable, function: Callable, *args, timeout: Optional[float] = 0.0):
+        """ Like "submit", without a Future: the result is discarded and exceptions are only logged.
+            By default it never waits (e.g. it is called by the MQTT network thread): if the queue is full the task
+            is refused.
+
+        :param timeout: How many seconds to wait for room in a full queue, None means forever.
+        :raise RuntimeError: If the executor was stopped (ExecutorFullError if the queue is still full).
+        """
+        self._put(key, (None, function, args, None), timeout)
+
+    def _put(self, key: Hashable, task: tuple, timeout: Optional[float]):
+        if self._stopped:
+            raise RuntimeError('Ordered executor "' + self._name + '" is stopped.')
+        worker = self.get_worker(key)
+        if not worker.put(task, timeout):
+            raise ExecutorFullError('Queue of "' + worker.name + '" is full.')
+
+    def stop(self, timeout: Optional[float] = None) -> int:
+        """ Stop accepting new tasks and wait (at most "timeout" seconds overall) for the queued ones.
+
+        :return: The number of tasks not yet executed.
+        """
+        self._stopped = True
+        deadline = None if timeout is None else time.monotonic() + timeout
+        for worker in self._workers:
+            worker.stop()
+        for worker in self._workers:
+            if worker.is_alive():
+                worker.join(None if deadline is None else max(0.0, deadline - time.monotonic()))
+        return sum(worker.qsize() for worker in self._workers)
+
+    def is_stopped(self) -> bool:
+        return self._stopped
+
+    def get_workers(self) -> List["KeyedWorker"]:
+        return self._workers
+
+    def get_stats(self) -> dict:
+        """ Tasks queued and executed by each thread. """
+        return {"name": self._name, "queued": [worker.qsize() for worker in self._workers],
+                "executed": sum(worker.get_executed() for worker in self._workers),
+                "failed": sum(worker.get_failed() for worker in self._workers)}
+
+
+class KeyedWorker(Thread):
+    """ A thread of a KeyedExecutor: it executes the tasks of its queue one at a time.
+        Once stopped, new tasks are refused and the thread exits after the queued ones.
+    """
+
+    def __init__(self, thread_name: str, queue_size: int):
+        super().__init__(name=thread_name, daemon=True)
+        self._queue = deque()
+        self._max_size = max(0, queue_size)
+        self._changed = Condition()
+        self._stopped = False
+        self._executed = 0  # written only by this thread
+        self._failed = 0
+
+    def put(self, task: tuple, timeout: Optional[float] = 0.0) -> bool:
+        """ Queue a task, waiting at most "timeout" seconds (None means forever) if the queue is full.
+
+        :return: False if the queue is still full.
+        :raise RuntimeError: If the thread was stopped.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._changed:
+            while not self._stopped and 0 < self._max_size <= len(self._queue):
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._changed.wait(remaining)
+            if self._stopped:  # checked holding the lock: a queued task is always executed
+                raise RuntimeError('Ordered executor thread "' + self.name + '" is stopped.')
+            self._queue.append(task)
+            self._changed.notify_all()
+            return True
+
+    def run(self):
+        while True:
+            with self._changed:
+                while not self._queue and not self._stopped:
+                    self._changed.wait()
+                if not self._queue:
+                    break
+                task = self._queue.popleft()
+                self._changed.notify_all()  # room for a waiting "put"
+            future, function, args, kwargs = task
+            if future is not None and not future.set_running_or_notify_cancel():
+                continue
+            try:
+                result = function(*args, **(kwargs or {}))
+            except BaseException as ex:
+                self._failed += 1
+                logging.error('Exception caught in "' + self.name + '": ' + str(ex))
+                if future is not None:
+                    future.set_exception(ex)
+                continue
+            self._executed += 1
+            if future is not None:
+                future.set_result(result)
+
+    def stop(self):
+        """ Refuse new tasks, the thread exits after the tasks already queued. """
+        with self._changed:
+            self._stopped = True
+            self._changed.notify_all()
+
+    def qsize(self) -> int:
+        return len(self._queue)
+
+    def get_executed(self) -> int:
+        return self._executed
+
+    def get_failed(self) -> int:
+        return self._failed
@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#############################################################################
+#      _____ __________  ___    __                                          #
+#     / ___// ____/ __ \/   |  / /                                          #
+#     \__ \/ /   / /_/ / /| | / /                                           #
+#    ___/ / /___/ _, _/ ___ |/ /___                                         #
+#   /____/\____/_/ |_/_/  |_/_____/   Smart City Resource Adaptation Layer  #
+#                                                                           #
+# LINKS Foundation, (c) 2017-2020                                           #
+# developed by Jacopo Foglietti & Luca Mannella                             #
+# SCRAL is distributed under a BSD-style license -- See file LICENSE.md     #
+#                                                                           #
+#############################################################################
+"""
+    SCRAL - log_util
+    This file contains the utilities that keep logging out of the hot path:
+    handlers executed by a background thread, lazy arguments and sampling of frequent messages.
+
+    Frequent messages should be logged only if they are sampled, with lazy arguments, e.g.:
+    if log_util.sampled(logging.DEBUG, "observation", device_id):
+        logging.debug("Device: '%s', Observation:\\n%s", device_id, log_util.LazyJSON(payload))
+"""
+
+import atexit
+import copy
+import itertools
+import json
+import logging
+import queue
+from logging import Handler, Logger, LogRecord
+from logging.handlers import QueueHandler, QueueListener
+from typing import Hashable, Optional
+
+from scral_core.constants import DEFAULT_LOG_SAMPLE_EVERY, DEFAULT_LOG_SAMPLE_RATE, LOG_SAMPLE_BURST, \
+    LOG_SAMPLE_MAX_KEYS
+from scral_core.rate_limit import DeviceRateLimiter
+
+_listeners = []  # QueueListener started by "add_async_handler"
+
+
+class LazyJSON(object):
+    """ A logging argument serialized in JSON only if the message is actually emitted.
+        With an asynchronous handler (see "add_async_handler") it is serialized by the background thread,
+        so the data must not be changed after the logging call.
+    """
+
+    __slots__ = ("_data",)
+
+    def __init__(self, data):
+        self._data = data
+
+    def __str__(self) -> str:
+        return json.dumps(self._data)
+
+
+class LogSampler(object):
+    """ It decides if a frequent message has to be logged: one message every "every" of each key and, if "rate" is
+        greater than 0, at most "rate" messages per second of each key (e.g. of each device).
+        The keys are bounded: beyond "max_keys" keys, the new keys share a counter and the counters are periodically
+        reset (so the keys no longer used are released). The rate of the keys not recently logged is not kept
+        (see DeviceRateLimiter).
+    """
+
+    def __init__(self, every: int = DEFAULT_LOG_SAMPLE_EVERY, rate: float = DEFAULT_LOG_SAMPLE_RATE,
+                 burst: float = LOG_SAMPLE_BURST, max_keys: int = LOG_SAMPLE_MAX_KEYS):
+        """
+        :param every: Only one message every "every" is logged, 1 means all of them.
+        :param rate: The maximum number of messages per second of each key, 0 means no limit.
+        :param burst: The maximum number of messages of a key logged at once (used only with a rate).
+        :param max_keys: The maximum number of keys counted (used only if "every" is greater than 1).
+        """
+        self._every = max(1, int(every))
+        self._max_keys = max(1, max_keys)
+        self._counters = {}  # key -> itertools.count (next() is atomic, no lock required)
+        self._overflow = itertools.count()  # shared by the keys beyond "max_keys"
+        self._limiter = DeviceRateLimiter(rate, burst) if rate > 0 else None
+
+    def should_log(self, key: Hashable = None) -> bool:
+        if self._every > 1:
+            counter = self._counters.get(key)
+            if counter is None:
+                if len(self._counters) < self._max_keys:
+                    counter = self._counters.setdefault(key, itertools.count())
+                else:
+                    counter = self._overflow  # e.g. churning device ids
+            value = next(counter)
+            if counter is self._overflow and value % (self._max_keys * self._every) == 0 and value:
+                self._counters.clear()  # the keys still in use are counted again from now on
+            if value % self._every:
+                return False
+        return self._limiter is None or self._limiter.allow(key)
+
+    def get_every(self) -> int:
+        return self._every
+
+
+_sampler = LogSampler()
+
+
+def configure_sampling(every: int = DEFAULT_LOG_SAMPLE_EVERY, rate: float = DEFAULT_LOG_SAMPLE_RATE):
+    """ Configure the sampling of the frequent messages of this process (see "sampled"). """
+    global _sampler
+    _sampler = LogSampler(every, rate)
+    if every > 1:
+        logging.info("Log sampling: one frequent message every " + str(every) + " of each device is logged.")
+    if rate > 0:
+        logging.info("Log sampling: at most " + str(rate) + " frequent messages per second of each device.")
+
+
+def sampled(level: int, site: str, key: Hashable = None, logger: Optional[Logger] = None) -> bool:
+    """ True if a frequent message has to be logged: its level is enabled and it is chosen by the sampler.
+        Nothing is counted if the level is not enabled.
+
+    :param level: The level of the message.
+    :param site: A name of the message (each message is sampled independently).
+    :param key: [OPT] The source of the message (e.g. a device id), each source is sampled independently.
+    :param logger: [OPT] The logger of the message, the root logger if not specified.
+    """
+    return (logger or logging.root).isEnabledFor(level) and _sampler.should_log((site, key))
+
+
+class DeferredQueueHandler(QueueHandler):
+    """ A QueueHandler that does not format the records: the standard one formats each record in the calling thread
+        (e.g. serializing LazyJSON arguments), here the message is built by the handler of the QueueListener.
+    """
+
+    def prepare(self, record: LogRecord) -> LogRecord:
+        """ Only a copy of the record is enqueued (other handlers could receive the same record): its arguments and
+            exception information are kept as they are, to be formatted by the background thread.
+        """
+        record = copy.copy(record)
+        if isinstance(record.args, dict):
+            record.args = dict(record.args)
+        return record
+
+
+def add_async_handler(logger: Logger, handler: Handler) -> QueueHandler:
+    """ Attach a handler to a logger through a queue: the calling thread only enqueues the records,
+        formatting and I/O of the handler are executed by a background thread.
+
+    :return: The QueueHandler attached to the logger.
+    """
+    log_queue = queue.Queue()
+    queue_handler = DeferredQueueHandler(log_queue)
+    queue_handler.setLevel(handler.level)
+    listener = QueueListener(log_queue, handler, respect_handler_level=True)
+    listener.start()
+    if not _listeners:
+        atexit.register(stop_async_handlers)
+    _listeners.append(listener)
+    logger.addHandler(queue_handler)
+    return queue_handler
+
+
+def stop_async_handlers():
+    """ Write the records still in the queues and stop the background threads (called at exit). """
+    while _listeners:
+        _listeners.pop().stop()
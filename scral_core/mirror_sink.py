@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#############################################################################
+#      _____ __________  ___    __                                          #
+#     / ___// ____/ __ \/   |  / /                                          #
+#     \__ \/ /   / /_/ / /| | / /                                           #
+#    ___/ / /___/ _, _/ ___ |/ /___                                         #
+#   /____/\____/_/ |_/_/  |_/_____/   Smart City Resource Adaptation Layer  #
+#                                                                           #
+# LINKS Foundation, (c) 2017-2020                                           #
+# developed by Jacopo Foglietti & Luca Mannella                             #
+# SCRAL is distributed under a BSD-style license -- See file LICENSE.md     #
+#                                                                           #
+#############################################################################
+"""
+    SCRAL - mirror_sink
+    This file contains the secondary publishing destinations of a SCRALModule (e.g. a staging GOST instance).
+    Each mirror has its own MQTT connection(s), queue, overflow policy and statistics:
+    the primary path only enqueues a copy of each message, so a slow mirror cannot slow it down.
+"""
+
+import logging
+from typing import Optional
+
+import paho.mqtt.client as mqtt
+
+from scral_core.constants import DEFAULT_KEEPALIVE, DEFAULT_PIPELINE_QUEUE_SIZE, DEFAULT_PIPELINE_BATCH_SIZE, DEFAULT_PIPELINE_LINGER, \
+    DEFAULT_PIPELINE_WORKERS, OVERFLOW_BLOCK, OVERFLOW_DROP_OLDEST
+from scral_core import log_util
+from scral_core.mqtt_publisher import MQTTPublisherPool
+from scral_core.publish_pipeline import PublishPipeline, PublishItem
+
+
+class MirrorSink(object):
+    """ A secondary MQTT broker receiving a copy of every message published by a SCRALModule. """
+
+    def __init__(self, name: str, publisher: MQTTPublisherPool, queue_size: int = DEFAULT_PIPELINE_QUEUE_SIZE,
+                 batch_size: int = DEFAULT_PIPELINE_BATCH_SIZE, linger: float = DEFAULT_PIPELINE_LINGER,
+                 workers: int = DEFAULT_PIPELINE_WORKERS, overflow_policy: str = OVERFLOW_DROP_OLDEST,
+                 device_queue_size: int = 0, publish_timeout: float = DEFAULT_KEEPALIVE):
+        """ Prepare the mirror, connection and publisher threads are started only calling "start".
+
+        :param name: The name of the mirror (used for logs, thread names and statistics).
+        :param publisher: The MQTT connection(s) towards the mirror broker.
+        :param queue_size: The maximum number of messages waiting to be published on the mirror.
+        :param batch_size: The maximum number of messages drained by a publisher thread at once.
+        :param linger: How many seconds a publisher thread waits for a batch to fill up.
+        :param workers: The number of publisher threads.
+        :param overflow_policy: "drop_oldest" or "reject" ("block" is not allowed: it would slow the primary path).
+        :param device_queue_size: The maximum number of queued messages of each device, 0 means no limit.
+        :param publish_timeout: How many seconds a publisher thread waits for room in a saturated connection,
+                                then the message is discarded.
+        :raise ValueError: If the overflow policy is "block" or unknown.
+        """
+        if overflow_policy == OVERFLOW_BLOCK:
+            raise ValueError('Overflow policy "' + OVERFLOW_BLOCK + '" is not allowed for mirror "' + name + '"')
+
+        self._name = name
+        self._publisher = publisher
+        self._publish_timeout = publish_timeout
+        self._pipeline = PublishPipeline(self._publish_item, queue_size, batch_size, linger, workers,
+                                         name=name, overflow_policy=overflow_policy,
+                                         device_queue_size=device_queue_size)
+
+    def start(self):
+        logging.info('Starting mirror "' + self._name + '".')
+        self._publisher.connect()
+        self._pipeline.start()
+
+    def submit(self, item: PublishItem) -> bool:
+        """ Enqueue a copy of an item, this method never blocks.
+
+        :return: True if the item was accepted by the mirror queue, False otherwise.
+        """
+        if self._pipeline.submit(item.copy()):
+            return True
+        if log_util.sampled(logging.WARNING, "mirror_rejected", self._name):
+            logging.warning('Mirror "%s": %s, message on topic "%s" rejected.', self._name,
+                            "shutting down" if self._pipeline.is_stopped() else "queue full", item.topic)
+        return False
+
+    def _publish_item(self, item: PublishItem) -> bool:
+        """ Called by the mirror publisher threads, they wait (at most "publish_timeout") if the mirror connection
+            is saturated.
+        """
+        info = self._publisher.publish(item.topic, item.payload, item.qos, block=True, timeout=self._publish_timeout,
+                                       content_type=item.content_type)
+        if info.rc != mqtt.MQTT_ERR_SUCCESS:
+            logging.debug('Mirror "' + self._name + '": publish error ' + str(info.rc) + ' on topic "' +
+                          item.topic + '"')
+            return False
+        return True
+
+    def stop(self, timeout: Optional[float] = None) -> int:
+        """ Stop accepting new messages and wait for the queue to be drained.
+
+        :return: The number of messages still in the queue.
+        """
+        return self._pipeline.stop(timeout)
+
+    def get_name(self) -> str:
+        return self._name
+
+    def get_publisher(self) -> MQTTPublisherPool:
+        return self._publisher
+
+    def get_pipeline(self) -> PublishPipeline:
+        return self._pipeline
+
+    def get_status(self) -> dict:
+        """ Health of the mirror connections and statistics of its queue. """
+        return {"name": self._name, "connections": self._publisher.get_status(), "pipeline": self._pipeline.get_stats()}
@@ -0,0 +1,523 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#############################################################################
+#      _____ __________  ___    __                                          #
+#     / ___// ____/ __ \/   |  / /                                          #
+#     \__ \/ /   / /_/ / /| | / /                                           #
+#    ___/ / /___/ _, _/ ___ |/ /___                                         #
+#   /____/\____/_/ |_/_/  |_/_____/   Smart City Resource Adaptation Layer  #
+#                                                                           #
+# LINKS Foundation, (c) 2017-2020                                           #
+# developed by Jacopo Foglietti & Luca Mannella                             #
+# SCRAL is distributed under a BSD-style license -- See file LICENSE.md     #
+#                                                                           #
+#############################################################################
+"""
+    SCRAL - mqtt_publisher
+    This file contains a wrapper of the Paho MQTT client used by SCRAL modules for publishing.
+    It bounds the number of messages in-flight and queued inside the client and keeps track of them.
+    Optionally, messages that cannot be delivered are stored in a durable spool and replayed after the reconnection.
+    A module can also open several publishing connections, messages are sharded among them by topic.
+    Using MQTT v5, topic aliases are assigned to the most recently used topics to reduce the size of each message.
+"""
+
+import logging
+import time
+import zlib
+from abc import abstractmethod
+from collections import OrderedDict
+from threading import Lock, Condition
+from typing import List, Optional, Tuple
+
+import paho.mqtt.client as mqtt
+from paho.mqtt.packettypes import PacketTypes
+from paho.mqtt.properties import Properties
+
+from scral_core import mqtt_util
+from scral_core.constants import DEFAULT_KEEPALIVE, DEFAULT_MAX_INFLIGHT_MESSAGES, DEFAULT_MAX_QUEUED_MESSAGES, \
+    DEFAULT_SPOOL_REPLAY_RATE, MQTT_V311, MQTT_V5, DEFAULT_TOPIC_ALIAS_MAXIMUM, NETWORK_LOOP_TIMEOUT, \
+    DEFAULT_SESSION_EXPIRY
+from scral_core.spool import ObservationSpool, SpoolReplayer, InflightStore
+
+
+class PublisherBackend(object):
+    """ The interface of an MQTT publishing connection used by SCRAL modules.
+        Every method can be called by any thread.
+    """
+
+    @abstractmethod
+    def connect(self):
+        raise NotImplementedError("Implement connect method in subclasses")
+
+    @abstractmethod
+    def publish(self, topic: str, payload, qos: int, block: bool = False, timeout: Optional[float] = None,
+                content_type: Optional[str] = None) -> mqtt.MQTTMessageInfo:
+        """ Publish (or enqueue for publishing) a message, see MQTTPublisher.publish. """
+        raise NotImplementedError("Implement publish method in subclasses")
+
+    @abstractmethod
+    def is_saturated(self) -> bool:
+        raise NotImplementedError("Implement is_saturated method in subclasses")
+
+    @abstractmethod
+    def is_connected(self) -> bool:
+        raise NotImplementedError("Implement is_connected method in subclasses")
+
+    @abstractmethod
+    def get_pending_messages(self) -> int:
+        raise NotImplementedError("Implement get_pending_messages method in subclasses")
+
+    @abstractmethod
+    def get_client_id(self) -> str:
+        raise NotImplementedError("Implement get_client_id method in subclasses")
+
+    @abstractmethod
+    def get_max_queued_messages(self) -> int:
+        raise NotImplementedError("Implement get_max_queued_messages method in subclasses")
+
+    @abstractmethod
+    def disconnect(self, timeout: Optional[float] = None) -> int:
+        """ Wait (at most "timeout" seconds) for the pending messages to be completed and close the connection.
+
+        :return: The number of messages not completed.
+        """
+        raise NotImplementedError("Implement disconnect method in subclasses")
+
+    def get_spool(self) -> Optional[ObservationSpool]:
+        return None
+
+    def get_connection_stats(self) -> Optional[dict]:
+        """ Reconnections and downtime of the connection (None if not available). """
+        return None
+
+
+class TopicAliasTable(object):
+    """ The topic aliases (MQTT v5) assigned by a client to its topics.
+        When all the aliases are in use, the least recently used one is assigned to the new topic.
+    """
+
+    def __init__(self, maximum: int = 0):
+        self._maximum = maximum
+        self._aliases = OrderedDict()  # topic -> alias, from the least to the most recently used
+
+    def reset(self, maximum: int):
+        """ Forget all the aliases, it has to be called for every new connection. """
+        self._maximum = maximum
+        self._aliases.clear()
+
+    def get_alias(self, topic: str) -> Tuple[int, bool]:
+        """ Retrieve the alias of a topic, assigning a new one if necessary.
+
+        :return: A tuple (alias, new): alias is 0 if aliases are not available,
+                 new is True if the alias was just assigned (so the topic has to be sent together with the alias).
+        """
+        if self._maximum <= 0:
+            return 0, False
+
+        alias = self._aliases.get(topic)
+        if alias:
+            self._aliases.move_to_end(topic)
+            return alias, False
+
+        if len(self._aliases) < self._maximum:
+            alias = len(self._aliases) + 1
+        else:
+            _, alias = self._aliases.popitem(last=False)
+        self._aliases[topic] = alias
+        return alias, True
+
+    def get_maximum(self) -> int:
+        return self._maximum
+
+    def __len__(self):
+        return len(self._aliases)
+
+
+class MQTTPublisher(PublisherBackend):
+    """ A Paho MQTT client with a bounded in-flight window. """
+
+    def __init__(self, client_id: str, broker_address: str, broker_port: int, keepalive: int = DEFAULT_KEEPALIVE,
+                 max_inflight_messages: int = DEFAULT_MAX_INFLIGHT_MESSAGES,
+                 max_queued_messages: int = DEFAULT_MAX_QUEUED_MESSAGES, spool: Optional[ObservationSpool] = None,
+                 spool_replay_rate: float = DEFAULT_SPOOL_REPLAY_RATE, protocol_version: int = MQTT_V311,
+                 topic_alias_maximum: int = DEFAULT_TOPIC_ALIAS_MAXIMUM, persistent_session: bool = False,
+                 session_expiry: int = DEFAULT_SESSION_EXPIRY, inflight_store: Optional[InflightStore] = None):
+        """ Prepare the MQTT client, the connection is established only calling "connect".
+
+        :param client_id: The MQTT client id.
+        :param broker_address: The address of the MQTT broker.
+        :param broker_port: The port of the MQTT broker.
+        :param keepalive: The keepalive (in seconds) of the MQTT connection.
+        :param max_inflight_messages: How many QoS>0 messages can be sent without being acknowledged by the broker.
+        :param max_queued_messages: How many messages can be stored inside the client (in-flight included),
+                                    0 means unlimited.
+        :param spool: [OPT] A spool in which undeliverable messages are stored (store-and-forward).
+        :param spool_replay_rate: The maximum number of spooled messages replayed per second.
+        :param protocol_version: The MQTT version (3 for MQTT v3.1.1 or 5 for MQTT v5).
+        :param topic_alias_maximum: Used only with MQTT v5, the maximum number of topic aliases (the broker could
+                                    allow less aliases), 0 disables topic aliases.
+        :param persistent_session: If True the broker keeps the session (clean session/clean start disabled).
+        :param session_expiry: Used only with MQTT v5 and persistent session, how many seconds the broker keeps
+                               the session after a disconnection.
+        :param inflight_store: [OPT] A snapshot of the unacknowledged messages, published again after a restart.
+        """
+        self._broker_address = broker_address
+        self._broker_port = broker_port
+        self._keepalive = keepalive
+        self._max_inflight_messages = max_inflight_messages
+        self._max_queued_messages = max_queued_messages
+
+        self._protocol_version = protocol_version
+        self._persistent_session = persistent_session
+        self._session_expiry = session_expiry
+        if protocol_version == MQTT_V5:
+            self._client = mqtt.Client(client_id=client_id, protocol=mqtt.MQTTv5)
+        else:
+            self._client = mqtt.Client(client_id=client_id, clean_session=not persistent_session)
+        # the network loop and the reconnections are managed by a dedicated thread
+        self._reconnection = mqtt_util.ReconnectionManager(self._client, client_id + "-network",
+                                                           self._on_connect, self._on_disconnect)
+        self._client.on_publish = self._on_publish
+        self._client.max_inflight_messages_set(max_inflight_messages)
+        self._client.max_queued_messages_set(max_queued_messages)
+
+        self._pending_mutex = Lock()
+        self._room_available = Condition(self._pending_mutex)
+        self._pending = {}  # mid -> (topic, payload, qos) of the messages handed to the client and not yet completed
+        self._early_completions = set()  # mids completed before "publish" returned
+
+        # Topic aliases are valid only inside a connection, the table is reset by "on_connect"
+        self._topic_alias_maximum = topic_alias_maximum if protocol_version == MQTT_V5 else 0
+        self._topic_aliases = TopicAliasTable()
+        self._alias_mutex = Lock()
+
+        self._inflight_store = inflight_store
+        self._spool = spool
+        self._replayer = None
+        if spool:
+            self._replayer = SpoolReplayer(spool, self._send, self.is_connected, spool_replay_rate,
+                                           thread_name=client_id + "-replayer")
+
+    def connect(self):
+        logging.info("Try to connect to broker: %s:%s for PUBLISHING..." % (self._broker_address, self._broker_port))
+        logging.debug("MQTT Client ID is: " + self.get_client_id())
+        if self._replayer:
+            self._replayer.start()
+        if self._protocol_version == MQTT_V5 and self._persistent_session:
+            properties = Properties(PacketTypes.CONNECT)
+            properties.SessionExpiryInterval = self._session_expiry
+            self._reconnection.connect(self._broker_address, self._broker_port, self._keepalive,
+                                       clean_start=False, properties=properties)
+        else:
+            self._reconnection.connect(self._broker_address, self._broker_port, self._keepalive)
+
+        if self._inflight_store:
+            # messages not acknowledged before the last stop (Paho sends them as soon as the connection is ready)
+            records = self._inflight_store.load()
+            for record in records:
+                self.publish(record.topic, record.payload, record.qos, content_type=record.content_type)
+            if records:
+                logging.info(str(len(records)) + " in-flight message(s) of the previous run published again.")
+
+    def publish(self, topic: str, payload, qos: int, block: bool = False, timeout: Optional[float] = None,
+                content_type: Optional[str] = None) -> mqtt.MQTTMessageInfo:
+        """ Publish a message.
+
+        :param topic: The MQTT topic on which the client will publish the message.
+        :param payload: Data to send.
+        :param qos: The desired quality of service.
+        :param block: If True and the client is saturated, wait (at most "timeout" seconds) for room to be available.
+        :param timeout: Used only if block is True, None means forever.
+        :param content_type: [OPT] The format of the payload, sent as "Content Type" property (only with MQTT v5).
+        :return: The MQTTMessageInfo returned by Paho, its rc is MQTT_ERR_QUEUE_SIZE if the client is saturated.
+                 If the spool is enabled and the client is not connected, the message is spooled and rc is
+                 MQTT_ERR_SUCCESS (MQTT_ERR_NO_CONN if it was impossible to write on the spool).
+        """
+        if self._spool and not self._client.is_connected():
+            info = mqtt.MQTTMessageInfo(0)
+            spooled = self._spool.append(topic, payload, qos, content_type)
+            info.rc = mqtt.MQTT_ERR_SUCCESS if spooled else mqtt.MQTT_ERR_NO_CONN
+            return info
+
+        if block and self._max_queued_messages > 0:
+            deadline = None if timeout is None else time.monotonic() + timeout
+            with self._room_available:
+                while len(self._pending) >= self._max_queued_messages:
+                    remaining = None if deadline is None else deadline - time.monotonic()
+                    if remaining is not None and remaining <= 0:
+                        break
+                    self._room_available.wait(remaining)
+
+        if self._topic_alias_maximum > 0:
+            # the message is tracked before releasing the aliases, so "on_disconnect" can always restore its topic
+            with self._alias_mutex:
+                info = self._publish_with_alias(topic, payload, qos, content_type)
+                self._track(info, topic, payload, qos, content_type)
+        else:
+            info = self._client.publish(topic, payload, qos, properties=self._build_properties(content_type))
+            self._track(info, topic, payload, qos, content_type)
+        if qos > 0 and self._inflight_store and self._inflight_store.is_due():
+            self._save_inflight()
+
+        if info.rc != mqtt.MQTT_ERR_SUCCESS and info.rc != mqtt.MQTT_ERR_QUEUE_SIZE and self._spool:
+            if qos == 0 or info.rc != mqtt.MQTT_ERR_NO_CONN:
+                if self._spool.append(topic, payload, qos, content_type):
+                    info.rc = mqtt.MQTT_ERR_SUCCESS
+        return info
+
+    def disconnect(self, timeout: Optional[float] = None) -> int:
+        """ Wait (at most "timeout" seconds) for the acknowledgement of the pending messages and close the connection.
+            Messages still pending are stored in the spool (if enabled).
+
+        :return: The number of messages not acknowledged.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._room_available:
+            while self._pending and self._client.is_connected():
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    break
+                # a disconnection does not notify the condition: the connection is checked periodically
+                self._room_available.wait(NETWORK_LOOP_TIMEOUT if remaining is None
+                                          else min(remaining, NETWORK_LOOP_TIMEOUT))
+            undelivered = len(self._pending)
+
+        if self._replayer:
+            self._replayer.stop()
+        self._reconnection.stop(NETWORK_LOOP_TIMEOUT * 2)
+        if self._replayer and self._replayer.is_alive():
+            self._replayer.join(NETWORK_LOOP_TIMEOUT * 2)
+        if self._inflight_store:
+            if self._spool:
+                self._inflight_store.save([])  # unacknowledged messages were already stored in the spool
+            else:
+                self._save_inflight()
+        if self._spool:
+            self._spool.close()
+        logging.info('MQTT publisher "' + self.get_client_id() + '" disconnected, ' + str(undelivered) +
+                     " message(s) not acknowledged.")
+        return undelivered
+
+    def _build_properties(self, content_type: Optional[str], alias: int = 0) -> Optional[Properties]:
+        """ The MQTT v5 properties of a PUBLISH packet (None if there are no properties). """
+        if self._protocol_version != MQTT_V5 or not (content_type or alias):
+            return None
+        properties = Properties(PacketTypes.PUBLISH)
+        if content_type:
+            properties.ContentType = content_type
+        if alias:
+            properties.TopicAlias = alias
+        return properties
+
+    def _track(self, info: mqtt.MQTTMessageInfo, topic: str, payload, qos: int, content_type: Optional[str]):
+        """ Keep track of a message handed to Paho until its publication is completed. """
+        # if not connected, Paho keeps QoS>0 messages to send them after the reconnection
+        if info.rc == mqtt.MQTT_ERR_SUCCESS or (info.rc == mqtt.MQTT_ERR_NO_CONN and qos > 0):
+            with self._pending_mutex:
+                if info.mid in self._early_completions:
+                    self._early_completions.discard(info.mid)
+                else:
+                    self._pending[info.mid] = (topic, payload, qos, content_type)
+
+    def _publish_with_alias(self, topic: str, payload, qos: int, content_type: Optional[str]) \
+            -> mqtt.MQTTMessageInfo:
+        """ Publish a message (MQTT v5) sending only the topic alias if the topic was already sent.
+            It has to be called holding the alias mutex.
+        """
+        alias, new_alias = self._topic_aliases.get_alias(topic)
+        properties = self._build_properties(content_type, alias)
+        return self._client.publish(topic if new_alias or not alias else "", payload, qos, properties=properties)
+
+    def _restore_topics(self):
+        """ Messages stored inside Paho are sent again after the reconnection, when topic aliases are not valid anymore
+            (the new connection could allow less aliases or none, and the table is reset by "on_connect").
+            Their topics are restored and their "TopicAlias" property is removed, so they are sent without alias.
+
+            Paho has no public API to access the messages it stores, so its private "_out_messages" and
+            "_out_message_mutex" attributes are used (checked with paho-mqtt 1.5.1, the version pinned in
+            requirements.txt: check them again before upgrading Paho).
+        """
+        with self._pending_mutex:
+            topics = {mid: message[0] for mid, message in self._pending.items()}
+        with self._client._out_message_mutex:
+            for mid, message in self._client._out_messages.items():
+                if not message.topic and mid in topics:
+                    message.topic = topics[mid].encode("utf-8")
+                if message.properties is not None and hasattr(message.properties, "TopicAlias"):
+                    delattr(message.properties, "TopicAlias")
+
+    def _send(self, topic: str, payload, qos: int, content_type: Optional[str] = None) -> bool:
+        """ Used by the spool replayer: it publishes a message only if the connection is available. """
+        if not self._client.is_connected():
+            return False
+        info = self.publish(topic, payload, qos, block=True, timeout=self._keepalive, content_type=content_type)
+        return info.rc == mqtt.MQTT_ERR_SUCCESS
+
+    def _on_connect(self, client, userdata, flags, rc, properties=None):
+        if self._topic_alias_maximum > 0 and rc == mqtt.MQTT_ERR_SUCCESS:
+            # the broker tells how many aliases it accepts, if it does not tell anything aliases are not allowed
+            broker_maximum = getattr(properties, "TopicAliasMaximum", 0) if properties else 0
+            with self._alias_mutex:
+                self._topic_aliases.reset(min(broker_maximum, self._topic_alias_maximum))
+            logging.debug("MQTT topic aliases available: " + str(self._topic_aliases.get_maximum()))
+
+        mqtt_util.on_connect(client, userdata, flags, rc)
+        if rc == mqtt.MQTT_ERR_SUCCESS and self._replayer:
+            self._replayer.notify()
+
+    def _on_disconnect(self, client, userdata, rc, properties=None):
+        if self._spool:
+            spooled = self._spool_unacknowledged()
+            if spooled:
+                logging.warning(str(spooled) + " unacknowledged message(s) moved to the spool.")
+            self._spool.sync(force=True)
+
+        if self._topic_alias_maximum > 0:
+            with self._alias_mutex:
+                self._topic_aliases.reset(0)
+                self._restore_topics()
+
+    def _spool_unacknowledged(self) -> int:
+        """ Move the unacknowledged QoS>0 messages from the client to the spool.
+            Paho sends its stored messages again after the reconnection, while the spool replayer sends the spooled
+            ones: each spooled message is removed from the client, so it is delivered only by the replayer.
+            A QoS 2 message whose PUBREC was received is already owned by the broker, it is left to Paho.
+
+            Paho private "_out_messages" and "_out_message_mutex" are used (see "_restore_topics").
+
+        :return: The number of messages moved to the spool.
+        """
+        spooled = 0
+        # the same lock order of Paho, that calls "on_publish" holding its mutex
+        with self._client._out_message_mutex:
+            with self._room_available:
+                for mid, message in list(self._pending.items()):
+                    topic, payload, qos, content_type = message
+                    if qos == 0:
+                        continue
+                    out_message = self._client._out_messages.get(mid)
+                    if out_message is not None and out_message.state == mqtt.mqtt_ms_wait_for_pubcomp:
+                        continue
+                    if not self._spool.append(topic, payload, qos, content_type):
+                        continue  # impossible to write on the spool, the message is kept by Paho
+                    self._client._out_messages.pop(mid, None)
+                    del self._pending[mid]
+                    spooled += 1
+                if spooled:
+                    self._room_available.notify_all()
+        return spooled
+
+    def _on_publish(self, client, userdata, mid):  # the same signature for MQTT v3.1.1 and v5
+        with self._room_available:
+            if self._pending.pop(mid, None) is None:
+                self._early_completions.add(mid)
+            self._room_available.notify()
+        if self._inflight_store and self._inflight_store.is_due():
+            self._save_inflight()
+
+    def _save_inflight(self):
+        """ Store a snapshot of the unacknowledged QoS>0 messages. """
+        with self._pending_mutex:
+            messages = [message for message in self._pending.values() if message[2] > 0]
+        self._inflight_store.save(messages)
+
+    def is_saturated(self) -> bool:
+        """ True if the client cannot accept new messages without exceeding its queue limit. """
+        return 0 < self._max_queued_messages <= len(self._pending)
+
+    def is_connected(self) -> bool:
+        return self._client.is_connected()
+
+    def get_pending_messages(self) -> int:
+        return len(self._pending)
+
+    def get_spool(self) -> Optional[ObservationSpool]:
+        return self._spool
+
+    def get_client(self) -> mqtt.Client:
+        return self._client
+
+    def get_connection_stats(self) -> Optional[dict]:
+        return self._reconnection.get_stats()
+
+    def get_reconnection_manager(self) -> mqtt_util.ReconnectionManager:
+        return self._reconnection
+
+    def get_client_id(self) -> str:
+        client_id = self._client._client_id
+        return client_id.decode() if isinstance(client_id, bytes) else str(client_id)
+
+    def get_max_inflight_messages(self) -> int:
+        return self._max_inflight_messages
+
+    def get_max_queued_messages(self) -> int:
+        return self._max_queued_messages
+
+    def get_protocol_version(self) -> int:
+        return self._protocol_version
+
+    def get_topic_aliases(self) -> TopicAliasTable:
+        return self._topic_aliases
+
+
+class MQTTPublisherPool(object):
+    """ A set of publishing connections (PublisherBackend) used together by a SCRAL module.
+        Each topic (i.e. each DATASTREAM) is always published by the same connection, preserving its messages order.
+    """
+
+    def __init__(self, publishers: List[PublisherBackend]):
+        if not publishers:
+            raise ValueError("At least one MQTT publisher is required.")
+        self._publishers = publishers
+
+    def connect(self):
+        for publisher in self._publishers:
+            publisher.connect()
+
+    def get_publisher(self, topic: str) -> PublisherBackend:
+        """ Retrieve the connection in charge of a topic. """
+        if len(self._publishers) == 1:
+            return self._publishers[0]
+        return self._publishers[zlib.crc32(topic.encode("utf-8")) % len(self._publishers)]
+
+    def publish(self, topic: str, payload, qos: int, block: bool = False, timeout: Optional[float] = None,
+                content_type: Optional[str] = None) -> mqtt.MQTTMessageInfo:
+        """ Publish a message using the connection in charge of its topic (see MQTTPublisher.publish). """
+        return self.get_publisher(topic).publish(topic, payload, qos, block, timeout, content_type)
+
+    def is_saturated(self) -> bool:
+        """ True if at least one connection is saturated. """
+        return any(publisher.is_saturated() for publisher in self._publishers)
+
+    def is_connected(self) -> bool:
+        """ True if all the connections are established. """
+        return all(publisher.is_connected() for publisher in self._publishers)
+
+    def disconnect(self, timeout: Optional[float] = None) -> int:
+        """ Disconnect all the connections, waiting at most "timeout" seconds overall for their pending messages.
+
+        :return: The number of messages not completed.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        undelivered = 0
+        for publisher in self._publishers:
+            undelivered += publisher.disconnect(None if deadline is None else max(0.0, deadline - time.monotonic()))
+        return undelivered
+
+    def get_publishers(self) -> List[PublisherBackend]:
+        return self._publishers
+
+    def get_status(self) -> List[dict]:
+        """ Health and queue depth of each connection. """
+        status = []
+        for publisher in self._publishers:
+            connection = {"client_id": publisher.get_client_id(), "connected": publisher.is_connected(),
+                          "pending": publisher.get_pending_messages(),
+                          "max_queued": publisher.get_max_queued_messages(),
+                          "saturated": publisher.is_saturated()}
+            if publisher.get_spool():
+                connection["spool"] = publisher.get_spool().get_stats()
+            if publisher.get_connection_stats():
+                connection["connection"] = publisher.get_connection_stats()
+            status.append(connection)
+        return status
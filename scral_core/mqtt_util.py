@@ -17,11 +17,18 @@
     This file contains several MQTT utility functions that could be used in different modules.
 """
 
-import time
 import logging
+import random
+import time
+from threading import Thread, Event, Lock
+from typing import Callable, Dict, Optional
 
-from scral_core.constants import DEFAULT_GOST_PREFIX
-from paho.mqtt.client import MQTT_ERR_SUCCESS
+import arrow
+from paho.mqtt.client import Client, MQTT_ERR_SUCCESS, MQTT_CLEAN_START_FIRST_ONLY
+from paho.mqtt.properties import Properties
+
+from scral_core.constants import DEFAULT_GOST_PREFIX, DEFAULT_KEEPALIVE, RECONNECTION_MIN_DELAY, \
+    RECONNECTION_MAX_DELAY, NETWORK_LOOP_TIMEOUT
 
 
 def on_connect(client, userdata, flags, rc):
@@ -32,10 +39,200 @@ def on_connect(client, userdata, flags, rc):
         logging.critical("Connection failed, error code: "+str(rc))
 
 
-def automatic_reconnection(client, userdata, rc):
-    time.sleep(10)
-    logging.error("Broker connection lost! Try to re-connecting to '"+str(client._host)+"'...")
-    client.reconnect()
+def backoff_delay(attempt: int, min_delay: float = RECONNECTION_MIN_DELAY,
+                  max_delay: float = RECONNECTION_MAX_DELAY) -> float:
+    """ Exponential backoff with jitter: the delay doubles at each attempt (up to max_delay) and a random part
+        (up to half of it) is removed, so that many clients disconnected together do not reconnect together.
+
+    :param attempt: The number of failed attempts (0 for the first one).
+    :return: The number of seconds to wait before the next attempt.
+    """
+    delay = min(max_delay, min_delay * (2 ** min(attempt, 30)))
+    return delay * random.uniform(0.5, 1.0)
+
+
+class ConnectionStats(object):
+    """ Reconnections and downtime of an MQTT connection. """
+
+    def __init__(self):
+        self._mutex = Lock()
+        self._connected = False
+        self._reconnections = 0
+        self._failed_attempts = 0
+        self._downtime = 0.0  # seconds, completed disconnections only
+        self._disconnected_since = None  # time.monotonic() of the current disconnection
+        self._last_disconnection = None
+
+    def connected(self):
+        with self._mutex:
+            self._connected = True
+            if self._disconnected_since is not None:
+                self._downtime += time.monotonic() - self._disconnected_since
+                self._reconnections += 1
+                self._disconnected_since = None
+
+    def disconnected(self):
+        with self._mutex:
+            if self._connected:
+                self._connected = False
+                self._disconnected_since = time.monotonic()
+                self._last_disconnection = str(arrow.utcnow())
+
+    def failed_attempt(self):
+        with self._mutex:
+            self._failed_attempts += 1
+
+    def get_stats(self) -> dict:
+        with self._mutex:
+            downtime = self._downtime
+            if self._disconnected_since is not None:
+                downtime += time.monotonic() - self._disconnected_since
+            return {"connected": self._connected, "reconnections": self._reconnections,
+                    "failed_attempts": self._failed_attempts, "downtime": downtime,
+                    "last_disconnection": self._last_disconnection}
+
+
+class ReconnectionManager(Thread):
+    """ This thread runs the network loop of a Paho client and, when the connection is lost, it reconnects the client
+        with an exponential backoff (with jitter). Paho callbacks never wait: the network thread is not blocked.
+        Subscriptions made through this class are restored at each reconnection, unless the broker kept them
+        in a persistent session.
+    """
+
+    def __init__(self, client: Client, name: str, on_connect_callback: Optional[Callable] = None,
+                 on_disconnect_callback: Optional[Callable] = None, min_delay: float = RECONNECTION_MIN_DELAY,
+                 max_delay: float = RECONNECTION_MAX_DELAY):
+        """ The client "on_connect" and "on_disconnect" callbacks are replaced by the ones of this class.
+
+        :param client: A Paho client.
+        :param name: The name of the thread.
+        :param on_connect_callback: [OPT] Called (with Paho arguments) when a connection attempt is completed.
+        :param on_disconnect_callback: [OPT] Called (with Paho arguments) when the connection is lost.
+        :param min_delay: The delay (in seconds) before the first reconnection attempt.
+        :param max_delay: The maximum delay (in seconds) between two reconnection attempts.
+        """
+        super().__init__(name=name, daemon=True)
+        self._client = client
+        self._on_connect_callback = on_connect_callback
+        self._on_disconnect_callback = on_disconnect_callback
+        self._min_delay = min_delay
+        self._max_delay = max_delay
+        self._address = None  # the broker address, used only for logging
+
+        self._subscriptions = {}  # topic -> qos
+        self._unsent = set()  # topics subscribed while disconnected
+        self._subscriptions_mutex = Lock()
+        self._stats = ConnectionStats()
+        self._stop_event = Event()
+
+        client.on_connect = self._on_connect
+        client.on_disconnect = self._on_disconnect
+
+    def connect(self, address: str, port: int, keepalive: int = DEFAULT_KEEPALIVE,
+                clean_start=MQTT_CLEAN_START_FIRST_ONLY, properties: Optional[Properties] = None):
+        """ Connect the client and start the network loop.
+            If the broker is not reachable, connection attempts continue in background.
+
+        :param clean_start: (MQTT v5 only) True, False or MQTT_CLEAN_START_FIRST_ONLY, see Paho "connect".
+        :param properties: (MQTT v5 only) The CONNECT properties (e.g. the session expiry interval).
+        """
+        self._address = address
+        try:
+            self._client.connect(address, port, keepalive, clean_start=clean_start, properties=properties)
+        except (OSError, ValueError) as ex:
+            logging.error("Impossible to connect to MQTT broker '" + address + "': " + str(ex))
+            # the following attempts use "reconnect", so the connection parameters are stored without connecting
+            self._client.connect_async(address, port, keepalive, clean_start=clean_start, properties=properties)
+            self._stats.failed_attempt()
+        self.start()
+
+    def run(self):
+        # As Paho "loop_start": from now on, only this thread uses the socket. Paho has no public API to run its loop
+        # in a thread owned by the caller, so its private "_thread" attribute is set (checked with paho-mqtt 1.5.1,
+        # the version pinned in requirements.txt: check it again before upgrading Paho).
+        self._client._thread = self
+        attempt = 0
+        while not self._stop_event.is_set():
+            rc = self._client.loop(timeout=NETWORK_LOOP_TIMEOUT)
+            if rc == MQTT_ERR_SUCCESS:
+                if self._client.is_connected():
+                    attempt = 0
+                continue
+            if self._stop_event.is_set():
+                break
+
+            self._stats.disconnected()
+            delay = backoff_delay(attempt, self._min_delay, self._max_delay)
+            logging.error("Broker connection lost (rc: " + str(rc) + ")! Try to re-connecting to '" +
+                          str(self._address) + "' in %.1f seconds..." % delay)
+            if self._stop_event.wait(delay):
+                break
+            attempt += 1
+            try:
+                self._client.reconnect()
+            except (OSError, ValueError) as ex:
+                logging.error("MQTT reconnection failed: " + str(ex))
+                self._stats.failed_attempt()
+
+        if self._client.socket():
+            self._client.loop(timeout=NETWORK_LOOP_TIMEOUT)  # the DISCONNECT packet could be still waiting
+
+    def stop(self, timeout: Optional[float] = None):
+        """ Disconnect the client (sending a DISCONNECT packet) and stop the network loop. """
+        self._client.disconnect()  # queued before stopping, so the network loop can still send it
+        self._stop_event.set()
+        if self.is_alive():
+            self.join(timeout)
+
+    def subscribe(self, topic: str, qos: int = 0):
+        """ Subscribe to a topic, the subscription is restored after each reconnection. """
+        with self._subscriptions_mutex:
+            self._subscriptions[topic] = qos
+            connected = self._client.is_connected()
+            if not connected:
+                self._unsent.add(topic)
+        if connected:
+            self._client.subscribe(topic, qos)
+
+    def unsubscribe(self, topic: str):
+        with self._subscriptions_mutex:
+            self._subscriptions.pop(topic, None)
+            self._unsent.discard(topic)
+        if self._client.is_connected():
+            self._client.unsubscribe(topic)
+
+    def _on_connect(self, client, userdata, flags, rc, *args):
+        if rc == MQTT_ERR_SUCCESS:
+            self._stats.connected()
+            with self._subscriptions_mutex:
+                if flags.get("session present"):
+                    # the broker kept the subscriptions: only the ones made while disconnected are sent
+                    logging.info("MQTT session resumed, " + str(len(self._subscriptions) - len(self._unsent)) +
+                                 " subscription(s) kept by the broker.")
+                    subscriptions = [(topic, self._subscriptions[topic]) for topic in self._unsent]
+                else:
+                    subscriptions = list(self._subscriptions.items())
+                self._unsent.clear()
+            if subscriptions:
+                logging.info("Subscribing to " + str(len(subscriptions)) + " MQTT topic(s)...")
+                client.subscribe(subscriptions)
+        else:
+            self._stats.failed_attempt()
+        if self._on_connect_callback:
+            self._on_connect_callback(client, userdata, flags, rc, *args)
+
+    def _on_disconnect(self, client, userdata, rc, *args):
+        self._stats.disconnected()
+        if self._on_disconnect_callback:
+            self._on_disconnect_callback(client, userdata, rc, *args)
+
+    def get_subscriptions(self) -> Dict[str, int]:
+        with self._subscriptions_mutex:
+            return dict(self._subscriptions)
+
+    def get_stats(self) -> dict:
+        """ Connection status, number of reconnections, failed attempts and total downtime (in seconds). """
+        return self._stats.get_stats()
 
 
 def get_publish_mqtt_topic(pilot_name: str):
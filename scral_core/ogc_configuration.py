@@ -82,6 +82,7 @@ class OGCConfiguration:
 
         i = 0  # OBSERVED PROPERTIES
         self._observed_properties = []
+        self._property_priorities = {}
         while i < num_properties:
             section = "PROPERTY_" + str(i)
             i += 1
@@ -91,6 +92,8 @@ class OGCConfiguration:
 
             self._observed_properties.append(
                 OGCObservedProperty(property_name, property_description, property_definition))
+            if parser[section].get('PRIORITY'):  # optional publishing priority (high, normal or low)
+                self._property_priorities[property_name] = parser[section]['PRIORITY'].strip().lower()
 
         self._virtual_sensors = []    # Virtual SENSORS
         if num_v_sensors > 0:
@@ -338,6 +341,10 @@ class OGCConfiguration:
     def get_observed_properties(self) -> List[OGCObservedProperty]:
         return self._observed_properties
 
+    def get_property_priorities(self) -> Dict[str, str]:
+        """ The publishing priorities specified in the OBSERVED PROPERTY sections: { property_name: priority }. """
+        return self._property_priorities
+
     def get_sensors_number(self) -> int:
         return len(self._sensors)
 
@@ -0,0 +1,220 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#############################################################################
+#      _____ __________  ___    __                                          #
+#     / ___// ____/ __ \/   |  / /                                          #
+#     \__ \/ /   / /_/ / /| | / /                                           #
+#    ___/ / /___/ _, _/ ___ |/ /___                                         #
+#   /____/\____/_/ |_/_/  |_/_____/   Smart City Resource Adaptation Layer  #
+#                                                                           #
+# LINKS Foundation, (c) 2017-2020                                           #
+# developed by Jacopo Foglietti & Luca Mannella                             #
+# SCRAL is distributed under a BSD-style license -- See file LICENSE.md     #
+#                                                                           #
+#############################################################################
+"""
+    SCRAL - payload_encoding
+    This file contains the encoding layer applied to OBSERVATION payloads before publishing them.
+    Payloads can be encoded in JSON (default), MessagePack or CBOR and optionally compressed with zstd
+    (with or without a dictionary trained on a sample of observations).
+    Each format is identified by a marker sent as MQTT v5 "Content Type" property or appended to the topic.
+
+    To train a zstd dictionary (the sample file contains one JSON payload per line):
+    $ python3 -m scral_core.payload_encoding sample.jsonl dictionary.zstd
+"""
+
+import argparse
+import importlib
+import json
+from typing import List, Optional, Tuple, Union
+
+from scral_core.constants import JSON_ENCODING, MSGPACK_ENCODING, CBOR_ENCODING, ZSTD_COMPRESSION, \
+    CONTENT_TYPE_PROPERTY, CONTENT_TYPE_TOPIC, DEFAULT_ZSTD_LEVEL, DEFAULT_ZSTD_DICTIONARY_SIZE
+
+# encoding -> (MIME type, Python module)
+ENCODINGS = {
+    JSON_ENCODING: ("application/json", None),
+    MSGPACK_ENCODING: ("application/msgpack", "msgpack"),
+    CBOR_ENCODING: ("application/cbor", "cbor2"),
+}
+ZSTD_MODULE = "zstandard"
+TOPIC_MARKER_SEPARATOR = "/"
+
+
+def _encode_with(encoding: str, module, data) -> bytes:
+    if encoding == MSGPACK_ENCODING:
+        return module.packb(data, use_bin_type=True)
+    elif encoding == CBOR_ENCODING:
+        return module.dumps(data)
+    return json.dumps(data).encode("utf-8")
+
+
+def _decode_with(encoding: str, module, payload: bytes):
+    if encoding == MSGPACK_ENCODING:
+        return module.unpackb(payload, raw=False)
+    elif encoding == CBOR_ENCODING:
+        return module.loads(payload)
+    return json.loads(payload)
+
+
+def _load_dictionary(zstd, dictionary_path: Optional[str]):
+    if not dictionary_path:
+        return None
+    with open(dictionary_path, "rb") as f:
+        return zstd.ZstdCompressionDict(f.read())
+
+
+class PayloadEncoder(object):
+    """ It encodes OBSERVATION payloads according to the configured format. """
+
+    def __init__(self, encoding: str = JSON_ENCODING, compression: Optional[str] = None,
+                 dictionary_path: Optional[str] = None, marker: str = CONTENT_TYPE_PROPERTY,
+                 level: int = DEFAULT_ZSTD_LEVEL):
+        """ Prepare the encoder, the optional libraries are imported only if required.
+
+        :param encoding: "json", "msgpack" or "cbor".
+        :param compression: None or "zstd".
+        :param dictionary_path: [OPT] The path of a zstd dictionary (used only with zstd compression).
+        :param marker: How the format is notified to consumers: "property" (MQTT v5 Content Type) or "topic".
+        :param level: The zstd compression level.
+        :raise ValueError: If the encoding or the compression are unknown.
+        :raise ImportError: If a required library is not installed.
+        """
+        if encoding not in ENCODINGS:
+            raise ValueError('Unknown payload encoding: "' + str(encoding) + '"')
+        if compression not in (None, ZSTD_COMPRESSION):
+            raise ValueError('Unknown payload compression: "' + str(compression) + '"')
+
+        self._encoding = encoding
+        self._compression = compression
+        self._marker = marker
+
+        mime_type, module_name = ENCODINGS[encoding]
+        self._module = importlib.import_module(module_name) if module_name else None
+        self._compressor = None
+        if compression == ZSTD_COMPRESSION:
+            zstd = importlib.import_module(ZSTD_MODULE)
+            self._compressor = zstd.ZstdCompressor(level=level, dict_data=_load_dictionary(zstd, dictionary_path))
+
+        self._content_type = mime_type + ("+" + compression if compression else "")
+        self._topic_suffix = TOPIC_MARKER_SEPARATOR + encoding + ("." + compression if compression else "")
+
+    def encode(self, data: dict) -> Union[str, bytes]:
+        """ Encode a payload (plain JSON is returned as a string, as before the introduction of this layer). """
+        if self.is_plain_json():
+            return json.dumps(data)
+
+        payload = _encode_with(self._encoding, self._module, data)
+        if self._compressor:
+            payload = self._compressor.compress(payload)
+        return payload
+
+    def is_plain_json(self) -> bool:
+        return self._encoding == JSON_ENCODING and not self._compression
+
+    def get_content_type(self) -> Optional[str]:
+        """ The value of the MQTT v5 Content Type property, None if it should not be sent. """
+        if self.is_plain_json() or self._marker != CONTENT_TYPE_PROPERTY:
+            return None
+        return self._content_type
+
+    def get_topic(self, topic: str) -> str:
+        """ The topic on which a payload has to be published (with the format suffix if required). """
+        if self.is_plain_json() or self._marker != CONTENT_TYPE_TOPIC:
+            return topic
+        return topic + self._topic_suffix
+
+    def get_encoding(self) -> str:
+        return self._encoding
+
+    def get_compression(self) -> Optional[str]:
+        return self._compression
+
+
+class PayloadDecoder(object):
+    """ The consumer-side counterpart of PayloadEncoder: it recognizes the format from the content type marker. """
+
+    def __init__(self, dictionary_path: Optional[str] = None):
+        self._dictionary_path = dictionary_path
+        self._modules = {}
+        self._decompressor = None
+
+    def _get_module(self, encoding: str):
+        module_name = ENCODINGS[encoding][1]
+        if module_name and module_name not in self._modules:
+            self._modules[module_name] = importlib.import_module(module_name)
+        return self._modules.get(module_name)
+
+    def _decompress(self, payload: bytes) -> bytes:
+        if not self._decompressor:
+            zstd = importlib.import_module(ZSTD_MODULE)
+            self._decompressor = zstd.ZstdDecompressor(dict_data=_load_dictionary(zstd, self._dictionary_path))
+        return self._decompressor.decompress(payload)
+
+    def decode(self, payload: Union[str, bytes], content_type: Optional[str] = None):
+        """ Decode a payload.
+
+        :param payload: The received payload.
+        :param content_type: The MQTT v5 Content Type property (None means plain JSON).
+        :return: The decoded OBSERVATION payload.
+        """
+        if not content_type:
+            return json.loads(payload)
+
+        mime_type, _, compression = content_type.partition("+")
+        for encoding, (encoding_mime_type, _) in ENCODINGS.items():
+            if encoding_mime_type == mime_type:
+                if compression == ZSTD_COMPRESSION:
+                    payload = self._decompress(payload)
+                return _decode_with(encoding, self._get_module(encoding), payload)
+        raise ValueError('Unknown content type: "' + content_type + '"')
+
+    def decode_from_topic(self, topic: str, payload: Union[str, bytes]) -> Tuple[str, object]:
+        """ Decode a payload published with the "topic" marker.
+
+        :return: A tuple (topic without the format suffix, decoded payload).
+        """
+        base_topic, _, suffix = topic.rpartition(TOPIC_MARKER_SEPARATOR)
+        encoding, _, compression = suffix.partition(".")
+        if not base_topic or encoding not in ENCODINGS:
+            return topic, json.loads(payload)  # no suffix: plain JSON
+
+        content_type = ENCODINGS[encoding][0] + ("+" + compression if compression else "")
+        return base_topic, self.decode(payload, content_type)
+
+
+def train_dictionary(samples: List[dict], encoding: str = JSON_ENCODING,
+                     dictionary_size: int = DEFAULT_ZSTD_DICTIONARY_SIZE) -> bytes:
+    """ Train a zstd dictionary on a sample of OBSERVATION payloads.
+
+    :param samples: The OBSERVATION payloads.
+    :param encoding: The encoding that will be used together with the dictionary.
+    :param dictionary_size: The maximum size (in bytes) of the dictionary.
+    :return: The dictionary content.
+    """
+    zstd = importlib.import_module(ZSTD_MODULE)
+    module_name = ENCODINGS[encoding][1]
+    module = importlib.import_module(module_name) if module_name else None
+    encoded_samples = [_encode_with(encoding, module, sample) for sample in samples]
+    return zstd.train_dictionary(dictionary_size, encoded_samples).as_bytes()
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="payload_encoding", description="Train a zstd dictionary for SCRAL payloads.")
+    parser.add_argument("sample", help="A file containing an OBSERVATION payload (JSON) for each line.")
+    parser.add_argument("output", help="The file in which the dictionary will be stored.")
+    parser.add_argument("-e", "--encoding", default=JSON_ENCODING, choices=list(ENCODINGS.keys()))
+    parser.add_argument("-s", "--size", type=int, default=DEFAULT_ZSTD_DICTIONARY_SIZE,
+                        help="The maximum size (in bytes) of the dictionary.")
+    args = parser.parse_args()
+
+    with open(args.sample) as f:
+        samples = [json.loads(line) for line in f if line.strip()]
+    dictionary = train_dictionary(samples, args.encoding, args.size)
+    with open(args.output, "wb") as f:
+        f.write(dictionary)
+    print("Dictionary of " + str(len(dictionary)) + " bytes trained on " + str(len(samples)) + " samples.")
+
+
+if __name__ == '__main__':
+    main()
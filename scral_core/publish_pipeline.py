@@ -0,0 +1,567 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#############################################################################
+#      _____ __________  ___    __                                          #
+#     / ___// ____/ __ \/   |  / /                                          #
+#     \__ \/ /   / /_/ / /| | / /                                           #
+#    ___/ / /___/ _, _/ ___ |/ /___                                         #
+#   /____/\____/_/ |_/_/  |_/_____/   Smart City Resource Adaptation Layer  #
+#                                                                           #
+# LINKS Foundation, (c) 2017-2020                                           #
+# developed by Jacopo Foglietti & Luca Mannella                             #
+# SCRAL is distributed under a BSD-style license -- See file LICENSE.md     #
+#                                                                           #
+#############################################################################
+"""
+    SCRAL - publish_pipeline
+    This file contains the asynchronous publishing pipeline that can be enabled in a SCRALModule.
+    Callers enqueue messages in a bounded in-memory queue and return immediately,
+    dedicated publisher threads drain the queue in batches.
+    Messages of conflated DATASTREAMs can be replaced by newer ones while they are still waiting to be published.
+    Each message belongs to a priority lane, higher priority lanes are always drained first.
+    Inside a lane, messages of different devices are drained with a deficit round robin, so that a flooding device
+    cannot starve the others.
+    With several publisher threads, a dispatcher drains the queue and each topic (i.e. each DATASTREAM) is always
+    published by the same thread, so the messages of a DATASTREAM are published in order.
+"""
+
+import heapq
+import logging
+import time
+from collections import deque
+from threading import Thread, Lock, Condition
+from typing import Callable, Dict, List, Optional, Sequence
+
+from scral_core.constants import DEFAULT_PIPELINE_QUEUE_SIZE, DEFAULT_PIPELINE_BATCH_SIZE, DEFAULT_PIPELINE_LINGER, \
+    DEFAULT_PIPELINE_WORKERS, OVERFLOW_POLICIES, OVERFLOW_BLOCK, OVERFLOW_DROP_OLDEST, DEFAULT_OVERFLOW_POLICY, \
+    DEFAULT_OVERFLOW_BLOCK_TIMEOUT, PRIORITY_LANES, DEFAULT_PRIORITY
+from scral_core.keyed_executor import KeyedExecutor
+
+
+class PublishItem(object):
+    """ A message waiting to be published on the MQTT broker. """
+
+    __slots__ = ("topic", "payload", "qos", "phenomenon_time", "result_time", "content_type",
+                 "device_id", "observed_property", "conflation_key", "priority", "enqueue_time")
+
+    def __init__(self, topic: str, payload, qos: int, phenomenon_time: Optional[str] = None,
+                 result_time: Optional[str] = None, content_type: Optional[str] = None,
+                 device_id: Optional[str] = None, observed_property: Optional[str] = None,
+                 conflation_key: Optional[str] = None, priority: str = DEFAULT_PRIORITY):
+        self.topic = topic
+        self.payload = payload
+        self.qos = qos
+        self.phenomenon_time = phenomenon_time
+        self.result_time = result_time
+        self.content_type = content_type
+        self.device_id = device_id
+        self.observed_property = observed_property
+        self.conflation_key = conflation_key  # if set, a newer item with the same key can replace this one
+        self.priority = priority
+        self.enqueue_time = time.monotonic()
+
+    def copy(self) -> "PublishItem":
+        """ A copy of this item (e.g. for another queue), its enqueue time is reset. """
+        return PublishItem(self.topic, self.payload, self.qos, self.phenomenon_time, self.result_time,
+                           self.content_type, self.device_id, self.observed_property, self.conflation_key,
+                           self.priority)
+
+    def replace_content(self, newer: "PublishItem"):
+        """ Take the content of a newer item (conflation), the position in the queue is preserved. """
+        self.payload = newer.payload
+        self.phenomenon_time = newer.phenomenon_time
+        self.result_time = newer.result_time
+        self.content_type = newer.content_type
+
+
+class FairQueue(object):
+    """ A FIFO queue for each device, drained with a deficit round robin:
+        at its turn, a device can send as many items as its weight (default 1) before passing the turn.
+        Items without a device id are considered as belonging to the same (anonymous) device.
+        This class is not thread-safe, it is protected by the mutex of PublishQueue.
+    """
+
+    def __init__(self, weights: Dict[Optional[str], int]):
+        """
+        :param weights: The weight of each device (shared among lanes), missing devices have weight 1.
+        """
+        self._weights = weights
+        self._queues = {}  # device id -> deque of items
+        self._active = deque()  # devices with queued items, in round robin order
+        self._deficit = 0  # remaining items of the device at the head of the round
+        self._size = 0
+
+    def __len__(self) -> int:
+        return self._size
+
+    def append(self, item: PublishItem):
+        queue = self._queues.get(item.device_id)
+        if queue is None:
+            queue = self._queues[item.device_id] = deque()
+            self._active.append(item.device_id)
+        queue.append(item)
+        self._size += 1
+
+    def popleft(self) -> PublishItem:
+        """ Remove the next item according to the round robin. """
+        device_id = self._active[0]
+        if self._deficit <= 0:
+            self._deficit = self._weights.get(device_id, 1)
+        queue = self._queues[device_id]
+        item = queue.popleft()
+        self._size -= 1
+        self._deficit -= 1
+
+        if not queue:
+            del self._queues[device_id]
+            self._active.popleft()
+            self._deficit = 0
+        elif self._deficit <= 0:
+            self._active.rotate(-1)
+        return item
+
+    def pop_oldest(self, device_id: Optional[str] = None, longest: bool = True) -> PublishItem:
+        """ Remove the oldest item of a device.
+
+        :param device_id: The device, used only if "longest" is False.
+        :param longest: If True the device with the longest queue is chosen (overflows are paid by flooding devices).
+        """
+        if longest:
+            device_id = max(self._queues, key=lambda device: len(self._queues[device]))
+        queue = self._queues[device_id]
+        item = queue.popleft()
+        self._size -= 1
+        if not queue:
+            del self._queues[device_id]
+            if self._active[0] == device_id:
+                self._deficit = 0
+            self._active.remove(device_id)
+        return item
+
+    def get_device_size(self, device_id: Optional[str]) -> int:
+        queue = self._queues.get(device_id)
+        return len(queue) if queue else 0
+
+
+class PublishQueue(object):
+    """ A bounded queue of PublishItem that can be drained in batches.
+        Items are kept in a lane for each priority, a batch is filled with items of the highest priority first.
+        Inside a lane, devices are served in a (weighted) round robin.
+        Each lane can contain up to max_size items, so that low priority traffic cannot fill the room of alerts,
+        optionally each device can have at most device_queue_size items in a lane.
+        When a lane (or a device queue) is full, new items are managed according to an overflow policy:
+          - "block": the caller waits (at most block_timeout seconds) for some room;
+          - "drop_oldest": the oldest item of the device (of the longest device queue if the lane is full)
+                           is discarded;
+          - "reject": the new item is refused.
+        An item with a conflation key replaces the content of the queued item with the same key (if any).
+    """
+
+    def __init__(self, max_size: int = DEFAULT_PIPELINE_QUEUE_SIZE, overflow_policy: str = DEFAULT_OVERFLOW_POLICY,
+                 block_timeout: float = DEFAULT_OVERFLOW_BLOCK_TIMEOUT, device_queue_size: int = 0):
+        if overflow_policy not in OVERFLOW_POLICIES:
+            raise ValueError('Unknown overflow policy: "' + str(overflow_policy) + '"')
+
+        self._device_weights = {}
+        self._lanes = {lane: FairQueue(self._device_weights) for lane in PRIORITY_LANES}  # in draining order
+        self._size = 0
+        self._latency = {lane: {"count": 0, "total": 0.0, "max": 0.0} for lane in PRIORITY_LANES}
+        self._max_size = max_size
+        self._device_queue_size = device_queue_size  # 0 means no limit for each device
+        self._overflow_policy = overflow_policy
+        self._block_timeout = block_timeout
+        self._mutex = Lock()
+        self._not_empty = Condition(self._mutex)
+        self._not_full = Condition(self._mutex)
+        self._closed = False
+        self._dropped = 0
+        self._device_dropped = {}  # device id -> number of dropped or refused items
+        self._conflatable = {}  # conflation key -> queued item
+        self._conflated = 0
+
+    def put(self, item: PublishItem) -> bool:
+        """ Enqueue an item applying the overflow policy if the queue is full.
+
+        :param item: The item to enqueue.
+        :return: True if the item was enqueued, False if it was refused or the queue is closed.
+        """
+        with self._mutex:
+            if self._closed:
+                return False
+
+            if item.conflation_key is not None:
+                queued = self._conflatable.get(item.conflation_key)
+                if queued is not None:
+                    queued.replace_content(item)
+                    self._conflated += 1
+                    return True
+
+            items = self._lanes.get(item.priority, self._lanes[DEFAULT_PRIORITY])
+            device_full = self._is_device_full(items, item.device_id)
+            if device_full or len(items) >= self._max_size:
+                if self._overflow_policy == OVERFLOW_DROP_OLDEST:
+                    dropped = items.pop_oldest(item.device_id, longest=not device_full)
+                    self._forget(dropped)
+                    self._size -= 1
+                    self._dropped += 1
+                    self._count_device_drop(dropped.device_id)
+                elif self._overflow_policy == OVERFLOW_BLOCK:
+                    deadline = time.monotonic() + self._block_timeout
+                    while (len(items) >= self._max_size or self._is_device_full(items, item.device_id)) \
+                            and not self._closed:
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0:
+                            self._count_device_drop(item.device_id)
+                            return False
+                        self._not_full.wait(remaining)
+                    if self._closed:
+                        return False
+                else:
+                    self._count_device_drop(item.device_id)
+                    return False
+
+            items.append(item)
+            self._size += 1
+            if item.conflation_key is not None:
+                self._conflatable[item.conflation_key] = item
+            self._not_empty.notify()
+        return True
+
+    def _is_device_full(self, items: FairQueue, device_id: Optional[str]) -> bool:
+        return 0 < self._device_queue_size <= items.get_device_size(device_id)
+
+    def _count_device_drop(self, device_id: Optional[str]):
+        self._device_dropped[device_id] = self._device_dropped.get(device_id, 0) + 1
+
+    def _forget(self, item: PublishItem):
+        """ An item left the queue, it cannot be replaced anymore. """
+        if item.conflation_key is not None and self._conflatable.get(item.conflation_key) is item:
+            del self._conflatable[item.conflation_key]
+
+    def get_batch(self, max_items: int, linger: float, timeout: Optional[float] = None) -> List[PublishItem]:
+        """ Retrieve up to max_items items.
+            The method waits (at most "timeout" seconds) for the first item,
+            then it waits at most "linger" seconds for the batch to fill up (no wait if high priority items are queued).
+
+        :param max_items: The maximum number of items returned.
+        :param linger: How long to wait for more items once the first one is available.
+        :param timeout: How long to wait for the first item, None means forever.
+        :return: A list of items, empty if the timeout expired or the queue was closed.
+        """
+        with self._mutex:
+            if not self._size and not self._closed:
+                self._not_empty.wait(timeout)
+            if not self._size:
+                return []
+
+            deadline = time.monotonic() + linger
+            urgent_items = self._lanes[PRIORITY_LANES[0]]
+            while self._size < max_items and not urgent_items and not self._closed:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._not_empty.wait(remaining)
+
+            batch = []
+            now = time.monotonic()
+            for lane, items in self._lanes.items():
+                latency = self._latency[lane]
+                while items and len(batch) < max_items:
+                    item = items.popleft()
+                    self._forget(item)
+                    batch.append(item)
+
+                    waited = now - item.enqueue_time
+                    latency["count"] += 1
+                    latency["total"] += waited
+                    if waited > latency["max"]:
+                        latency["max"] = waited
+            self._size -= len(batch)
+            self._not_full.notify_all()  # producers could be waiting on different lanes
+            return batch
+
+    def close(self):
+        """ Refuse new items and wake up all the waiting producers and consumers. """
+        with self._mutex:
+            self._closed = True
+            self._not_empty.notify_all()
+            self._not_full.notify_all()
+
+    def is_closed(self) -> bool:
+        return self._closed
+
+    def is_full(self, priority: str = DEFAULT_PRIORITY) -> bool:
+        """ True if the lane of the given priority is full. """
+        return len(self._lanes[priority]) >= self._max_size
+
+    def qsize(self) -> int:
+        return self._size
+
+    def get_max_size(self) -> int:
+        return self._max_size
+
+    def get_overflow_policy(self) -> str:
+        return self._overflow_policy
+
+    def get_dropped(self) -> int:
+        return self._dropped
+
+    def get_conflated(self) -> int:
+        return self._conflated
+
+    def get_device_dropped(self) -> Dict[Optional[str], int]:
+        """ The number of items dropped or refused for each device. """
+        with self._mutex:
+            return dict(self._device_dropped)
+
+    def set_device_weight(self, device_id: str, weight: int):
+        """ A device with weight N can publish N items at each turn of the round robin. """
+        with self._mutex:
+            if weight > 1:
+                self._device_weights[device_id] = int(weight)
+            else:
+                self._device_weights.pop(device_id, None)
+
+    def get_lane_stats(self) -> dict:
+        """ For each priority lane: queued items, dequeued items, average and maximum queue latency (in seconds). """
+        with self._mutex:
+            return {lane: {"queued": len(self._lanes[lane]), "dequeued": latency["count"],
+                           "average_latency": latency["total"] / latency["count"] if latency["count"] else 0.0,
+                           "max_latency": latency["max"]}
+                    for lane, latency in self._latency.items()}
+
+
+class PublishPipeline(object):
+    """ This class decouples the callers of SCRALModule.mqtt_publish from the actual MQTT publication. """
+
+    def __init__(self, publish_function: Callable[[PublishItem], bool],
+                 queue_size: int = DEFAULT_PIPELINE_QUEUE_SIZE, batch_size: int = DEFAULT_PIPELINE_BATCH_SIZE,
+                 linger: float = DEFAULT_PIPELINE_LINGER, workers: int = DEFAULT_PIPELINE_WORKERS,
+                 name: str = "publisher", overflow_policy: str = DEFAULT_OVERFLOW_POLICY,
+                 block_timeout: float = DEFAULT_OVERFLOW_BLOCK_TIMEOUT, device_queue_size: int = 0):
+        """ Prepare the pipeline, the publisher threads are started only calling "start".
+
+        :param publish_function: The function that actually publishes an item, it returns True on success.
+        :param queue_size: The maximum number of items waiting to be published.
+        :param batch_size: The maximum number of items drained by a worker at once.
+        :param linger: How many seconds a worker waits for a batch to fill up.
+        :param workers: The number of publisher threads.
+        :param name: A name used for the publisher threads.
+        :param overflow_policy: What to do when the queue is full ("block", "drop_oldest" or "reject").
+        :param block_timeout: How many seconds a caller can be blocked if the overflow policy is "block".
+        :param device_queue_size: The maximum number of items of each device in a lane, 0 means no limit.
+        """
+        self._publish_function = publish_function
+        self._queue = PublishQueue(queue_size, overflow_policy, block_timeout, device_queue_size)
+        self._batch_size = max(1, batch_size)
+        self._linger = max(0.0, linger)
+        self._name = name
+        self._worker_count = max(1, workers)
+        # with several threads the batches are dispatched by topic, a single thread publishes them directly
+        self._executor = KeyedExecutor(self._worker_count, self._batch_size, name) if self._worker_count > 1 else None
+        self._workers = [PublisherWorker(self, name + ("-dispatcher" if self._executor else "-1"))]
+
+        self._stats_mutex = Lock()
+        self._published = 0
+        self._failed = 0
+        self._rejected = 0
+
+    def start(self):
+        logging.info('Starting publishing pipeline "%s" with %d worker(s), queue size %d (%s), batch size %d, '
+                     'linger %.3fs.' % (self._name, self._worker_count, self._queue.get_max_size(),
+                                        self._queue.get_overflow_policy(), self._batch_size, self._linger))
+        if self._executor:
+            self._executor.start()
+        for worker in self._workers:
+            worker.start()
+
+    def submit(self, item: PublishItem) -> bool:
+        """ Enqueue an item to be published. Rejected items are only counted (see "get_stats"), this method is on
+            the hot path: the callers log them (sampled), see "is_stopped" to know the reason.
+
+        :param item: The item to publish.
+        :return: True if the item was accepted by the pipeline, False otherwise (queue full or pipeline stopped).
+        """
+        if self._queue.put(item):
+            return True
+
+        with self._stats_mutex:
+            self._rejected += 1
+        return False
+
+    def is_stopped(self) -> bool:
+        """ True if the pipeline does not accept new items anymore (it is shutting down). """
+        return self._queue.is_closed()
+
+    def get_name(self) -> str:
+        return self._name
+
+    def is_saturated(self) -> bool:
+        """ True if the pipeline queue is full (for messages of normal priority). """
+        return self._queue.is_full()
+
+    def stop(self, timeout: Optional[float] = None) -> int:
+        """ Stop accepting new items and wait for the publisher threads to drain the queue.
+
+        :param timeout: The maximum amount of seconds to wait for the publisher threads.
+        :return: The number of items still in the queue.
+        """
+        self._queue.close()
+        deadline = None if timeout is None else time.monotonic() + timeout
+        for worker in self._workers:
+            if worker.is_alive():
+                worker.join(None if deadline is None else max(0.0, deadline - time.monotonic()))
+        not_published = self._queue.qsize()
+        if self._executor:
+            not_published += self._executor.stop(None if deadline is None else max(0.0, deadline - time.monotonic()))
+        return not_published
+
+    def get_queue(self) -> PublishQueue:
+        return self._queue
+
+    def get_batch_size(self) -> int:
+        return self._batch_size
+
+    def get_linger(self) -> float:
+        return self._linger
+
+    def get_stats(self) -> dict:
+        queued = self._queue.qsize()
+        if self._executor:  # items already dispatched to a publisher thread
+            queued += sum(self._executor.get_stats()["queued"])
+        with self._stats_mutex:
+            return {"queued": queued, "published": self._published, "failed": self._failed,
+                    "rejected": self._rejected, "dropped": self._queue.get_dropped(),
+                    "conflated": self._queue.get_conflated(), "lanes": self._queue.get_lane_stats()}
+
+    def publish_batch(self, batch: List[PublishItem]):
+        """ Publish all the items of a batch updating the pipeline statistics.
+            With several publisher threads, the items are handed to the thread in charge of their topic.
+        """
+        if self._executor:
+            for item in batch:
+                # the dispatcher waits for the publisher thread: the items stay in the pipeline queue meanwhile
+                self._executor.post(item.topic, self._publish_items, (item,), timeout=None)
+        else:
+            self._publish_items(batch)
+
+    def _publish_items(self, items: Sequence[PublishItem]):
+        published = failed = 0
+        for item in items:
+            try:
+                ok = self._publish_function(item)
+            except Exception as ex:
+                logging.error("Exception caught in publishing pipeline: {0}".format(ex))
+                ok = False
+            if ok:
+                published += 1
+            else:
+                failed += 1
+
+        with self._stats_mutex:
+            self._published += published
+            self._failed += failed
+
+
+class PublisherWorker(Thread):
+    """ Each instance of this class drains the queue of a PublishPipeline. """
+
+    def __init__(self, pipeline: PublishPipeline, thread_name: str):
+        super().__init__(name=thread_name, daemon=True)
+        self._pipeline = pipeline
+
+    def run(self):
+        queue = self._pipeline.get_queue()
+        batch_size = self._pipeline.get_batch_size()
+        linger = self._pipeline.get_linger()
+        while True:
+            batch = queue.get_batch(batch_size, linger, timeout=1.0)
+            if batch:
+                self._pipeline.publish_batch(batch)
+            elif queue.is_closed():
+                break
+
+
+class ConflationStage(object):
+    """ Latest-value conflation in front of the publisher.
+        Items with a conflation key (i.e. a DATASTREAM) are forwarded at most once every "min_interval" seconds:
+        meanwhile only the latest item is kept, the older ones are discarded.
+    """
+
+    def __init__(self, forward_function: Callable[[PublishItem], bool], name: str = "conflation"):
+        """
+        :param forward_function: The function called to publish (or enqueue) an item, it returns True on success.
+        :param name: The name of the thread that releases the held items.
+        """
+        self._forward_function = forward_function
+        self._name = name
+        self._mutex = Lock()
+        self._wake_up = Condition(self._mutex)
+        self._held = {}  # conflation key -> latest item waiting for the end of the interval
+        self._deadlines = []  # heap of (release time, conflation key)
+        self._last_forward = {}  # conflation key -> time of the last forwarded item
+        self._conflated = 0
+        self._thread = None
+        self._stopped = False
+
+    def submit(self, item: PublishItem, min_interval: float = 0.0) -> bool:
+        """ Forward an item or hold it until the end of the minimum interval of its DATASTREAM.
+
+        :return: True if the item was forwarded (or held), False if the forward function failed.
+        """
+        if self._stopped:
+            return self._forward_function(item)
+
+        key = item.conflation_key
+        now = time.monotonic()
+        with self._mutex:
+            if key in self._held:
+                self._held[key] = item
+                self._conflated += 1
+                return True
+
+            last_forward = self._last_forward.get(key)
+            if last_forward is not None and now - last_forward < min_interval:
+                self._held[key] = item
+                heapq.heappush(self._deadlines, (last_forward + min_interval, key))
+                if not self._thread:
+                    self._thread = Thread(target=self._release_held_items, name=self._name, daemon=True)
+                    self._thread.start()
+                self._wake_up.notify()
+                return True
+
+            self._last_forward[key] = now
+        return self._forward_function(item)
+
+    def _release_held_items(self):
+        while True:
+            with self._mutex:
+                while not self._deadlines or self._deadlines[0][0] > time.monotonic():
+                    self._wake_up.wait(self._deadlines[0][0] - time.monotonic() if self._deadlines else None)
+                _, key = heapq.heappop(self._deadlines)
+                item = self._held.pop(key)
+                self._last_forward[key] = time.monotonic()
+            try:
+                self._forward_function(item)
+            except Exception as ex:
+                logging.error("Exception caught in conflation stage: {0}".format(ex))
+
+    def stop(self) -> int:
+        """ Forward immediately the held items, from now on items are never held (e.g. during the shutdown).
+
+        :return: The number of forwarded items.
+        """
+        with self._mutex:
+            self._stopped = True
+            held = list(self._held.values())
+            self._held.clear()
+            self._deadlines.clear()
+        for item in held:
+            self._forward_function(item)
+        return len(held)
+
+    def get_held(self) -> int:
+        return len(self._held)
+
+    def get_conflated(self) -> int:
+        return self._conflated
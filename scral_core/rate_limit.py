@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#############################################################################
+#      _____ __________  ___    __                                          #
+#     / ___// ____/ __ \/   |  / /                                          #
+#     \__ \/ /   / /_/ / /| | / /                                           #
+#    ___/ / /___/ _, _/ ___ |/ /___                                         #
+#   /____/\____/_/ |_/_/  |_/_____/   Smart City Resource Adaptation Layer  #
+#                                                                           #
+# LINKS Foundation, (c) 2017-2020                                           #
+# developed by Jacopo Foglietti & Luca Mannella                             #
+# SCRAL is distributed under a BSD-style license -- See file LICENSE.md     #
+#                                                                           #
+#############################################################################
+"""
+    SCRAL - rate_limit
+    This file contains the token buckets that limit the rate of the messages of each device (or of each key),
+    used by the SCRALModule device rate limit and by the log sampler.
+"""
+
+import time
+from collections import OrderedDict
+from threading import Lock
+from typing import Dict, Optional
+
+from scral_core.constants import DEFAULT_DEVICE_BURST
+
+
+class TokenBucket(object):
+    """ A token bucket rate limiter: "rate" tokens per second, at most "burst" tokens accumulated. """
+
+    __slots__ = ("_rate", "_burst", "_tokens", "_last_refill")
+
+    def __init__(self, rate: float, burst: float):
+        self._rate = rate
+        self._burst = burst
+        self._tokens = burst
+        self._last_refill = time.monotonic()
+
+    def consume(self) -> bool:
+        """ Take a token, False if no token is available. """
+        now = time.monotonic()
+        self._tokens = min(self._burst, self._tokens + (now - self._last_refill) * self._rate)
+        self._last_refill = now
+        if self._tokens < 1:
+            return False
+        self._tokens -= 1
+        return True
+
+    def get_last_use(self) -> float:
+        """ The time (time.monotonic) of the last "consume". """
+        return self._last_refill
+
+
+class DeviceRateLimiter(object):
+    """ A token bucket for each device, exceeding messages are discarded and counted.
+        A bucket unused for longer than its refill period ("burst" / "rate" seconds) is full again, so it is
+        released: only the buckets of the recently active devices are kept.
+    """
+
+    def __init__(self, rate: float, burst: float = DEFAULT_DEVICE_BURST):
+        """
+        :param rate: The maximum number of messages per second of each device.
+        :param burst: The maximum number of messages that a device can send at once.
+        """
+        self._rate = rate
+        self._burst = max(1.0, burst)
+        self._refill_period = self._burst / rate
+        self._buckets = OrderedDict()  # device id -> TokenBucket, from the least to the most recently used
+        self._dropped = {}  # device id -> number of discarded messages
+        self._mutex = Lock()
+
+    def allow(self, device_id: Optional[str]) -> bool:
+        """ True if the device did not exceed its rate, otherwise the message has to be discarded. """
+        with self._mutex:
+            bucket = self._buckets.get(device_id)
+            if bucket is None:
+                self._release_idle_buckets()
+                bucket = self._buckets[device_id] = TokenBucket(self._rate, self._burst)
+            else:
+                self._buckets.move_to_end(device_id)
+            if bucket.consume():
+                return True
+            self._dropped[device_id] = self._dropped.get(device_id, 0) + 1
+            return False
+
+    def _release_idle_buckets(self):
+        """ Release the buckets that are full again (it has to be called holding the mutex). """
+        idle_before = time.monotonic() - self._refill_period
+        while self._buckets:
+            device_id, bucket = next(iter(self._buckets.items()))
+            if bucket.get_last_use() > idle_before:
+                break
+            del self._buckets[device_id]
+
+    def forget(self, device_id: Optional[str]):
+        """ Release the bucket of a device (e.g. when it is deleted). """
+        with self._mutex:
+            self._buckets.pop(device_id, None)
+
+    def get_rate(self) -> float:
+        return self._rate
+
+    def get_buckets(self) -> int:
+        """ The number of devices with a bucket (the recently active ones). """
+        return len(self._buckets)
+
+    def get_dropped(self) -> Dict[Optional[str], int]:
+        with self._mutex:
+            return dict(self._dropped)
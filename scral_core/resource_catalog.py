@@ -0,0 +1,662 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#############################################################################
+#      _____ __________  ___    __                                          #
+#     / ___// ____/ __ \/   |  / /                                          #
+#     \__ \/ /   / /_/ / /| | / /                                           #
+#    ___/ / /___/ _, _/ ___ |/ /___                                         #
+#   /____/\____/_/ |_/_/  |_/_____/   Smart City Resource Adaptation Layer  #
+#                                                                           #
+# LINKS Foundation, (c) 2017-2020                                           #
+# developed by Jacopo Foglietti & Luca Mannella                             #
+# SCRAL is distributed under a BSD-style license -- See file LICENSE.md     #
+#                                                                           #
+#############################################################################
+"""
+    SCRAL - resource_catalog
+    This file contains the backends of the resource catalog of a SCRALModule: device id -> entry (a dictionary with
+    the DATASTREAM id of each OBSERVED PROPERTY and other device information).
+    Each backend behaves as a dictionary ("in", "[]", "del", iteration), the changes of an entry are written on disk
+    only calling "flush" (SCRALModule does it in "update_file_catalog", or through a CatalogFlusher thread that
+    coalesces the changes of many devices in a single write).
+    Each backend keeps a reverse index (DATASTREAM id -> device and OBSERVED PROPERTY), updated with every change:
+    entries are CatalogEntry dictionaries that notify their changes to the catalog.
+    Catalogs are shared by REST, MQTT and polling threads: reads of registered devices do not take locks, changes
+    are serialized by the catalog mutex and "register_if_absent" registers each device only once.
+"""
+
+import json
+import logging
+import os
+import sqlite3
+import time
+import weakref
+import zlib
+from collections import OrderedDict
+from collections.abc import MutableMapping
+from threading import Thread, Lock, RLock, Event
+from typing import Callable, Iterable, Iterator, List, Optional, Tuple
+
+from scral_core.catalog_store import JournaledCatalogStore
+from scral_core.constants import CATALOG_BACKEND_JSON, CATALOG_BACKEND_SQLITE, CATALOG_SQLITE_SUFFIX, \
+    DEFAULT_CATALOG_FLUSH_INTERVAL, DEFAULT_CATALOG_FLUSH_CHANGES, CATALOG_REGISTRATION_LOCKS, \
+    DEFAULT_CATALOG_CACHE_SIZE, CATALOG_PAGE_SIZE
+
+
+def is_datastream_id(value) -> bool:
+    """ In a catalog entry, DATASTREAM ids are the integer values (other values are device information). """
+    return isinstance(value, int) and not isinstance(value, bool)
+
+
+def get_datastreams(entry: dict) -> List[Tuple[str, int]]:
+    """ The (OBSERVED PROPERTY, DATASTREAM id) pairs of a catalog entry. """
+    return [(key, value) for key, value in entry.items() if is_datastream_id(value)]
+
+
+class CatalogEntry(dict):
+    """ An entry of a ResourceCatalog: each change is notified to the catalog (holding its mutex), so its reverse index
+        is always updated. When the entry is removed from the catalog, it becomes a simple dictionary.
+    """
+
+    def __init__(self, catalog: "ResourceCatalog", device_id: str, entry: dict):
+        super().__init__(entry)
+        self._catalog = catalog
+        self._device_id = device_id
+
+    def __setitem__(self, key, value):
+        catalog = self._catalog
+        if catalog is None:
+            return super().__setitem__(key, value)
+        with catalog.get_mutex():
+            old_value = self.get(key)
+            super().__setitem__(key, value)
+            catalog.property_changed(self._device_id, key, old_value, value)
+
+    def __delitem__(self, key):
+        catalog = self._catalog
+        if catalog is None:
+            return super().__delitem__(key)
+        with catalog.get_mutex():
+            old_value = self[key]
+            super().__delitem__(key)
+            catalog.property_changed(self._device_id, key, old_value, None)
+
+    def pop(self, key, *default):
+        if key not in self:
+            return super().pop(key, *default)
+        value = self[key]
+        del self[key]
+        return value
+
+    def popitem(self):
+        if not self:
+            return super().popitem()  # KeyError
+        key = list(self.keys())[-1]
+        return key, self.pop(key)
+
+    def setdefault(self, key, default=None):
+        if key not in self:
+            self[key] = default
+        return self[key]
+
+    def update(self, *args, **kwargs):
+        for key, value in dict(*args, **kwargs).items():
+            self[key] = value
+
+    def clear(self):
+        for key in list(self.keys()):
+            del self[key]
+
+    def copy(self) -> dict:
+        return dict(self)
+
+    def __reduce__(self):
+        return dict, (dict(self),)  # copies (e.g. deepcopy) are simple dictionaries
+
+    def detach(self):
+        """ Stop notifying the changes (the entry was removed from the catalog). """
+        self._catalog = None
+
+
+class ResourceCatalog(MutableMapping):
+    """ The interface of a resource catalog backend. """
+
+    def get_mutex(self) -> RLock:
+        """ The mutex protecting the catalog and its reverse index. """
+        raise NotImplementedError
+
+    def property_changed(self, device_id: str, property_name: str, old_value, new_value):
+        """ Called (holding the catalog mutex) when a value of an entry is changed, None means no value. """
+        raise NotImplementedError
+
+    def _wrap(self, device_id: str, entry):
+        return CatalogEntry(self, device_id, entry) if isinstance(entry, dict) else entry
+
+    def setdefault(self, device_id: str, default=None):
+        with self.get_mutex():
+            if device_id not in self:
+                self[device_id] = default
+            return self[device_id]  # the stored entry, not "default"
+
+    def snapshot(self) -> dict:
+        """ A consistent copy of the catalog (simple dictionaries), e.g. to serialize it while it is changing. """
+        with self.get_mutex():
+            return dict(self.iter_entries())
+
+    def iter_entries(self) -> Iterator[Tuple[str, dict]]:
+        """ Iterate over copies (simple dictionaries) of the entries, e.g. to list the catalog.
+            Backends not kept in memory read the entries a page at a time.
+        """
+        for device_id in self:
+            entry = self.get(device_id)
+            if entry is not None:  # unless it was removed meanwhile
+                yield device_id, dict(entry) if isinstance(entry, dict) else entry
+
+    def _get_registration_lock(self, device_id: str) -> RLock:
+        """ The registrations of a device are serialized by one of the registration locks (the same for a device). """
+        return self._registration_locks[zlib.crc32(str(device_id).encode("utf-8")) % len(self._registration_locks)]
+
+    def register_if_absent(self, device_id: str,
+                           build_entry: Callable[[], Optional[dict]]) -> Tuple[Optional[dict], bool]:
+        """ Add a device only if it is not in the catalog. Concurrent registrations of the same device are serialized,
+            so "build_entry" (e.g. registering DATASTREAMs on the OGC server) is executed only once for a device.
+            The catalog is not locked while the entry is built: other devices can be read and registered meanwhile.
+            Other threads see the device only when its entry is complete.
+
+        :param device_id: The device to register.
+        :param build_entry: It returns the complete entry of the device, None if the registration failed.
+        :return: The entry of the device (None if the registration failed) and True if it was added by this call.
+        """
+        entry = self.get(device_id)
+        if entry is not None:
+            return entry, False
+        with self._get_registration_lock(device_id):
+            entry = self.get(device_id)
+            if entry is not None:
+                return entry, False
+            entry = build_entry()
+            if entry is None:
+                return None, False
+            self[device_id] = entry
+            return self[device_id], True
+
+    def register(self, device_id: str, build_entry: Callable[[], Optional[dict]]) -> Optional[dict]:
+        """ Add a device or replace its entry (explicit re-registration). It is serialized with "register_if_absent",
+            so a concurrent automatic registration of the same device never overwrites (or is overwritten by) it.
+
+        :param device_id: The device to register.
+        :param build_entry: It returns the complete entry of the device, None if the registration failed.
+        :return: The entry of the device, None if the registration failed (the previous entry is kept).
+        """
+        with self._get_registration_lock(device_id):
+            entry = build_entry()
+            if entry is None:
+                return None
+            self[device_id] = entry
+            return self[device_id]
+
+    def register_datastream_if_absent(self, device_id: str, property_name: str,
+                                      build_datastream: Callable[[], Optional[int]]) -> Tuple[Optional[int], bool]:
+        """ Add the DATASTREAM of an OBSERVED PROPERTY to a registered device only if it is not in its entry.
+            As in "register_if_absent", "build_datastream" is executed only once for a device and a property.
+
+        :param device_id: The registered device.
+        :param property_name: The name of the OBSERVED PROPERTY.
+        :param build_datastream: It returns the DATASTREAM id, None if the registration failed.
+        :return: The DATASTREAM id (None if the registration failed) and True if it was added by this call.
+        :raise KeyError: If the device is not in the catalog.
+        """
+        datastream_id = self[device_id].get(property_name)
+        if datastream_id is not None:
+            return datastream_id, False
+        with self._get_registration_lock(device_id):
+            datastream_id = self[device_id].get(property_name)
+            if datastream_id is not None:
+                return datastream_id, False
+            datastream_id = build_datastream()
+            if datastream_id is None:
+                return None, False
+            self[device_id][property_name] = datastream_id
+            return datastream_id, True
+
+    def flush(self, keys: Optional[Iterable[str]] = None):
+        """ Write on disk the current entries of some devices (or their removal).
+
+        :param keys: [OPT] The changed devices, if not specified the whole catalog is written.
+        :raise OSError: If the catalog cannot be written.
+        """
+        raise NotImplementedError
+
+    def find_devices(self, property_name: str) -> List[str]:
+        """ The devices with a DATASTREAM of an OBSERVED PROPERTY. """
+        raise NotImplementedError
+
+    def find_datastream(self, datastream_id: int) -> Optional[Tuple[str, str]]:
+        """ The device and the OBSERVED PROPERTY of a DATASTREAM, None if it is not in the catalog. """
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+    def get_path(self) -> str:
+        raise NotImplementedError
+
+
+class JSONResourceCatalog(dict, ResourceCatalog):
+    """ The resource catalog kept in memory and written as a JSON file (with a journal of the changes).
+        The reverse index is a dictionary in memory.
+    """
+
+    def __init__(self, path: str):
+        """
+        :param path: The catalog file.
+        """
+        super().__init__()
+        self._mutex = RLock()  # reads ("in", "[]", "get") are atomic dictionary operations and do not take it
+        self._registration_locks = [RLock() for _ in range(CATALOG_REGISTRATION_LOCKS)]
+        self._datastreams = {}  # DATASTREAM id -> (device id, OBSERVED PROPERTY)
+        self._store = JournaledCatalogStore(path)
+        if self._store.exists():
+            self.update(self._store.load())
+
+    def __setitem__(self, device_id: str, entry):
+        with self._mutex:
+            self._unindex(device_id, dict.get(self, device_id))
+            entry = self._wrap(device_id, entry)
+            dict.__setitem__(self, device_id, entry)  # an existing device keeps its position
+            if isinstance(entry, dict):
+                for property_name, datastream_id in get_datastreams(entry):
+                    self.property_changed(device_id, property_name, None, datastream_id)
+
+    def __delitem__(self, device_id: str):
+        with self._mutex:
+            self._unindex(device_id, dict.pop(self, device_id))
+
+    def __iter__(self):
+        return iter(list(dict.keys(self)))  # the devices registered meanwhile do not break the iteration
+
+    def _unindex(self, device_id: str, entry):
+        if isinstance(entry, CatalogEntry):
+            entry.detach()
+        if isinstance(entry, dict):
+            for property_name, datastream_id in get_datastreams(entry):
+                self.property_changed(device_id, property_name, datastream_id, None)
+
+    def pop(self, device_id: str, *default):
+        with self._mutex:
+            if device_id not in self:
+                return dict.pop(self, device_id, *default)
+            entry = self[device_id]
+            del self[device_id]
+            return entry
+
+    def popitem(self):
+        with self._mutex:
+            device_id, entry = dict.popitem(self)
+            self._unindex(device_id, entry)
+            return device_id, entry
+
+    setdefault = ResourceCatalog.setdefault  # instead of the dict one
+
+    def update(self, *args, **kwargs):
+        with self._mutex:
+            for device_id, entry in dict(*args, **kwargs).items():
+                self[device_id] = entry
+
+    def clear(self):
+        with self._mutex:
+            for device_id in list(self.keys()):
+                del self[device_id]
+
+    def get_mutex(self) -> RLock:
+        return self._mutex
+
+    def property_changed(self, device_id: str, property_name: str, old_value, new_value):
+        if is_datastream_id(old_value) and self._datastreams.get(old_value) == (device_id, property_name):
+            del self._datastreams[old_value]
+        if is_datastream_id(new_value):
+            self._datastreams[new_value] = (device_id, property_name)
+
+    def flush(self, keys: Optional[Iterable[str]] = None):
+        self._store.save(self, keys)
+
+    def find_devices(self, property_name: str) -> List[str]:
+        return [device_id for device_id, entry in list(self.items())
+                if isinstance(entry, dict) and property_name in dict(get_datastreams(entry))]
+
+    def find_datastream(self, datastream_id: int) -> Optional[Tuple[str, str]]:
+        return self._datastreams.get(datastream_id)
+
+    def close(self):
+        self._store.close()
+
+    def get_path(self) -> str:
+        return self._store.get_path()
+
+
+class SQLiteResourceCatalog(ResourceCatalog):
+    """ The resource catalog stored in an SQLite database (in WAL mode), indexed by device and by DATASTREAM id.
+        Entries are read from the database only when they are accessed, changes are written in a transaction
+        committed by "flush". The reverse index is the "datastreams" table, updated (in the same transaction) with
+        every change of an entry.
+        Only the "cache_size" most recently used entries and the ones changed since the last flush are kept in memory.
+        An entry still used by a thread (e.g. a module changing it) is always the same object, even if it is not cached.
+    """
+
+    def __init__(self, path: str, cache_size: int = DEFAULT_CATALOG_CACHE_SIZE):
+        """
+        :param path: The database file.
+        :param cache_size: How many entries (the most recently used) are kept in memory.
+        """
+        folder = os.path.dirname(path)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+        self._path = path
+        self._mutex = RLock()
+        self._registration_locks = [RLock() for _ in range(CATALOG_REGISTRATION_LOCKS)]
+        self._entries = weakref.WeakValueDictionary()  # device id -> entry, all the entries in use
+        self._cache = OrderedDict()  # device id -> entry, from the least to the most recently used
+        self._cache_size = max(0, cache_size)
+        self._dirty = {}  # device id -> entry (None if removed), changed since the last flush
+        self._closed = False
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        with self._mutex:
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.execute("PRAGMA synchronous=NORMAL")
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS devices (device_id TEXT PRIMARY KEY, entry TEXT NOT NULL)")
+            # the DATASTREAM id column has no type: integer ids are kept as integers
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS datastreams (device_id TEXT NOT NULL, property TEXT NOT NULL, "
+                "datastream_id NOT NULL, PRIMARY KEY (device_id, property))")
+            self._connection.execute(
+                "CREATE INDEX IF NOT EXISTS datastreams_by_id ON datastreams (datastream_id)")
+            self._connection.execute(
+                "CREATE INDEX IF NOT EXISTS datastreams_by_property ON datastreams (property)")
+            self._connection.commit()
+
+    def __getitem__(self, device_id: str) -> dict:
+        entry = self._entries.get(device_id)  # entries in use are returned without locking the connection
+        if entry is not None:
+            return entry
+        with self._mutex:
+            entry = self._entries.get(device_id)
+            if entry is None:
+                row = self._connection.execute(
+                    "SELECT entry FROM devices WHERE device_id = ?", (device_id,)).fetchone()
+                if row is None:
+                    raise KeyError(device_id)
+                entry = self._wrap(device_id, json.loads(row[0]))
+                self._keep(device_id, entry)
+            return entry
+
+    def __setitem__(self, device_id: str, entry: dict):
+        with self._mutex:
+            self._detach(device_id)
+            entry = self._wrap(device_id, entry)
+            self._keep(device_id, entry)
+            self._dirty[device_id] = entry
+            self._write(device_id, entry)
+
+    def __delitem__(self, device_id: str):
+        with self._mutex:
+            if device_id not in self:
+                raise KeyError(device_id)
+            self._detach(device_id)
+            self._dirty[device_id] = None
+            self._remove(device_id)
+
+    def _keep(self, device_id: str, entry):
+        """ Add an entry to the cache, evicting the least recently used ones (it has to be called holding the mutex). """
+        if isinstance(entry, dict):
+            self._entries[device_id] = entry
+        if self._cache_size:
+            self._cache[device_id] = entry
+            self._cache.move_to_end(device_id)
+            while len(self._cache) > self._cache_size:
+                self._cache.popitem(last=False)
+
+    def _detach(self, device_id: str):
+        self._cache.pop(device_id, None)
+        entry = self._entries.pop(device_id, None)
+        if isinstance(entry, CatalogEntry):
+            entry.detach()
+
+    def __contains__(self, device_id) -> bool:
+        if device_id in self._entries:
+            return True
+        with self._mutex:
+            if device_id in self._entries:
+                return True
+            return self._connection.execute(
+                "SELECT 1 FROM devices WHERE device_id = ?", (device_id,)).fetchone() is not None
+
+    def __iter__(self):
+        with self._mutex:
+            device_ids = [row[0] for row in self._connection.execute("SELECT device_id FROM devices ORDER BY rowid")]
+        return iter(device_ids)
+
+    def __len__(self) -> int:
+        with self._mutex:
+            return self._connection.execute("SELECT COUNT(*) FROM devices").fetchone()[0]
+
+    def iter_entries(self) -> Iterator[Tuple[str, dict]]:
+        """ The entries are read a page at a time, without adding them to the cache. """
+        last_rowid = 0
+        while True:
+            with self._mutex:
+                rows = self._connection.execute(
+                    "SELECT rowid, device_id, entry FROM devices WHERE rowid > ? ORDER BY rowid LIMIT ?",
+                    (last_rowid, CATALOG_PAGE_SIZE)).fetchall()
+                # entries in use could have been changed in place (and not yet written)
+                page = [(device_id, self._entries.get(device_id), entry) for _, device_id, entry in rows]
+                page = [(device_id, dict(entry) if entry is not None else json.loads(row_entry))
+                        for device_id, entry, row_entry in page]
+            yield from page
+            if len(rows) < CATALOG_PAGE_SIZE:
+                return
+            last_rowid = rows[-1][0]
+
+    def _write(self, device_id: str, entry: dict):
+        """ Write an entry in the current transaction (the device keeps its position, if already stored). """
+        row = (json.dumps(entry), device_id)
+        if not self._connection.execute("UPDATE devices SET entry = ? WHERE device_id = ?", row).rowcount:
+            self._connection.execute("INSERT INTO devices (entry, device_id) VALUES (?, ?)", row)
+        self._connection.execute("DELETE FROM datastreams WHERE device_id = ?", (device_id,))
+        if isinstance(entry, dict):
+            self._connection.executemany(
+                "INSERT INTO datastreams (device_id, property, datastream_id) VALUES (?, ?, ?)",
+                [(device_id, property_name, datastream_id) for property_name, datastream_id in get_datastreams(entry)])
+
+    def get_mutex(self) -> RLock:
+        return self._mutex
+
+    def property_changed(self, device_id: str, property_name: str, old_value, new_value):
+        # the entry and its DATASTREAMs are written in the current transaction, so they are always consistent
+        entry = self._entries[device_id]  # the changed entry is in use
+        self._dirty[device_id] = entry
+        self._write(device_id, entry)
+
+    def _remove(self, device_id: str):
+        self._connection.execute("DELETE FROM devices WHERE device_id = ?", (device_id,))
+        self._connection.execute("DELETE FROM datastreams WHERE device_id = ?", (device_id,))
+
+    def flush(self, keys: Optional[Iterable[str]] = None):
+        """ Commit the changes. The entries of the changed devices (all of them if "keys" is not specified) are
+            written again, because they could have been changed in place.
+            After "close", the changes were already committed and nothing is done.
+        """
+        with self._mutex:
+            if self._closed:
+                logging.debug("SQLite resource catalog <" + self._path + "> already closed, nothing to flush.")
+                return
+            if keys is None:
+                keys = list(self._dirty.keys())
+            try:
+                for device_id in keys:
+                    entry = self._entries.get(device_id)
+                    if entry is not None:
+                        self._write(device_id, entry)
+                    elif device_id not in self:
+                        self._remove(device_id)
+                self._connection.commit()
+            except sqlite3.Error as ex:
+                try:
+                    self._connection.rollback()
+                except sqlite3.Error:
+                    pass
+                raise OSError("SQLite resource catalog <" + self._path + ">: " + str(ex))
+            for device_id in keys:
+                self._dirty.pop(device_id, None)
+
+    def find_devices(self, property_name: str) -> List[str]:
+        with self._mutex:
+            return [row[0] for row in self._connection.execute(
+                "SELECT device_id FROM datastreams WHERE property = ?", (property_name,))]
+
+    def find_datastream(self, datastream_id: int) -> Optional[Tuple[str, str]]:
+        with self._mutex:
+            row = self._connection.execute(
+                "SELECT device_id, property FROM datastreams WHERE datastream_id = ?", (datastream_id,)).fetchone()
+        return tuple(row) if row else None
+
+    def close(self):
+        with self._mutex:
+            if self._closed:
+                return
+            self._closed = True
+            self._connection.commit()
+            self._connection.close()
+
+    def get_cached_entries(self) -> int:
+        """ The number of entries kept in memory (cached or changed and not yet flushed). """
+        return len(set(self._cache) | set(self._dirty))
+
+    def get_path(self) -> str:
+        return self._path
+
+
+class CatalogFlusher(Thread):
+    """ This thread writes the resource catalog in background: changed devices are only marked as dirty and their
+        entries are written together every "interval" seconds (or as soon as "max_changes" devices are changed).
+    """
+
+    def __init__(self, catalog: ResourceCatalog, interval: float = DEFAULT_CATALOG_FLUSH_INTERVAL,
+                 max_changes: int = DEFAULT_CATALOG_FLUSH_CHANGES):
+        """
+        :param catalog: The resource catalog.
+        :param interval: The maximum time (in seconds) that a change waits before being written.
+        :param max_changes: The number of dirty devices that triggers a write before the interval.
+        """
+        super().__init__(name="catalog-flusher", daemon=True)
+        self._catalog = catalog
+        self._interval = interval
+        self._max_changes = max(1, max_changes)
+
+        self._dirty = set()  # devices changed since the last write
+        self._dirty_all = False  # the whole catalog has to be written
+        self._dirty_mutex = Lock()
+        self._flush_mutex = Lock()  # a single write at a time, so the journal records keep the order of the changes
+        self._wakeup = Event()
+        self._stop_event = Event()
+
+        self._flushes = 0
+        self._changes = 0
+        self._errors = 0
+        self._last_duration = 0.0
+
+    def mark_dirty(self, device_id: Optional[str] = None):
+        """ Schedule the write of a device entry (or of its removal).
+            When the flusher is stopped, it is written immediately by the calling thread.
+
+        :param device_id: [OPT] The changed device, if not specified the whole catalog is written.
+        """
+        with self._dirty_mutex:
+            if device_id is None:
+                self._dirty_all = True
+            else:
+                self._dirty.add(device_id)
+            urgent = self._dirty_all or len(self._dirty) >= self._max_changes
+        if self._stop_event.is_set():
+            self.flush()
+        elif urgent:
+            self._wakeup.set()
+
+    def run(self):
+        while not self._stop_event.is_set():
+            self._wakeup.wait(self._interval)
+            self._wakeup.clear()
+            self.flush()
+        self.flush()
+
+    def flush(self) -> bool:
+        """ Write the pending changes.
+
+        :return: False if the catalog could not be written (the changes are kept for the next attempt).
+        """
+        with self._flush_mutex:
+            with self._dirty_mutex:
+                dirty, dirty_all = self._dirty, self._dirty_all
+                self._dirty, self._dirty_all = set(), False
+            if not dirty and not dirty_all:
+                return True
+
+            start = time.monotonic()
+            try:
+                self._catalog.flush(None if dirty_all else dirty)
+            except OSError as ex:
+                logging.error("Impossible to write the resource catalog: " + str(ex))
+                self._errors += 1
+                with self._dirty_mutex:
+                    self._dirty |= dirty
+                    self._dirty_all |= dirty_all
+                return False
+            self._last_duration = time.monotonic() - start
+            self._flushes += 1
+            self._changes += len(dirty)
+            return True
+
+    def stop(self, timeout: Optional[float] = None):
+        """ Stop the thread writing the pending changes, the following ones are written immediately. """
+        self._stop_event.set()
+        self._wakeup.set()
+        if self.is_alive():
+            self.join(timeout)
+        else:
+            self.flush()
+
+    def pending(self) -> int:
+        """ The number of devices changed and not yet written. """
+        return len(self._dirty)
+
+    def get_stats(self) -> dict:
+        return {"pending": len(self._dirty), "flushes": self._flushes, "changes": self._changes,
+                "errors": self._errors, "last_duration": self._last_duration}
+
+
+def open_resource_catalog(json_path: str, backend: str = CATALOG_BACKEND_JSON,
+                          cache_size: int = DEFAULT_CATALOG_CACHE_SIZE) -> ResourceCatalog:
+    """ Open the resource catalog of a SCRALModule.
+        The first time the SQLite backend is used, the devices of the JSON catalog (if any) are imported.
+
+    :param json_path: The JSON catalog file (the SQLite database has the same name with ".sqlite" extension).
+    :param backend: "json" or "sqlite".
+    :param cache_size: Used only by the SQLite backend, how many entries are kept in memory.
+    :raise ValueError: If the backend is unknown.
+    """
+    if backend == CATALOG_BACKEND_JSON:
+        return JSONResourceCatalog(json_path)
+    if backend != CATALOG_BACKEND_SQLITE:
+        raise ValueError('Unknown resource catalog backend: "' + str(backend) + '"')
+
+    sqlite_path = os.path.splitext(json_path)[0] + CATALOG_SQLITE_SUFFIX
+    imported = not os.path.exists(sqlite_path) and JournaledCatalogStore(json_path).exists()
+    catalog = SQLiteResourceCatalog(sqlite_path, cache_size)
+    if imported:
+        json_catalog = JSONResourceCatalog(json_path)
+        for device_id, entry in json_catalog.items():
+            catalog[device_id] = entry
+        json_catalog.close()
+        catalog.flush()
+        logging.info(str(len(catalog)) + " device(s) imported in <" + sqlite_path + "> from <" + json_path + ">.")
+    return catalog
@@ -28,16 +28,20 @@ import os
 import logging
 from typing import Optional
 
-from flask import Flask, make_response, jsonify, Response
+from flask import Flask, make_response, jsonify, Response, request, g
 import cherrypy
 from cheroot.wsgi import Server as WSGIServer, PathInfoDispatcher
 
 import scral_core.util as util
+from scral_core import log_util
 from scral_core.ogc_configuration import OGCConfiguration
 from scral_core.constants import CATALOG_FILENAME, D_CONFIG_KEY, ENABLE_FLASK, ENABLE_CHERRYPY, ENABLE_WSGISERVER, \
     SUCCESS_RETURN_STRING, SUCCESS_DELETE, ERROR_RETURN_STRING, ERROR_DELETE, ERROR_MISSING_ENV_VARIABLE, REST_KEY, \
     LISTENING_ADD_KEY, PORT_KEY, ADDRESS_KEY, D_CUSTOM_MODE, ERROR_MISSING_CONNECTION_FILE, LISTENING_PORT_KEY, \
-    DEFAULT_LISTENING_ADD, DEFAULT_LISTENING_PORT
+    DEFAULT_LISTENING_ADD, DEFAULT_LISTENING_PORT, PUBLISHER_SATURATED, SATURATION_RETRY_AFTER, WRONG_REQUEST, \
+    URI_DEAD_LETTERS, URI_DEAD_LETTERS_COUNT, URI_DEAD_LETTERS_REPLAY, DEAD_LETTERS_DISABLED, REPLAY_IN_PROGRESS, \
+    SHUTTING_DOWN, URI_DATASTREAMS, DATASTREAM_NOT_FOUND, EXECUTOR_SATURATED
+from scral_core.keyed_executor import ExecutorFullError
 from scral_core.scral_module import SCRALModule
 
 
@@ -91,7 +95,23 @@ class SCRALRestModule(SCRALModule):
         """
             This method deploys a REST endpoint as using different technologies according to the "mode" value.
             This endpoint will listen for incoming REST requests on different route paths.
+            OBSERVATIONs (PUT requests) are refused with a 503 status code while the MQTT publisher (or the queue of
+            the "ordered_workers" thread in charge of the device) is saturated,
+            every request is refused during the shutdown (the ones in progress are waited for).
+            The dead-letter queue and DATASTREAM lookup endpoints are added to the ones of the module.
         """
+        flask_instance.before_request(self._check_shutdown)
+        flask_instance.before_request(self._check_publisher_saturation)
+        flask_instance.teardown_request(self._end_request)
+        flask_instance.register_error_handler(ExecutorFullError, self._executor_full_response)
+        flask_instance.add_url_rule(URI_DEAD_LETTERS, "dead_letters", self._dead_letters_endpoint,
+                                    methods=["GET", "DELETE"])
+        flask_instance.add_url_rule(URI_DEAD_LETTERS_COUNT, "dead_letters_count", self._dead_letters_count_endpoint,
+                                    methods=["GET"])
+        flask_instance.add_url_rule(URI_DEAD_LETTERS_REPLAY, "dead_letters_replay", self._dead_letters_replay_endpoint,
+                                    methods=["POST"])
+        flask_instance.add_url_rule(URI_DATASTREAMS + "/<int:datastream_id>", "datastream_lookup",
+                                    self._datastream_lookup_endpoint, methods=["GET"])
 
         if mode == ENABLE_FLASK:
             # simply run Flask
@@ -117,6 +137,110 @@ class SCRALRestModule(SCRALModule):
         else:
             raise RuntimeError("Invalid runtime mode was selected.")
 
+    def _check_shutdown(self) -> Optional[Response]:
+        """ Flask "before_request" hook: it stops every request while the module is shutting down,
+            the other ones are tracked until their end (see "_end_request").
+        """
+        if self.begin_activity():
+            g.scral_activity = True
+            return None
+        response = make_response(jsonify({ERROR_RETURN_STRING: SHUTTING_DOWN}), 503)
+        response.headers["Connection"] = "close"
+        return response
+
+    def _end_request(self, exception: Optional[BaseException] = None):
+        """ Flask "teardown_request" hook: the request tracked by "_check_shutdown" is completed. """
+        if g.pop("scral_activity", False):
+            self.end_activity()
+
+    def _check_publisher_saturation(self) -> Optional[Response]:
+        """ Flask "before_request" hook: it stops a PUT request if the publisher is saturated. """
+        if request.method == "PUT":
+            return self.saturation_response()
+        return None
+
+    def saturation_response(self) -> Optional[Response]:
+        """ This method can be used by endpoints to apply backpressure on REST clients.
+
+        :return: A 503 response with a "Retry-After" header if the MQTT publisher is saturated, None otherwise.
+        """
+        if not self.is_publisher_saturated():
+            return None
+
+        logging.warning("MQTT publisher saturated, request refused.")
+        response = make_response(jsonify({ERROR_RETURN_STRING: PUBLISHER_SATURATED}), 503)
+        response.headers["Retry-After"] = str(SATURATION_RETRY_AFTER)
+        return response
+
+    def _executor_full_response(self, ex: ExecutorFullError) -> Response:
+        """ Flask error handler: the OBSERVATION is refused because the queue of its ordered thread is full. """
+        if log_util.sampled(logging.WARNING, "executor_full"):
+            logging.warning("%s Request refused.", ex)
+        response = make_response(jsonify({ERROR_RETURN_STRING: EXECUTOR_SATURATED}), 503)
+        response.headers["Retry-After"] = str(SATURATION_RETRY_AFTER)
+        return response
+
+    def _dead_letters_endpoint(self) -> Response:
+        """ GET: list the dead letters (optional query parameters: "offset", "limit" and "device_id").
+            DELETE: purge the dead letters (all of them or the ones listed in the "ids" query parameter, e.g. 1,2,3).
+        """
+        dead_letters = self.get_dead_letters()
+        if not dead_letters:
+            return make_response(jsonify({ERROR_RETURN_STRING: DEAD_LETTERS_DISABLED}), 404)
+
+        try:
+            if request.method == "DELETE":
+                ids = request.args.get("ids")
+                ids = [int(letter_id) for letter_id in ids.split(",")] if ids else None
+                purged = dead_letters.purge(ids)
+                logging.info(str(purged) + " dead letters purged.")
+                return make_response(jsonify({"purged": purged}), 200)
+
+            offset = int(request.args.get("offset", 0))
+            limit = request.args.get("limit")
+            letters = dead_letters.get_letters(offset, int(limit) if limit else None, request.args.get("device_id"))
+        except ValueError:
+            return make_response(jsonify({ERROR_RETURN_STRING: WRONG_REQUEST}), 400)
+        return make_response(jsonify({"count": dead_letters.count(),
+                                      "dead_letters": [letter.to_dict() for letter in letters]}), 200)
+
+    def _dead_letters_count_endpoint(self) -> Response:
+        """ GET: the number of dead letters (and the number of the ones discarded because the queue was full). """
+        dead_letters = self.get_dead_letters()
+        if not dead_letters:
+            return make_response(jsonify({ERROR_RETURN_STRING: DEAD_LETTERS_DISABLED}), 404)
+        return make_response(jsonify(dead_letters.get_stats()), 200)
+
+    def _dead_letters_replay_endpoint(self) -> Response:
+        """ POST: replay the dead letters in background with a throttled rate.
+            Optional JSON payload: {"ids": [1, 2, 3], "limit": 100, "rate": 10}
+        """
+        if not self.get_dead_letters():
+            return make_response(jsonify({ERROR_RETURN_STRING: DEAD_LETTERS_DISABLED}), 404)
+
+        parameters = request.get_json(silent=True) or {}
+        try:
+            ids = [int(letter_id) for letter_id in parameters["ids"]] if parameters.get("ids") else None
+            limit = int(parameters["limit"]) if parameters.get("limit") else None
+            rate = float(parameters["rate"]) if parameters.get("rate") else None
+        except (ValueError, TypeError):
+            return make_response(jsonify({ERROR_RETURN_STRING: WRONG_REQUEST}), 400)
+
+        scheduled = self.replay_dead_letters(ids, limit, rate)
+        if scheduled is None:
+            return make_response(jsonify({ERROR_RETURN_STRING: REPLAY_IN_PROGRESS}), 409)
+        logging.info(str(scheduled) + " dead letters scheduled for replay.")
+        return make_response(jsonify({"scheduled": scheduled}), 202)
+
+    def _datastream_lookup_endpoint(self, datastream_id: int) -> Response:
+        """ GET: the device and the OBSERVED PROPERTY of a DATASTREAM registered by this module. """
+        found = self.find_datastream(datastream_id)
+        if not found:
+            return make_response(jsonify({ERROR_RETURN_STRING: DATASTREAM_NOT_FOUND}), 404)
+        device_id, property_name = found
+        return make_response(jsonify({"datastream_id": datastream_id, "device_id": device_id,
+                                      "observed_property": property_name}), 200)
+
     def delete_device(self, device_id: str, remove_only_from_catalog: bool = False) -> Response:
         result, client_fault = super().delete_device(device_id, remove_only_from_catalog)
         if result:
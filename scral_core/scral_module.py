@@ -37,22 +37,59 @@ import logging
 import os
 import random
 import sys
+import time
 from abc import abstractmethod
-from typing import Dict, Optional, Union
+from threading import Lock
+from typing import Callable, Dict, Hashable, List, Optional, Tuple, Union
 
-import arrow
 import paho.mqtt.client as mqtt
 
 from scral_core.constants import DEFAULT_KEEPALIVE, DEFAULT_MQTT_QOS, DEFAULT_UPDATE_INTERVAL, MQTT_CLIENT_PREFIX, \
-    CONFIG_PATH_KEY, OGC_FILE_KEY, REST_KEY, OGC_SERVER_ADD_KEY, COUNTER_KEY, MQTT_KEY, \
-    REGISTERED_DEVICES_KEY, LAST_UPDATE_KEY, ACTUAL_COUNTER_KEY, UPDATE_INTERVAL_KEY, ACTIVE_DEVICES_KEY, VERBOSE_KEY, \
+    CONFIG_PATH_KEY, OGC_FILE_KEY, REST_KEY, OGC_SERVER_ADD_KEY, MQTT_KEY, \
+    REGISTERED_DEVICES_KEY, LAST_UPDATE_KEY, UPDATE_INTERVAL_KEY, ACTIVE_DEVICES_KEY, VERBOSE_KEY, \
     ERROR_MISSING_OGC_FILE, ERROR_NO_SERVER_CONNECTION, ERROR_MISSING_ALL, \
     CATALOG_FOLDER, CATALOG_FILENAME, D_CUSTOM_MODE, D_CONFIG_KEY, ERROR_MISSING_ENV_VARIABLE, D_PUB_BROKER_URI_KEY, \
     D_PUB_BROKER_PORT_KEY, BROKER_DEFAULT_PORT, D_PUB_BROKER_KEEPALIVE_KEY, D_GOST_MQTT_PREFIX_KEY, DEFAULT_GOST_PREFIX, \
-    MQTT_PUB_BROKER_KEY, MQTT_PUB_BROKER_PORT_KEY, MQTT_PUB_BROKER_KEEP_KEY, GOST_PREFIX_KEY
+    MQTT_PUB_BROKER_KEY, MQTT_PUB_BROKER_PORT_KEY, MQTT_PUB_BROKER_KEEP_KEY, GOST_PREFIX_KEY, \
+    PUBLISH_PIPELINE_KEY, PIPELINE_QUEUE_SIZE_KEY, PIPELINE_BATCH_SIZE_KEY, PIPELINE_LINGER_KEY, \
+    PIPELINE_WORKERS_KEY, DEFAULT_PIPELINE_QUEUE_SIZE, DEFAULT_PIPELINE_BATCH_SIZE, DEFAULT_PIPELINE_LINGER, \
+    DEFAULT_PIPELINE_WORKERS, LAG_METRIC_KEY, MAX_INFLIGHT_MESSAGES_KEY, MAX_QUEUED_MESSAGES_KEY, \
+    DEFAULT_MAX_INFLIGHT_MESSAGES, DEFAULT_MAX_QUEUED_MESSAGES, OVERFLOW_POLICY_KEY, DEFAULT_OVERFLOW_POLICY, \
+    OVERFLOW_BLOCK_TIMEOUT_KEY, DEFAULT_OVERFLOW_BLOCK_TIMEOUT, OVERFLOW_POLICIES, ERROR_MISSING_PARAMETER, \
+    SPOOL_KEY, SPOOL_FOLDER_KEY, SPOOL_FOLDER, SPOOL_MAX_SIZE_KEY, SPOOL_MAX_AGE_KEY, SPOOL_SEGMENT_SIZE_KEY, \
+    SPOOL_FSYNC_BATCH_KEY, SPOOL_FSYNC_INTERVAL_KEY, SPOOL_REPLAY_RATE_KEY, DEFAULT_SPOOL_MAX_SIZE, \
+    DEFAULT_SPOOL_MAX_AGE, DEFAULT_SPOOL_SEGMENT_SIZE, DEFAULT_SPOOL_FSYNC_BATCH, DEFAULT_SPOOL_FSYNC_INTERVAL, \
+    DEFAULT_SPOOL_REPLAY_RATE, PUBLISHER_CONNECTIONS_KEY, DEFAULT_PUBLISHER_CONNECTIONS, PUBLISHER_BACKEND_KEY, \
+    DEFAULT_PUBLISHER_BACKEND, ASYNCIO_BACKEND, PAHO_BACKEND, PROTOCOL_VERSION_KEY, DEFAULT_PROTOCOL_VERSION, \
+    TOPIC_ALIAS_MAXIMUM_KEY, DEFAULT_TOPIC_ALIAS_MAXIMUM, MQTT_V5, PAYLOAD_ENCODING_KEY, DEFAULT_PAYLOAD_ENCODING, \
+    PAYLOAD_COMPRESSION_KEY, ZSTD_DICTIONARY_KEY, ZSTD_LEVEL_KEY, DEFAULT_ZSTD_LEVEL, CONTENT_TYPE_MARKER_KEY, \
+    DEFAULT_CONTENT_TYPE_MARKER, CONTENT_TYPE_PROPERTY, CONTENT_TYPE_TOPIC, CONFLATION_KEY, PRIORITIES_KEY, \
+    PRIORITY_LANES, DEFAULT_PRIORITY, PRIORITY_HIGH, DEVICE_QUEUE_SIZE_KEY, DEVICE_WEIGHTS_KEY, DEVICE_RATE_LIMIT_KEY, \
+    DEVICE_BURST_KEY, DEFAULT_DEVICE_QUEUE_SIZE, DEFAULT_DEVICE_RATE_LIMIT, DEFAULT_DEVICE_BURST, DEVICE_DROPS_KEY, \
+    MIRRORS_KEY, MIRROR_NAME_KEY, DEFAULT_MIRROR_OVERFLOW_POLICY, OVERFLOW_BLOCK, DEAD_LETTER_QUEUE_SIZE_KEY, \
+    DEAD_LETTER_REPLAY_RATE_KEY, DEFAULT_DEAD_LETTER_QUEUE_SIZE, DEFAULT_DEAD_LETTER_REPLAY_RATE, DEAD_LETTERS_KEY, \
+    SHUTDOWN_TIMEOUT_KEY, DEFAULT_SHUTDOWN_TIMEOUT, PERSISTENT_SESSION_KEY, CLIENT_ID_KEY, INSTANCE_NAME_KEY, \
+    SESSION_EXPIRY_KEY, INFLIGHT_SNAPSHOT_INTERVAL_KEY, SUB_CLIENT_ID_KEY, DEFAULT_PERSISTENT_SESSION, \
+    DEFAULT_SESSION_EXPIRY, DEFAULT_INFLIGHT_SNAPSHOT_INTERVAL, INFLIGHT_FILE_SUFFIX, LOG_SAMPLE_EVERY_KEY, \
+    LOG_SAMPLE_RATE_KEY, DEFAULT_LOG_SAMPLE_EVERY, DEFAULT_LOG_SAMPLE_RATE, ORDERED_WORKERS_KEY, \
+    ORDERED_QUEUE_SIZE_KEY, DEFAULT_ORDERED_WORKERS, DEFAULT_ORDERED_QUEUE_SIZE, ORDERED_EXECUTOR_KEY, \
+    ORDERED_SUBMIT_TIMEOUT_KEY, DEFAULT_ORDERED_SUBMIT_TIMEOUT, \
+    CATALOG_FLUSH_INTERVAL_KEY, CATALOG_FLUSH_CHANGES_KEY, DEFAULT_CATALOG_FLUSH_INTERVAL, \
+    DEFAULT_CATALOG_FLUSH_CHANGES, CATALOG_FLUSHER_KEY, CATALOG_BACKEND_KEY, DEFAULT_CATALOG_BACKEND, \
+    CATALOG_CACHE_SIZE_KEY, DEFAULT_CATALOG_CACHE_SIZE
 
 from scral_core.ogc_configuration import OGCConfiguration
-from scral_core import util, mqtt_util, rest_util
+from scral_core import clock, log_util, util, rest_util
+from scral_core.counters import ActivityCounter, InFlightCounter
+from scral_core.mqtt_publisher import PublisherBackend, MQTTPublisher, MQTTPublisherPool
+from scral_core.mirror_sink import MirrorSink
+from scral_core.dead_letters import DeadLetterQueue
+from scral_core.payload_encoding import PayloadEncoder
+from scral_core.resource_catalog import ResourceCatalog, CatalogFlusher, open_resource_catalog
+from scral_core.keyed_executor import KeyedExecutor
+from scral_core.publish_pipeline import PublishPipeline, PublishItem, ConflationStage
+from scral_core.rate_limit import DeviceRateLimiter
+from scral_core.spool import ObservationSpool, InflightStore
 from scral_ogc import OGCDatastream, OGCObservation
 
 verbose = False
@@ -65,6 +102,11 @@ class SCRALModule(object):
         the runtime method (that actually does not have a default implementation).
     """
 
+    # Publishing priorities of the module OBSERVED PROPERTIES, they can be overridden by the configuration
+    _default_priorities: Dict[str, str] = {}
+    # True if the publishing pipeline is enabled when "publish_pipeline" preference is not specified
+    _default_publish_pipeline: bool = False
+
     @staticmethod
     def startup(args: Dict[str, str],
                 ogc_server_username: Optional[str] = None, ogc_server_password: Optional[str] = None) \
@@ -137,18 +179,10 @@ class SCRALModule(object):
         # 1 Storing the OGC configuration
         self._ogc_config = ogc_config
 
-        # 2 Load local resource catalog
-        self._catalog_fullpath = CATALOG_FOLDER + catalog_name
-        if os.path.exists(self._catalog_fullpath):
-            self._resource_catalog = util.load_from_file(self._catalog_fullpath)
-            self.print_catalog()
-        else:
-            logging.info("No resource catalog <" + catalog_name + "> available.")
-            self._resource_catalog = {}
-
-        # 3 Load connection configuration fields...
+        # 2 Load connection configuration fields...
+        mqtt_preferences = None  # in custom mode optional MQTT preferences are taken from environmental variables
         if D_CONFIG_KEY in os.environ.keys() and os.environ[D_CONFIG_KEY].lower() == D_CUSTOM_MODE:
-            # 3a) ...from environmental variables.
+            # 2a) ...from environmental variables.
             try:
                 self._pub_broker_address = os.environ[D_PUB_BROKER_URI_KEY]
             except KeyError as ex:
@@ -172,8 +206,9 @@ class SCRALModule(object):
                 pilot_mqtt_topic_prefix = DEFAULT_GOST_PREFIX
 
         elif connection_file:
-            # 3b) ...from connection file.
+            # 2b) ...from connection file.
             connection_config_file = util.load_from_file(connection_file)
+            mqtt_preferences = connection_config_file[MQTT_KEY]
             self._pub_broker_address = connection_config_file[MQTT_KEY][MQTT_PUB_BROKER_KEY]
             self._pub_broker_port = connection_config_file[MQTT_KEY][MQTT_PUB_BROKER_PORT_KEY]
             try:
@@ -192,24 +227,179 @@ class SCRALModule(object):
             logging.critical("No environmental variables or connection file configured!")
             exit(ERROR_MISSING_ALL)
 
+        # 3 Load local resource catalog
+        self._catalog_fullpath = CATALOG_FOLDER + catalog_name
+        catalog_backend = util.get_optional_preference(mqtt_preferences, CATALOG_BACKEND_KEY, DEFAULT_CATALOG_BACKEND)
+        catalog_cache_size = util.get_optional_preference(mqtt_preferences, CATALOG_CACHE_SIZE_KEY,
+                                                          DEFAULT_CATALOG_CACHE_SIZE)
+        try:
+            self._resource_catalog = open_resource_catalog(self._catalog_fullpath, catalog_backend,
+                                                           catalog_cache_size)
+        except ValueError as ex:
+            logging.critical(str(ex))
+            exit(ERROR_MISSING_PARAMETER)
+        if len(self._resource_catalog):
+            self.print_catalog()
+        else:
+            logging.info("No resource catalog <" + catalog_name + "> available.")
+        self._catalog_flusher = None  # until it is configured, the catalog is written by the calling thread
+
         # 4 Creating an MQTT Publisher
         logging.debug("MQTT publishing topic prefix: " + pilot_mqtt_topic_prefix)
         self._topic_prefix = pilot_mqtt_topic_prefix
 
-        client_id = MQTT_CLIENT_PREFIX + "-" + str(self.__class__.__name__) + "-" + str(random.randint(1, sys.maxsize))
-        self._mqtt_publisher = mqtt.Client(client_id=client_id)
-
-        self._mqtt_publisher.on_connect = mqtt_util.on_connect
-        self._mqtt_publisher.on_disconnect = mqtt_util.automatic_reconnection
-
-        logging.info(
-            "Try to connect to broker: %s:%s for PUBLISHING..." % (self._pub_broker_address, self._pub_broker_port))
-        logging.debug("MQTT Client ID is: " + str(self._mqtt_publisher._client_id))
-        self._mqtt_publisher.connect(self._pub_broker_address, self._pub_broker_port, self._pub_broker_keepalive)
-        self._mqtt_publisher.loop_start()
-
-        # 5 Preparing module analysis information
-        self._active_devices = {ACTUAL_COUNTER_KEY: 0, LAST_UPDATE_KEY: arrow.utcnow()}
+        self._mqtt_preferences = mqtt_preferences
+        self._persistent_session = util.get_optional_preference(
+            mqtt_preferences, PERSISTENT_SESSION_KEY, DEFAULT_PERSISTENT_SESSION)
+        client_id = util.get_optional_preference(mqtt_preferences, CLIENT_ID_KEY, None)
+        if client_id:
+            logging.info('MQTT client ID configured: "' + client_id + '"')
+        elif self._persistent_session:
+            # a persistent session is identified by the client ID: it has to be the same at each start and unique
+            instance_name = util.get_optional_preference(mqtt_preferences, INSTANCE_NAME_KEY, None)
+            if not instance_name:
+                logging.critical('A persistent session requires "' + INSTANCE_NAME_KEY + '" or "' + CLIENT_ID_KEY +
+                                 '" (unique for each instance of the module).')
+                exit(ERROR_MISSING_PARAMETER)
+            client_id = MQTT_CLIENT_PREFIX + "-" + str(self.__class__.__name__) + "-" + str(instance_name)
+        else:
+            client_id = MQTT_CLIENT_PREFIX + "-" + str(self.__class__.__name__) + "-" + \
+                        str(random.randint(1, sys.maxsize))
+        self._client_id = client_id
+        connections = util.get_optional_preference(
+            mqtt_preferences, PUBLISHER_CONNECTIONS_KEY, DEFAULT_PUBLISHER_CONNECTIONS)
+        if connections <= 1:
+            publishers = [self._create_mqtt_publisher(mqtt_preferences, client_id, self.__class__.__name__)]
+        else:
+            # each connection has its own client ID and its own spool
+            publishers = [self._create_mqtt_publisher(mqtt_preferences, client_id + "-" + str(i),
+                                                      self.__class__.__name__ + "-" + str(i))
+                          for i in range(1, connections + 1)]
+        self._mqtt_publisher = MQTTPublisherPool(publishers)
+        self._mqtt_publisher.connect()
+
+        # On SIGINT/SIGTERM queued messages are drained before closing the connections (see "shutdown")
+        self._shutdown_timeout = util.get_optional_preference(
+            mqtt_preferences, SHUTDOWN_TIMEOUT_KEY, DEFAULT_SHUTDOWN_TIMEOUT)
+        self._shutting_down = False
+        self._in_flight = InFlightCounter()  # REST requests and polling cycles waited for by "shutdown"
+        util.add_shutdown_hook(self.shutdown)
+
+        # Optional mirror brokers, each one with its own connections and queue
+        self._mirrors = []
+        for i, mirror_preferences in enumerate(util.get_optional_preference(mqtt_preferences, MIRRORS_KEY, [])):
+            mirror = self._create_mirror(mqtt_preferences, mirror_preferences, client_id, i + 1)
+            mirror.start()
+            self._mirrors.append(mirror)
+
+        # Messages that cannot be published are kept in a bounded dead-letter queue
+        self._dead_letters = None
+        dead_letter_queue_size = util.get_optional_preference(
+            mqtt_preferences, DEAD_LETTER_QUEUE_SIZE_KEY, DEFAULT_DEAD_LETTER_QUEUE_SIZE)
+        if dead_letter_queue_size > 0:
+            self._dead_letters = DeadLetterQueue(dead_letter_queue_size)
+        self._dead_letter_replay_rate = util.get_optional_preference(
+            mqtt_preferences, DEAD_LETTER_REPLAY_RATE_KEY, DEFAULT_DEAD_LETTER_REPLAY_RATE)
+
+        # OBSERVATION payloads encoding
+        self._payload_encoder = self._create_payload_encoder(mqtt_preferences)
+
+        # 5 Optional asynchronous publishing pipeline
+        self._publish_pipeline = None
+        if util.get_optional_preference(mqtt_preferences, PUBLISH_PIPELINE_KEY, self._default_publish_pipeline):
+            overflow_policy = util.get_optional_preference(mqtt_preferences, OVERFLOW_POLICY_KEY,
+                                                           DEFAULT_OVERFLOW_POLICY)
+            if overflow_policy not in OVERFLOW_POLICIES:
+                logging.critical('Invalid "' + OVERFLOW_POLICY_KEY + '": "' + str(overflow_policy) +
+                                 '", allowed values: ' + str(OVERFLOW_POLICIES))
+                exit(ERROR_MISSING_PARAMETER)
+            self._publish_pipeline = PublishPipeline(
+                self._publish_item,
+                queue_size=util.get_optional_preference(
+                    mqtt_preferences, PIPELINE_QUEUE_SIZE_KEY, DEFAULT_PIPELINE_QUEUE_SIZE),
+                batch_size=util.get_optional_preference(
+                    mqtt_preferences, PIPELINE_BATCH_SIZE_KEY, DEFAULT_PIPELINE_BATCH_SIZE),
+                linger=util.get_optional_preference(mqtt_preferences, PIPELINE_LINGER_KEY, DEFAULT_PIPELINE_LINGER),
+                workers=util.get_optional_preference(mqtt_preferences, PIPELINE_WORKERS_KEY, DEFAULT_PIPELINE_WORKERS),
+                name=self.__class__.__name__ + "-publisher",
+                overflow_policy=overflow_policy,
+                block_timeout=util.get_optional_preference(
+                    mqtt_preferences, OVERFLOW_BLOCK_TIMEOUT_KEY, DEFAULT_OVERFLOW_BLOCK_TIMEOUT),
+                device_queue_size=util.get_optional_preference(
+                    mqtt_preferences, DEVICE_QUEUE_SIZE_KEY, DEFAULT_DEVICE_QUEUE_SIZE))
+            self._publish_pipeline.start()
+            for device_id, weight in util.get_optional_preference(mqtt_preferences, DEVICE_WEIGHTS_KEY, {}).items():
+                self.set_device_weight(device_id, weight)
+
+        # Optional ordered execution: tasks of the same key (e.g. a device) are executed in order, others in parallel
+        self._keyed_executor = None
+        ordered_workers = util.get_optional_preference(mqtt_preferences, ORDERED_WORKERS_KEY, DEFAULT_ORDERED_WORKERS)
+        if ordered_workers > 0:
+            self._keyed_executor = KeyedExecutor(
+                ordered_workers,
+                util.get_optional_preference(mqtt_preferences, ORDERED_QUEUE_SIZE_KEY, DEFAULT_ORDERED_QUEUE_SIZE),
+                name=self.__class__.__name__ + "-ordered",
+                submit_timeout=util.get_optional_preference(
+                    mqtt_preferences, ORDERED_SUBMIT_TIMEOUT_KEY, DEFAULT_ORDERED_SUBMIT_TIMEOUT))
+            self._keyed_executor.start()
+
+        # Registrations only mark the resource catalog as dirty, a background thread writes the changes together
+        catalog_flush_interval = util.get_optional_preference(
+            mqtt_preferences, CATALOG_FLUSH_INTERVAL_KEY, DEFAULT_CATALOG_FLUSH_INTERVAL)
+        if catalog_flush_interval > 0:
+            catalog_flush_changes = util.get_optional_preference(
+                mqtt_preferences, CATALOG_FLUSH_CHANGES_KEY, DEFAULT_CATALOG_FLUSH_CHANGES)
+            self._catalog_flusher = CatalogFlusher(
+                self._resource_catalog, catalog_flush_interval, catalog_flush_changes)
+            self._catalog_flusher.start()
+
+        # Optional rate limit of each device (messages of high priority are never limited)
+        self._rate_limiter = None
+        device_rate_limit = util.get_optional_preference(
+            mqtt_preferences, DEVICE_RATE_LIMIT_KEY, DEFAULT_DEVICE_RATE_LIMIT)
+        if device_rate_limit > 0:
+            self._rate_limiter = DeviceRateLimiter(
+                device_rate_limit,
+                util.get_optional_preference(mqtt_preferences, DEVICE_BURST_KEY, DEFAULT_DEVICE_BURST))
+
+        # Optional latest-value conflation, for each OBSERVED PROPERTY: { "property_name": min_interval }
+        self._conflation_stage = ConflationStage(self._enqueue_item, name=self.__class__.__name__ + "-conflation")
+        self._conflation = {}
+        conflation = util.get_optional_preference(mqtt_preferences, CONFLATION_KEY, {})
+        if not isinstance(conflation, dict):
+            logging.critical('Invalid "' + CONFLATION_KEY + '": ' + str(conflation) +
+                             ', expected: { "property_name": min_interval, ... }')
+            exit(ERROR_MISSING_PARAMETER)
+        for observed_property, min_interval in conflation.items():
+            self.enable_conflation(observed_property, float(min_interval))
+
+        # Optional publishing priorities, for each OBSERVED PROPERTY (OGC file first, then "priorities" preference)
+        self._priorities = {}
+        priorities = dict(self._default_priorities)
+        if ogc_config:
+            priorities.update(ogc_config.get_property_priorities())
+        priorities.update(util.get_optional_preference(mqtt_preferences, PRIORITIES_KEY, {}))
+        for observed_property, priority in priorities.items():
+            try:
+                self.set_priority(observed_property, priority)
+            except ValueError as ex:
+                logging.critical(str(ex))
+                exit(ERROR_MISSING_PARAMETER)
+        if self._priorities and not self._publish_pipeline:
+            logging.warning("Publishing pipeline not enabled, OBSERVED PROPERTIES priorities will be ignored.")
+
+        # Time elapsed between phenomenonTime/resultTime and publication is computed only if explicitly enabled
+        self._lag_metric = util.get_optional_preference(mqtt_preferences, LAG_METRIC_KEY, False)
+        self._lag_mutex = Lock()
+        self._lag_stats = {"phenomenon_time": {"count": 0, "total": 0.0, "max": 0.0},
+                           "result_time": {"count": 0, "total": 0.0, "max": 0.0}}
+
+        # Frequent messages (e.g. each OBSERVATION) are logged only if sampled
+        log_util.configure_sampling(
+            util.get_optional_preference(mqtt_preferences, LOG_SAMPLE_EVERY_KEY, DEFAULT_LOG_SAMPLE_EVERY),
+            util.get_optional_preference(mqtt_preferences, LOG_SAMPLE_RATE_KEY, DEFAULT_LOG_SAMPLE_RATE))
+
+        # 6 Preparing module analysis information
         update_interval = None
         warning_msg = " not configured, default value will be used: " + str(DEFAULT_UPDATE_INTERVAL) + "s"
         if D_CONFIG_KEY in os.environ.keys() and os.environ[D_CONFIG_KEY].lower() == D_CUSTOM_MODE:
@@ -228,12 +418,185 @@ class SCRALModule(object):
 
         if not update_interval:
             logging.warning(warning_msg)
-            self._active_devices[UPDATE_INTERVAL_KEY] = DEFAULT_UPDATE_INTERVAL
-        else:
-            self._active_devices[UPDATE_INTERVAL_KEY] = update_interval
+            update_interval = DEFAULT_UPDATE_INTERVAL
+        # OBSERVATIONs are counted by each thread without a global lock
+        self._activity_counter = ActivityCounter(update_interval)
 
         logging.info("If observations flow, number of active devices will be refreshed every "
-                     + str(self._active_devices[UPDATE_INTERVAL_KEY]) + " seconds.")
+                     + str(update_interval) + " seconds.")
+
+    def _create_mqtt_publisher(self, mqtt_preferences: Optional[dict], client_id: str, spool_name: str,
+                               broker_address: Optional[str] = None, broker_port: Optional[int] = None,
+                               broker_keepalive: Optional[int] = None) -> PublisherBackend:
+        """ Create an MQTT publishing connection according to the optional MQTT preferences.
+
+        :param mqtt_preferences: The "mqtt" section of the connection file (None in custom mode).
+        :param client_id: The MQTT client ID.
+        :param spool_name: The name of the spool sub-folder (used only if the spool is enabled).
+        :param broker_address: [OPT] The address of the broker, if not specified the primary one is used.
+        :param broker_port: [OPT] The port of the broker, if not specified the primary one is used.
+        :param broker_keepalive: [OPT] The keepalive of the connection, if not specified the primary one is used.
+        :return: A PublisherBackend not yet connected.
+        """
+        if not broker_address:
+            broker_address = self._pub_broker_address
+            broker_port = self._pub_broker_port
+            broker_keepalive = self._pub_broker_keepalive
+
+        max_inflight_messages = util.get_optional_preference(
+            mqtt_preferences, MAX_INFLIGHT_MESSAGES_KEY, DEFAULT_MAX_INFLIGHT_MESSAGES)
+        max_queued_messages = util.get_optional_preference(
+            mqtt_preferences, MAX_QUEUED_MESSAGES_KEY, DEFAULT_MAX_QUEUED_MESSAGES)
+        protocol_version = util.get_optional_preference(
+            mqtt_preferences, PROTOCOL_VERSION_KEY, DEFAULT_PROTOCOL_VERSION)
+        # Optional persistent session: the broker keeps the session and unacknowledged messages survive a restart
+        persistent_session = util.get_optional_preference(
+            mqtt_preferences, PERSISTENT_SESSION_KEY, DEFAULT_PERSISTENT_SESSION)
+        session_expiry = util.get_optional_preference(mqtt_preferences, SESSION_EXPIRY_KEY, DEFAULT_SESSION_EXPIRY)
+
+        backend = util.get_optional_preference(mqtt_preferences, PUBLISHER_BACKEND_KEY, DEFAULT_PUBLISHER_BACKEND)
+        if backend == ASYNCIO_BACKEND:
+            try:
+                from scral_core.async_publisher import AsyncMQTTPublisher
+                if util.get_optional_preference(mqtt_preferences, SPOOL_KEY, False):
+                    logging.warning("The spool is not supported by the asyncio publisher backend.")
+                return AsyncMQTTPublisher(client_id, broker_address, broker_port, broker_keepalive,
+                                          max_inflight_messages, max_queued_messages, protocol_version,
+                                          persistent_session, session_expiry)
+            except ImportError as ex:
+                logging.error("asyncio publisher backend not available (" + str(ex) + "), Paho will be used.")
+        elif backend != PAHO_BACKEND:
+            logging.error('Unknown publisher backend: "' + str(backend) + '", Paho will be used.')
+
+        # With a persistent session, unacknowledged messages are stored on disk to be published again after a restart
+        spool_folder = util.get_optional_preference(mqtt_preferences, SPOOL_FOLDER_KEY, SPOOL_FOLDER)
+        inflight_store = None
+        if persistent_session:
+            inflight_store = InflightStore(
+                os.path.join(spool_folder, spool_name + INFLIGHT_FILE_SUFFIX),
+                util.get_optional_preference(
+                    mqtt_preferences, INFLIGHT_SNAPSHOT_INTERVAL_KEY, DEFAULT_INFLIGHT_SNAPSHOT_INTERVAL))
+
+        # Optional store-and-forward spool for messages that cannot be delivered to the broker
+        spool = None
+        if util.get_optional_preference(mqtt_preferences, SPOOL_KEY, False):
+            spool = ObservationSpool(
+                os.path.join(spool_folder, spool_name),
+                max_size=util.get_optional_preference(mqtt_preferences, SPOOL_MAX_SIZE_KEY, DEFAULT_SPOOL_MAX_SIZE),
+                max_age=util.get_optional_preference(mqtt_preferences, SPOOL_MAX_AGE_KEY, DEFAULT_SPOOL_MAX_AGE),
+                segment_size=util.get_optional_preference(
+                    mqtt_preferences, SPOOL_SEGMENT_SIZE_KEY, DEFAULT_SPOOL_SEGMENT_SIZE),
+                fsync_batch=util.get_optional_preference(
+                    mqtt_preferences, SPOOL_FSYNC_BATCH_KEY, DEFAULT_SPOOL_FSYNC_BATCH),
+                fsync_interval=util.get_optional_preference(
+                    mqtt_preferences, SPOOL_FSYNC_INTERVAL_KEY, DEFAULT_SPOOL_FSYNC_INTERVAL))
+
+        return MQTTPublisher(
+            client_id, broker_address, broker_port, broker_keepalive, max_inflight_messages, max_queued_messages,
+            spool=spool,
+            spool_replay_rate=util.get_optional_preference(
+                mqtt_preferences, SPOOL_REPLAY_RATE_KEY, DEFAULT_SPOOL_REPLAY_RATE),
+            protocol_version=protocol_version,
+            topic_alias_maximum=util.get_optional_preference(
+                mqtt_preferences, TOPIC_ALIAS_MAXIMUM_KEY, DEFAULT_TOPIC_ALIAS_MAXIMUM),
+            persistent_session=persistent_session,
+            session_expiry=session_expiry,
+            inflight_store=inflight_store)
+
+    def _create_mqtt_subscriber(self, default_client_id: str) -> mqtt.Client:
+        """ Create a Paho client for the subscriptions of a module (not yet connected).
+            With a persistent session the broker queues QoS>0 messages while the module is disconnected.
+
+        :param default_client_id: The client ID used if "sub_client_id" preference is not specified and the session
+                                  is not persistent (otherwise the ID is derived from the publisher one).
+        :return: A Paho client.
+        """
+        if self._persistent_session:
+            default_client_id = self._client_id + "-sub"  # stable and unique as the publisher ID
+        client_id = util.get_optional_preference(self._mqtt_preferences, SUB_CLIENT_ID_KEY, default_client_id)
+        logging.debug('MQTT subscriber client ID: "' + client_id + '", persistent session: ' +
+                      str(self._persistent_session))
+        return mqtt.Client(client_id, clean_session=not self._persistent_session)
+
+    def _create_mirror(self, mqtt_preferences: Optional[dict], mirror_preferences: dict, client_id: str,
+                       index: int) -> MirrorSink:
+        """ Create a mirror broker: its optional preferences override the ones of the primary broker.
+
+        :param mqtt_preferences: The "mqtt" section of the connection file (None in custom mode).
+        :param mirror_preferences: An element of the "mirrors" list.
+        :param client_id: The MQTT client ID of the primary connection.
+        :param index: The position of the mirror in the "mirrors" list (starting from 1).
+        :return: A MirrorSink not yet started.
+        """
+        preferences = dict(mqtt_preferences) if mqtt_preferences else {}
+        preferences.pop(MIRRORS_KEY, None)
+        preferences.update(mirror_preferences)
+        try:
+            broker_address = preferences[MQTT_PUB_BROKER_KEY]
+        except KeyError:
+            logging.critical('Missing "' + MQTT_PUB_BROKER_KEY + '" of mirror ' + str(index) + "!")
+            exit(ERROR_MISSING_PARAMETER)
+        broker_port = preferences.get(MQTT_PUB_BROKER_PORT_KEY, BROKER_DEFAULT_PORT)
+        broker_keepalive = preferences.get(MQTT_PUB_BROKER_KEEP_KEY, DEFAULT_KEEPALIVE)
+        name = preferences.get(MIRROR_NAME_KEY, "mirror-" + str(index))
+
+        overflow_policy = preferences.get(OVERFLOW_POLICY_KEY, DEFAULT_MIRROR_OVERFLOW_POLICY)
+        if overflow_policy == OVERFLOW_BLOCK:
+            logging.warning('Mirror "' + name + '" cannot block the primary path, "' +
+                            DEFAULT_MIRROR_OVERFLOW_POLICY + '" overflow policy will be used.')
+            overflow_policy = DEFAULT_MIRROR_OVERFLOW_POLICY
+        elif overflow_policy not in OVERFLOW_POLICIES:
+            logging.critical('Invalid "' + OVERFLOW_POLICY_KEY + '" of mirror "' + name + '": "' +
+                             str(overflow_policy) + '", allowed values: ' + str(OVERFLOW_POLICIES))
+            exit(ERROR_MISSING_PARAMETER)
+
+        logging.info('Mirror "' + name + '": ' + broker_address + ":" + str(broker_port))
+        mirror_client_id = client_id + "-" + name
+        spool_name = self.__class__.__name__ + "-" + name
+        connections = preferences.get(PUBLISHER_CONNECTIONS_KEY, DEFAULT_PUBLISHER_CONNECTIONS)
+        if connections <= 1:
+            publishers = [self._create_mqtt_publisher(preferences, mirror_client_id, spool_name,
+                                                      broker_address, broker_port, broker_keepalive)]
+        else:
+            publishers = [self._create_mqtt_publisher(preferences, mirror_client_id + "-" + str(i),
+                                                      spool_name + "-" + str(i),
+                                                      broker_address, broker_port, broker_keepalive)
+                          for i in range(1, connections + 1)]
+
+        return MirrorSink(
+            self.__class__.__name__ + "-" + name, MQTTPublisherPool(publishers),
+            queue_size=preferences.get(PIPELINE_QUEUE_SIZE_KEY, DEFAULT_PIPELINE_QUEUE_SIZE),
+            batch_size=preferences.get(PIPELINE_BATCH_SIZE_KEY, DEFAULT_PIPELINE_BATCH_SIZE),
+            linger=preferences.get(PIPELINE_LINGER_KEY, DEFAULT_PIPELINE_LINGER),
+            workers=preferences.get(PIPELINE_WORKERS_KEY, DEFAULT_PIPELINE_WORKERS),
+            overflow_policy=overflow_policy,
+            device_queue_size=preferences.get(DEVICE_QUEUE_SIZE_KEY, DEFAULT_DEVICE_QUEUE_SIZE),
+            publish_timeout=broker_keepalive)
+
+    @staticmethod
+    def _create_payload_encoder(mqtt_preferences: Optional[dict]) -> PayloadEncoder:
+        """ Create the encoder of OBSERVATION payloads, plain JSON is used if the configured one is not available. """
+        marker = util.get_optional_preference(mqtt_preferences, CONTENT_TYPE_MARKER_KEY, DEFAULT_CONTENT_TYPE_MARKER)
+        if marker == CONTENT_TYPE_PROPERTY and util.get_optional_preference(
+                mqtt_preferences, PROTOCOL_VERSION_KEY, DEFAULT_PROTOCOL_VERSION) != MQTT_V5:
+            logging.warning("Content Type property requires MQTT v5, the payload format will be appended to topics.")
+            marker = CONTENT_TYPE_TOPIC
+
+        try:
+            encoder = PayloadEncoder(
+                encoding=util.get_optional_preference(mqtt_preferences, PAYLOAD_ENCODING_KEY, DEFAULT_PAYLOAD_ENCODING),
+                compression=util.get_optional_preference(mqtt_preferences, PAYLOAD_COMPRESSION_KEY, None),
+                dictionary_path=util.get_optional_preference(mqtt_preferences, ZSTD_DICTIONARY_KEY, None),
+                marker=marker,
+                level=util.get_optional_preference(mqtt_preferences, ZSTD_LEVEL_KEY, DEFAULT_ZSTD_LEVEL))
+        except (ValueError, ImportError, OSError) as ex:
+            logging.error("Payload encoding not available (" + str(ex) + "), plain JSON will be used.")
+            return PayloadEncoder()
+
+        if not encoder.is_plain_json():
+            logging.info("OBSERVATION payloads encoding: " + encoder.get_encoding() +
+                         (" + " + encoder.get_compression() if encoder.get_compression() else ""))
+        return encoder
 
     def get_mqtt_connection_address(self) -> str:
         return self._pub_broker_address
@@ -247,13 +610,59 @@ class SCRALModule(object):
     def get_topic_prefix(self) -> str:
         return self._topic_prefix
 
-    def get_resource_catalog(self) -> dict:
+    def get_payload_encoder(self) -> PayloadEncoder:
+        return self._payload_encoder
+
+    def get_publish_pipeline(self) -> Optional[PublishPipeline]:
+        return self._publish_pipeline
+
+    def get_mqtt_publisher(self) -> MQTTPublisherPool:
+        return self._mqtt_publisher
+
+    def get_mirrors(self) -> List[MirrorSink]:
+        return self._mirrors
+
+    def get_publisher_status(self) -> list:
+        """ Health and queue depth of each MQTT publishing connection. """
+        return self._mqtt_publisher.get_status()
+
+    def is_publisher_saturated(self) -> bool:
+        """ True if new OBSERVATIONs cannot be accepted at the moment:
+            the publishing pipeline (if enabled) is full or the MQTT client reached its queue limit.
+        """
+        if self._publish_pipeline:
+            return self._publish_pipeline.is_saturated()
+        return self._mqtt_publisher.is_saturated()
+
+    def get_observation_topic(self, datastream_id: int) -> str:
+        """ Build the MQTT topic on which the OBSERVATIONs of a DATASTREAM have to be published. """
+        return self._topic_prefix + "Datastreams(" + str(datastream_id) + ")/Observations"
+
+    def get_lag_stats(self) -> dict:
+        """ Statistics (in seconds) about the time elapsed between OBSERVATIONs timestamps and their publication.
+            They are collected only if the lag metric is enabled.
+        """
+        with self._lag_mutex:
+            return copy.deepcopy(self._lag_stats)
+
+    def get_resource_catalog(self) -> ResourceCatalog:
         return self._resource_catalog
 
+    def find_devices(self, property_name: str) -> List[str]:
+        """ The devices with a DATASTREAM of an OBSERVED PROPERTY. """
+        return self._resource_catalog.find_devices(property_name)
+
+    def find_datastream(self, datastream_id: int) -> Optional[Tuple[str, str]]:
+        """ Look up a DATASTREAM in the reverse index of the resource catalog (without scanning the devices).
+
+        :return: The device id and the OBSERVED PROPERTY of the DATASTREAM, None if it is not in the catalog.
+        """
+        return self._resource_catalog.find_datastream(datastream_id)
+
     def get_active_devices(self) -> dict:
         """ This method gives access to the resource catalog with few additional information. """
 
-        tmp_rc = dict(self._resource_catalog)
+        tmp_rc = self._resource_catalog.snapshot()  # devices could be registered meanwhile
         # active_devices_count = 0
         # for dev in tmp_rc:
         #    if "last_msg" in dev:
@@ -265,12 +674,23 @@ class SCRALModule(object):
         registered_devices = len(tmp_rc)
         # tmp_rc["active_devices"] = active_devices_count
 
-        tmp_active_devices = copy.deepcopy(self._active_devices)
+        tmp_active_devices = self._activity_counter.get_stats()  # per-thread counters are merged here
         tmp_active_devices[REGISTERED_DEVICES_KEY] = registered_devices
-        try:
-            tmp_active_devices[LAST_UPDATE_KEY] = str(tmp_active_devices[LAST_UPDATE_KEY])
-        except KeyError:
-            logging.error('"'+LAST_UPDATE_KEY+'" data structure is not available!')
+        tmp_active_devices[LAST_UPDATE_KEY] = str(tmp_active_devices[LAST_UPDATE_KEY])
+        tmp_active_devices[PUBLISHER_CONNECTIONS_KEY] = self.get_publisher_status()
+        if self._publish_pipeline:
+            tmp_active_devices[PUBLISH_PIPELINE_KEY] = self._publish_pipeline.get_stats()  # per-lane latency too
+        if self._dead_letters:
+            tmp_active_devices[DEAD_LETTERS_KEY] = self._dead_letters.get_stats()
+        if self._mirrors:
+            tmp_active_devices[MIRRORS_KEY] = [mirror.get_status() for mirror in self._mirrors]
+        if self._keyed_executor:
+            tmp_active_devices[ORDERED_EXECUTOR_KEY] = self._keyed_executor.get_stats()
+        if self._catalog_flusher:
+            tmp_active_devices[CATALOG_FLUSHER_KEY] = self._catalog_flusher.get_stats()
+        device_drops = self.get_device_drops()
+        if device_drops:
+            tmp_active_devices[DEVICE_DROPS_KEY] = device_drops
         # x = json.dumps(tmp_active_devices, indent=2, sort_keys=True)
         tmp_rc[ACTIVE_DEVICES_KEY] = tmp_active_devices
 
@@ -279,38 +699,134 @@ class SCRALModule(object):
     def print_catalog(self):
         """ Print resource catalog on log. """
 
-        logging.info("[PHASE-INIT] Resource Catalog <" + self._catalog_fullpath + ">:")
-        for key, value in self._resource_catalog.items():
-            logging.info(key + ": " + json.dumps(value))
-        logging.info("--- End of Resource Catalog ---\n")
+        logging.info("[PHASE-INIT] Resource Catalog <%s>: %d device(s).", self._resource_catalog.get_path(),
+                     len(self._resource_catalog))
+        if logging.root.isEnabledFor(logging.DEBUG):  # the content is printed only in verbose mode
+            for key, value in self._resource_catalog.iter_entries():
+                logging.debug("%s: %s", key, log_util.LazyJSON(value))
+            logging.debug("--- End of Resource Catalog ---\n")
 
-    def update_file_catalog(self):
-        """ Update the resource catalog on file. """
+    def update_file_catalog(self, device_id: Optional[str] = None):
+        """ Update the resource catalog on file.
+            If a device is specified, only its current entry (or its removal) is appended to the catalog journal and
+            the whole catalog is written only when the journal is long enough. Otherwise the whole catalog is written.
+            If "catalog_flush_interval" is configured, the change is written later by the catalog flusher thread.
 
-        # with open(self._catalog_fullpath, 'w+') as outfile:
-        #     json.dump(self._resource_catalog, outfile)
-        #     outfile.write('\n')
-        with open(self._catalog_fullpath, 'w') as f:
-            for chunk in json.JSONEncoder().iterencode(self._resource_catalog):
-                f.write(chunk)
+        :param device_id: [OPT] The device registered, modified or removed.
+        """
+        if self._catalog_flusher:
+            self._catalog_flusher.mark_dirty(device_id)
+        else:
+            self._resource_catalog.flush(None if device_id is None else [device_id])
 
-    def _update_active_devices_counter(self):
-        if not self._active_devices:
-            logging.error("Trying to update active_devices structure... But was not initialized!")
-            return
+    def shutdown(self, timeout: Optional[float] = None) -> int:
+        """ Graceful shutdown (called by the signal handler): the activities in progress (see "begin_activity") are
+            completed, then the held and queued messages are published, waiting at most "timeout" seconds overall.
+            Finally the resource catalog is written on file and the MQTT connections are closed.
+            Messages still pending in the connections are stored in the spool (if enabled).
 
+        :param timeout: The maximum number of seconds to wait, if not specified "shutdown_timeout" preference is used.
+        :return: The number of messages that were not published.
+        """
+        if self._shutting_down:
+            return 0
+        self._shutting_down = True  # REST modules refuse new requests from now on
+        if timeout is None:
+            timeout = self._shutdown_timeout
+        deadline = time.monotonic() + timeout
+        logging.info("Shutting down " + self.__class__.__name__ + ", waiting at most " + str(timeout) +
+                     " seconds for queued messages...")
+
+        # requests and polling cycles in progress can still submit messages and register devices
+        busy = self._in_flight.close(max(0.0, deadline - time.monotonic()))
+        if busy:
+            logging.warning(str(busy) + " request(s) still in progress, they could fail.")
+
+        lost = 0
+        if self._keyed_executor:  # tasks already accepted are completed before draining the publishing queues
+            lost += self._keyed_executor.stop(max(0.0, deadline - time.monotonic()))
+        # the conflated messages are released first, so they are drained together with the queued ones
+        self._conflation_stage.stop()
+        if self._publish_pipeline:
+            lost += self._publish_pipeline.stop(max(0.0, deadline - time.monotonic()))
+        for mirror in self._mirrors:
+            mirror.stop(max(0.0, deadline - time.monotonic()))
+
+        if self._catalog_flusher:  # from now on, changes are written by the calling thread
+            self._catalog_flusher.stop(max(0.0, deadline - time.monotonic()))
         try:
-            current_time = arrow.utcnow()
-            time_diff = (current_time - self._active_devices[LAST_UPDATE_KEY]).total_seconds()
-            if time_diff < self._active_devices[UPDATE_INTERVAL_KEY]:
-                self._active_devices[ACTUAL_COUNTER_KEY] += 1
-            else:
-                self._active_devices[COUNTER_KEY] = self._active_devices[ACTUAL_COUNTER_KEY]
-                self._active_devices[ACTUAL_COUNTER_KEY] = 1
-                self._active_devices[LAST_UPDATE_KEY] = current_time
-        except KeyError as ke:
-            logging.error("Trying to update active_devices structure... But a field is missing!")
-            logging.error(repr(ke))
+            self.update_file_catalog()
+        except OSError as ex:
+            logging.error("Impossible to write the resource catalog: " + str(ex))
+        self._resource_catalog.close()
+
+        lost += self._mqtt_publisher.disconnect(max(0.0, deadline - time.monotonic()))
+        for mirror in self._mirrors:
+            mirror.get_publisher().disconnect(0)
+
+        if lost:
+            logging.warning(str(lost) + " message(s) not published before the shutdown.")
+        if self._dead_letters and self._dead_letters.count():
+            logging.warning(str(self._dead_letters.count()) + " dead letter(s) discarded.")
+        return lost
+
+    def execute_ordered(self, key: Hashable, function: Callable, *args, **kwargs):
+        """ Execute a function after the ones already submitted with the same key and wait for its result
+            (e.g. in a REST handler, using the device id as key). The functions of different keys are executed in
+            parallel by the "ordered_workers" threads, if they are not configured the calling thread executes it.
+
+        :param key: The key of the function (e.g. a device or DATASTREAM id).
+        :param function: The function to execute, with its positional and keyword arguments.
+        :return: The result of the function.
+        :raise RuntimeError: If the module is shutting down (ExecutorFullError if the queue of the key is still full
+                             after "ordered_submit_timeout" seconds).
+        """
+        if not self._keyed_executor:
+            return function(*args, **kwargs)
+        return self._keyed_executor.submit(key, function, *args, **kwargs).result()
+
+    def submit_ordered(self, key: Hashable, function: Callable, *args):
+        """ Like "execute_ordered" without waiting for the result (e.g. in an MQTT callback, so that the network loop
+            is not blocked). Exceptions raised by the function are only logged.
+            If the queue of the key is full the task is discarded (the network loop never waits for it).
+        """
+        if not self._keyed_executor:
+            if not self.begin_activity():
+                logging.warning("Shutting down, task of key: " + str(key) + " discarded.")
+                return
+            try:
+                function(*args)
+            finally:
+                self.end_activity()
+            return
+        try:
+            self._keyed_executor.post(key, function, *args)
+        except RuntimeError as ex:
+            if log_util.sampled(logging.WARNING, "ordered_discarded", key):
+                logging.warning("%s Task of key: %s discarded.", ex, key)
+
+    def get_keyed_executor(self) -> Optional[KeyedExecutor]:
+        """ The executor of "execute_ordered" and "submit_ordered", None if "ordered_workers" is not configured. """
+        return self._keyed_executor
+
+    def is_shutting_down(self) -> bool:
+        return self._shutting_down
+
+    def begin_activity(self) -> bool:
+        """ Start an activity that "shutdown" waits for before draining the publishing queues and closing the resource
+            catalog (e.g. a REST request or a polling thread publishing its OBSERVATIONs).
+            Every successful call has to be followed by "end_activity".
+
+        :return: False if the module is shutting down (the activity must not be started).
+        """
+        return self._in_flight.enter()
+
+    def end_activity(self):
+        self._in_flight.exit()
+
+    def _update_active_devices_counter(self):
+        """ Count a sent OBSERVATION, it can be called by many threads without locking. """
+        self._activity_counter.increment()
 
     def delete_device(self, device_id: str, remove_only_from_catalog: bool = False) -> (bool, bool):
         if device_id not in self._resource_catalog:
@@ -332,53 +848,228 @@ class SCRALModule(object):
                      'Content: "'+str(self._resource_catalog[device_id])+'"')
         del(self._resource_catalog[device_id])
         deleted = True
+        if self._rate_limiter:
+            self._rate_limiter.forget(device_id)
 
         if not remove_only_from_catalog:
-            self.update_file_catalog()
+            self.update_file_catalog(device_id)
 
         return deleted, False
 
-    def mqtt_publish(self, topic: str, payload, qos: int = DEFAULT_MQTT_QOS, to_print: bool = True) -> bool:
-        """ Publish the payload given as parameter to the MQTT publisher
+    def ogc_observation_publish(self, ogc_observation: OGCObservation, qos: int = DEFAULT_MQTT_QOS,
+                                to_print: bool = True, device_id: Optional[str] = None,
+                                observed_property: Optional[str] = None) -> bool:
+        """ Publish an OGC OBSERVATION on the topic of its DATASTREAM.
+
+        :param ogc_observation: The OBSERVATION to publish.
+        :param qos: The desired quality of service.
+        :param to_print: To enable or not a debug print.
+        :param device_id: [OPT] The physical device that generated the OBSERVATION.
+        :param observed_property: [OPT] The name of the OBSERVED PROPERTY (it enables per-property policies,
+                                  e.g. conflation).
+        :return: True if the OBSERVATION was successfully sent (or enqueued), False otherwise.
+        """
+        encoder = self._payload_encoder
+        topic = encoder.get_topic(self.get_observation_topic(ogc_observation.get_datastream_id()))
+        payload = encoder.encode(ogc_observation.get_rest_payload())
+        return self.mqtt_publish(topic, payload, qos, to_print,
+                                 ogc_observation.get_phenomenon_time(), ogc_observation.get_result_time(),
+                                 encoder.get_content_type(), device_id, observed_property)
+
+    def mqtt_publish(self, topic: str, payload, qos: int = DEFAULT_MQTT_QOS, to_print: bool = True,
+                     phenomenon_time: Optional[str] = None, result_time: Optional[str] = None,
+                     content_type: Optional[str] = None, device_id: Optional[str] = None,
+                     observed_property: Optional[str] = None) -> bool:
+        """ Publish the payload given as parameter to the MQTT publisher.
+            If the publishing pipeline is enabled, the payload is only enqueued and published by a publisher thread.
 
         :param topic: The MQTT topic on which the client will publish the message.
         :param payload: Data to send (according to Paho documentation could be: None, str, bytearray, int or float).
         :param qos: The desired quality of service (it has an hardcoded default value).
         :param to_print: To enable or not a debug print.
-        :return: True if the data was successfully sent, False otherwise.
+        :param phenomenon_time: [OPT] The phenomenonTime of the payload, used only by the lag metric.
+        :param result_time: [OPT] The resultTime of the payload, used only by the lag metric.
+        :param content_type: [OPT] The format of the payload (MQTT v5 "Content Type" property).
+        :param device_id: [OPT] The physical device that generated the payload.
+        :param observed_property: [OPT] The OBSERVED PROPERTY of the payload.
+        :return: True if the data was successfully sent (or enqueued), False otherwise.
         """
-        if to_print:
-            msg = "\nOn topic '" + topic + "' will be send the following payload:\n" + str(payload)
-            logging.info(msg)
+        if to_print and log_util.sampled(logging.INFO, "publish", device_id):
+            logging.info("\nOn topic '%s' will be send the following payload:\n%s", topic, payload)
+
+        priority = self._priorities.get(observed_property, DEFAULT_PRIORITY)
+        if self._rate_limiter and priority != PRIORITY_HIGH and not self._rate_limiter.allow(device_id):
+            logging.debug('Device "%s" exceeded its rate limit, message on topic "%s" discarded.', device_id, topic)
+            return False
 
+        item = PublishItem(topic, payload, qos, phenomenon_time, result_time, content_type,
+                           device_id, observed_property, priority=priority)
+        min_interval = self._conflation.get(observed_property) if observed_property else None
+        if min_interval is not None:
+            item.conflation_key = topic  # a topic identifies a DATASTREAM
+            return self._conflation_stage.submit(item, min_interval)
+        return self._enqueue_item(item)
+
+    def _enqueue_item(self, item: PublishItem) -> bool:
+        """ Submit an item to the publishing pipeline or, if the pipeline is disabled, publish it.
+            A copy of the item is enqueued on each mirror broker (the result of the primary broker is returned).
+        """
+        for mirror in self._mirrors:
+            mirror.submit(item)
+        if not self._publish_pipeline:
+            return self._mqtt_publish_now(item)
+        if self._publish_pipeline.submit(item):
+            return True
+        reason = "shutting down" if self._publish_pipeline.is_stopped() else "publishing queue full"
+        if log_util.sampled(logging.ERROR, "pipeline_rejected", item.device_id):
+            logging.error('Publishing pipeline "%s": %s, message on topic "%s" rejected.',
+                          self._publish_pipeline.get_name(), reason, item.topic)
+        if self._dead_letters:
+            self._dead_letters.add(item, reason)
+        return False
+
+    def enable_conflation(self, observed_property: str, min_interval: float = 0.0):
+        """ Enable the latest-value conflation for the DATASTREAMs of an OBSERVED PROPERTY:
+            an OBSERVATION waiting to be published is replaced by a newer one of the same DATASTREAM.
+
+        :param observed_property: The name of the OBSERVED PROPERTY.
+        :param min_interval: The minimum amount of seconds between two OBSERVATIONs of the same DATASTREAM.
+        """
+        logging.info('Conflation enabled for "' + observed_property + '", minimum interval: '
+                     + str(min_interval) + "s")
+        self._conflation[observed_property] = min_interval
+
+    def disable_conflation(self, observed_property: str):
+        """ OBSERVATIONs of this OBSERVED PROPERTY will not be conflated anymore (e.g. alerts). """
+        self._conflation.pop(observed_property, None)
+
+    def get_conflation(self) -> Dict[str, float]:
+        """ The conflated OBSERVED PROPERTIES with their minimum publishing interval. """
+        return dict(self._conflation)
+
+    def set_priority(self, observed_property: str, priority: str):
+        """ Set the publishing priority of the OBSERVATIONs of an OBSERVED PROPERTY.
+            The publishing pipeline always drains the high priority lane first (e.g. alerts are not enqueued behind
+            localization updates). Priorities are ignored if the publishing pipeline is not enabled.
+
+        :param observed_property: The name of the OBSERVED PROPERTY.
+        :param priority: "high", "normal" or "low".
+        :raise ValueError: If the priority is unknown.
+        """
+        if priority not in PRIORITY_LANES:
+            raise ValueError('Invalid priority "' + str(priority) + '" for "' + observed_property +
+                             '", allowed values: ' + str(PRIORITY_LANES))
+        self._priorities[observed_property] = priority
+
+    def get_priorities(self) -> Dict[str, str]:
+        """ The OBSERVED PROPERTIES with a publishing priority. """
+        return dict(self._priorities)
+
+    def set_device_weight(self, device_id: str, weight: int):
+        """ Set the share of the publishing pipeline of a device: at each round, the pipeline publishes up to
+            "weight" messages of the device before moving to the next one (default weight: 1).
+            Weights are ignored if the publishing pipeline is not enabled.
+
+        :param device_id: The device id (a key of the resource catalog).
+        :param weight: A positive integer.
+        """
+        if self._publish_pipeline:
+            self._publish_pipeline.get_queue().set_device_weight(device_id, weight)
+
+    def get_device_drops(self) -> Dict[str, int]:
+        """ The number of messages discarded for each device (rate limit exceeded or publishing queue overflow). """
+        drops = self._rate_limiter.get_dropped() if self._rate_limiter else {}
+        if self._publish_pipeline:
+            for device_id, dropped in self._publish_pipeline.get_queue().get_device_dropped().items():
+                drops[device_id] = drops.get(device_id, 0) + dropped
+        return {str(device_id): dropped for device_id, dropped in drops.items()}
+
+    def _publish_item(self, item: PublishItem) -> bool:
+        """ This method is called by the publishing pipeline threads.
+            If the MQTT client is saturated the thread waits (at most the keepalive of the connection), so the pipeline
+            queue fills up and its overflow policy is applied to the new OBSERVATIONs. If the client is still saturated,
+            the message is stored in the dead-letter queue.
+            During the shutdown, a disconnected client is not waited for: its room cannot be freed anymore.
+        """
+        block = not self._shutting_down or self._mqtt_publisher.get_publisher(item.topic).is_connected()
+        return self._mqtt_publish_now(item, block=block)
+
+    def _mqtt_publish_now(self, item: PublishItem, block: bool = False, dead_letter: bool = True) -> bool:
+        """ Synchronously publish a message using the MQTT publisher.
+
+        :param item: The message to publish.
+        :param block: If True and the MQTT client is saturated, wait until there is room for the message
+                      (at most the keepalive of the connection, e.g. while the broker is not reachable).
+        :param dead_letter: If True and the message was dropped by the MQTT client, it is stored in the dead-letter
+                            queue.
+        :return: True if the data was successfully sent (or kept by the client until the reconnection),
+                 False otherwise.
+        """
         info = None
+        reason = None
         try:
-            info = self._mqtt_publisher.publish(topic, payload, qos)
+            info = self._mqtt_publisher.publish(item.topic, item.payload, item.qos, block=block,
+                                                timeout=self._pub_broker_keepalive, content_type=item.content_type)
         except Exception as ex:
+            # e.g. a payload that cannot be encoded: the message never reached the client
             logging.error("Exception caught during MQTT publish: {0}".format(ex))
+            reason = "exception: " + str(ex)
+
+        if info and info.rc == mqtt.MQTT_ERR_SUCCESS:
+            now = clock.utc_now()
+            if log_util.sampled(logging.INFO, "published", item.device_id):
+                logging.info("Message successfully sent at: %s", clock.format_iso(now))
+            if self._lag_metric:
+                self._update_lag_stats(now, item.phenomenon_time, item.result_time)
+            return True
 
-        if not info:
-            return False
-        elif info.rc == mqtt.MQTT_ERR_SUCCESS:
-            now = arrow.utcnow()  # time_format = 'YYYY-MM-DDTHH:mm:ss.SZ'
-            logging.info("Message successfully sent at: " + str(now))
-            dict_payload = json.loads(payload)
-            try:
-                phenomenon_time = dict_payload["phenomenonTime"]
-                diff = now - arrow.get(phenomenon_time)
-                logging.debug("Time elapsed since PhenomenonTime: %.3f seconds." % diff.total_seconds())
-            except KeyError:
-                pass
-            try:
-                result_time = dict_payload["resultTime"]
-                diff = now - arrow.get(result_time)
-                logging.debug("Time elapsed since ResultTime: %.3f seconds." % diff.total_seconds())
-            except KeyError:
-                pass
+        if info and info.rc == mqtt.MQTT_ERR_NO_CONN and item.qos > 0:
+            # not dropped: the client keeps QoS>0 messages and sends them after the reconnection
+            if log_util.sampled(logging.WARNING, "publish_deferred", item.device_id):
+                logging.warning("MQTT client not connected, message to %s queued until the reconnection", item.topic)
             return True
-        else:
+
+        if info:
             logging.error("Something wrong during MQTT publish. Error code retrieved: {0}".format(str(info.rc)))
-            return False
+            reason = mqtt.error_string(info.rc)
+        if dead_letter and self._dead_letters:
+            self._dead_letters.add(item, reason or "unknown error")
+        return False
+
+    def get_dead_letters(self) -> Optional[DeadLetterQueue]:
+        """ The dead-letter queue, None if it is not enabled. """
+        return self._dead_letters
+
+    def replay_dead_letters(self, ids: Optional[List[int]] = None, limit: Optional[int] = None,
+                            rate: Optional[float] = None) -> Optional[int]:
+        """ Publish again (in background) some messages of the dead-letter queue, with a throttled rate.
+
+        :param ids: [OPT] The ids of the dead letters, if not specified the oldest ones are replayed.
+        :param limit: [OPT] The maximum number of dead letters to replay.
+        :param rate: [OPT] The maximum number of messages per second, if not specified the configured one is used.
+        :return: The number of dead letters scheduled for replay, None if a replay is already in progress.
+        """
+        if not self._dead_letters:
+            return 0
+        return self._dead_letters.replay(lambda item: self._mqtt_publish_now(item, block=True, dead_letter=False),
+                                         rate or self._dead_letter_replay_rate, ids, limit)
+
+    def _update_lag_stats(self, now: float, phenomenon_time: Optional[str], result_time: Optional[str]):
+        for stat_key, timestamp in (("phenomenon_time", phenomenon_time), ("result_time", result_time)):
+            if not timestamp:
+                continue
+            try:
+                lag = now - clock.parse_iso(timestamp)
+            except (ValueError, TypeError):
+                logging.debug('Impossible to compute lag for timestamp: "' + str(timestamp) + '"')
+                continue
+
+            logging.debug("Time elapsed since %s: %.3f seconds." % (stat_key, lag))
+            with self._lag_mutex:
+                stats = self._lag_stats[stat_key]
+                stats["count"] += 1
+                stats["total"] += lag
+                stats["max"] = max(stats["max"], lag)
 
     @abstractmethod
     def runtime(self):
@@ -401,11 +1092,29 @@ class SCRALModule(object):
         """
         if self._ogc_config is None:
             return False
-        if device_id in self._resource_catalog:
-            return True
-        else:
-            self._resource_catalog[device_id] = {}
+        # a device registered by concurrent requests (or MQTT messages) gets only one DATASTREAM
+        entry, created = self._resource_catalog.register_if_absent(
+            device_id, lambda: self._build_simple_datastream(device_id, description, x, y, uom))
+        if not created:
+            return entry is not None
+
+        op_name, datastream_id = next(iter(entry.items()))
+        ds = self._ogc_config.get_datastream(datastream_id)
+        topic = self._topic_prefix + "Datastreams"
+        mqtt_payload = {"device_id": device_id,
+                        "observed_property": op_name,
+                        "datastream_id": datastream_id}
+        self.mqtt_publish(topic, json.dumps(mqtt_payload), to_print=True)
+        self.update_file_catalog(device_id)
+
+        return ds
+
+    def _build_simple_datastream(self, device_id: str, description: Optional[str], x: Optional[float],
+                                 y: Optional[float], uom: Optional[dict]) -> dict:
+        """ Register the DATASTREAM of "ogc_simple_datastream_registration" on the OGC server.
 
+        :return: The resource catalog entry of the device.
+        """
         # Supposing to have just 1 OGC THING
         thing = self._ogc_config.get_thing()
         # Supposing to have just 1 OGC SENSOR
@@ -427,18 +1136,10 @@ class SCRALModule(object):
         ds.set_id(datastream_id)
         self._ogc_config.add_datastream(ds)
 
-        self._resource_catalog[device_id][op_name] = datastream_id
-        topic = self._topic_prefix + "Datastreams"
-        mqtt_payload = {"device_id": device_id,
-                        "observed_property": op_name,
-                        "datastream_id": datastream_id}
-        self.mqtt_publish(topic, json.dumps(mqtt_payload), to_print=True)
-        self.update_file_catalog()
-
-        return ds
+        return {op_name: datastream_id}
 
     def _ogc_observation_registration(self, device_id: str, observed_property: str, payload: dict,
-                                     phenomenon_time: Optional[str] = arrow.utcnow(),
+                                     phenomenon_time: Optional[str] = None,
                                      force_registration: Optional[bool] = False) -> Union[bool, None]:
 
         if device_id not in self._resource_catalog:
@@ -448,19 +1149,20 @@ class SCRALModule(object):
                     logging.error('Forced registration of device: "' + device_id + "' failed!")
                     return None
 
-        observation_time = str(arrow.utcnow())
+        observation_time = clock.utc_now_iso()
+        if not phenomenon_time:
+            phenomenon_time = observation_time
 
-        logging.debug('Device:"' + device_id + '", Property:"' + observed_property + '", PhenomenonTime: "' +
-                      phenomenon_time + ', Payload:\n' + json.dumps(payload))
+        if log_util.sampled(logging.DEBUG, "observation", device_id):
+            logging.debug('Device:"%s", Property:"%s", PhenomenonTime: "%s", Payload:\n%s',
+                          device_id, observed_property, phenomenon_time, log_util.LazyJSON(payload))
 
         datastream_id = self._resource_catalog[device_id][observed_property]
-        topic = self._topic_prefix + "Datastreams(" + str(datastream_id) + ")/Observations"
 
         # Create OGC Observation and publish
         ogc_observation = OGCObservation(datastream_id, phenomenon_time, payload, observation_time)
-        observation_payload = json.dumps(ogc_observation.get_rest_payload())
-
-        mqtt_result = self.mqtt_publish(topic=topic, payload=observation_payload, to_print=False)
+        mqtt_result = self.ogc_observation_publish(ogc_observation, to_print=False, device_id=device_id,
+                                                   observed_property=observed_property)
         self._update_active_devices_counter()
         return mqtt_result
 
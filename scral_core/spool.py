@@ -0,0 +1,404 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#############################################################################
+#      _____ __________  ___    __                                          #
+#     / ___// ____/ __ \/   |  / /                                          #
+#     \__ \/ /   / /_/ / /| | / /                                           #
+#    ___/ / /___/ _, _/ ___ |/ /___                                         #
+#   /____/\____/_/ |_/_/  |_/_____/   Smart City Resource Adaptation Layer  #
+#                                                                           #
+# LINKS Foundation, (c) 2017-2020                                           #
+# developed by Jacopo Foglietti & Luca Mannella                             #
+# SCRAL is distributed under a BSD-style license -- See file LICENSE.md     #
+#                                                                           #
+#############################################################################
+"""
+    SCRAL - spool
+    This file contains a durable store-and-forward spool for MQTT messages that cannot be delivered to the broker.
+    Messages are appended to a log of segment files (one JSON record per line) and replayed when the broker is back.
+    It contains also a snapshot file of the in-flight messages, used to publish them again after a restart.
+"""
+
+import base64
+import json
+import logging
+import os
+import time
+from threading import Thread, Lock, Event
+from typing import Callable, List, Optional
+
+from scral_core.constants import DEFAULT_SPOOL_MAX_SIZE, DEFAULT_SPOOL_MAX_AGE, DEFAULT_SPOOL_SEGMENT_SIZE, \
+    DEFAULT_SPOOL_FSYNC_BATCH, DEFAULT_SPOOL_FSYNC_INTERVAL, DEFAULT_SPOOL_REPLAY_RATE, \
+    DEFAULT_INFLIGHT_SNAPSHOT_INTERVAL
+
+SEGMENT_PREFIX = "segment-"
+SEGMENT_SUFFIX = ".log"
+CURSOR_FILENAME = "cursor"
+
+
+class SpoolRecord(object):
+    """ A message stored in the spool. """
+
+    __slots__ = ("topic", "payload", "qos", "content_type", "segment", "end_offset")
+
+    def __init__(self, topic: str, payload, qos: int, content_type: Optional[str] = None,
+                 segment: int = 0, end_offset: int = 0):
+        self.topic = topic
+        self.payload = payload
+        self.qos = qos
+        self.content_type = content_type
+        self.segment = segment  # position of the record inside the spool
+        self.end_offset = end_offset
+
+    def encode(self) -> bytes:
+        record = {"t": self.topic, "q": self.qos}
+        if self.content_type:
+            record["c"] = self.content_type
+        if isinstance(self.payload, (bytes, bytearray)):
+            record["b"] = base64.b64encode(self.payload).decode("ascii")
+        else:
+            record["p"] = self.payload
+        return (json.dumps(record, separators=(",", ":")) + "\n").encode("utf-8")
+
+    @staticmethod
+    def decode(line: bytes, segment: int, end_offset: int) -> "SpoolRecord":
+        record = json.loads(line.decode("utf-8"))
+        if "b" in record:
+            payload = base64.b64decode(record["b"])
+        else:
+            payload = record.get("p")
+        return SpoolRecord(record["t"], payload, record["q"], record.get("c"), segment, end_offset)
+
+
+class ObservationSpool(object):
+    """ An append-only log of segment files stored in a local folder.
+        Writes are flushed to disk every "fsync_batch" records or every "fsync_interval" seconds.
+        The oldest segments are discarded if the spool exceeds "max_size" bytes or if they are older than "max_age".
+        Records are read in order with "peek" and removed with "advance", a segment is deleted once fully read.
+    """
+
+    def __init__(self, folder: str, max_size: int = DEFAULT_SPOOL_MAX_SIZE, max_age: float = DEFAULT_SPOOL_MAX_AGE,
+                 segment_size: int = DEFAULT_SPOOL_SEGMENT_SIZE, fsync_batch: int = DEFAULT_SPOOL_FSYNC_BATCH,
+                 fsync_interval: float = DEFAULT_SPOOL_FSYNC_INTERVAL):
+        """ Open (or create) a spool.
+
+        :param folder: The folder in which segment files are stored.
+        :param max_size: The maximum size (in bytes) of the spool, 0 means unlimited.
+        :param max_age: How many seconds a segment is kept before being discarded, 0 means forever.
+        :param segment_size: The size (in bytes) after which a new segment is started.
+        :param fsync_batch: How many records can be written before forcing an fsync.
+        :param fsync_interval: How many seconds can elapse before forcing an fsync of written records.
+        """
+        self._folder = folder
+        self._max_size = max_size
+        self._max_age = max_age
+        self._segment_size = max(1, segment_size)
+        self._fsync_batch = max(1, fsync_batch)
+        self._fsync_interval = fsync_interval
+
+        self._mutex = Lock()
+        self._unsynced = 0
+        self._last_sync = time.monotonic()
+        self._spooled = 0
+        self._replayed = 0
+        self._discarded_segments = 0
+
+        os.makedirs(folder, exist_ok=True)
+        self._segments = sorted(self._scan_segments())
+        self._read_segment, self._read_offset = self._load_cursor()
+
+        # a new active segment is opened at every start to never append to a partially written record
+        next_segment = self._segments[-1] + 1 if self._segments else 1
+        self._open_segment(next_segment)
+        logging.info('Spool "' + folder + '" opened, ' + str(len(self._segments)) + " segment(s), "
+                     + str(self.get_size()) + " bytes.")
+
+    def _scan_segments(self) -> List[int]:
+        segments = []
+        for filename in os.listdir(self._folder):
+            if filename.startswith(SEGMENT_PREFIX) and filename.endswith(SEGMENT_SUFFIX):
+                try:
+                    segments.append(int(filename[len(SEGMENT_PREFIX):-len(SEGMENT_SUFFIX)]))
+                except ValueError:
+                    logging.warning('Unknown file in spool folder: "' + filename + '"')
+        return segments
+
+    def _segment_path(self, segment: int) -> str:
+        return os.path.join(self._folder, SEGMENT_PREFIX + str(segment).zfill(12) + SEGMENT_SUFFIX)
+
+    def _load_cursor(self) -> (int, int):
+        try:
+            with open(os.path.join(self._folder, CURSOR_FILENAME)) as f:
+                segment, offset = f.read().split()
+                return int(segment), int(offset)
+        except (OSError, ValueError):
+            return (self._segments[0] if self._segments else 0), 0
+
+    def _store_cursor(self):
+        tmp_path = os.path.join(self._folder, CURSOR_FILENAME + ".tmp")
+        with open(tmp_path, "w") as f:
+            f.write(str(self._read_segment) + " " + str(self._read_offset))
+        os.replace(tmp_path, os.path.join(self._folder, CURSOR_FILENAME))
+
+    def _open_segment(self, segment: int):
+        self._active_segment = segment
+        self._active_file = open(self._segment_path(segment), "ab")
+        self._segments.append(segment)
+
+    def _rotate(self):
+        self._sync()
+        self._active_file.close()
+        self._open_segment(self._active_segment + 1)
+
+    def _sync(self):
+        if self._unsynced:
+            self._active_file.flush()
+            os.fsync(self._active_file.fileno())
+            self._unsynced = 0
+        self._last_sync = time.monotonic()
+
+    def _delete_segment(self, segment: int):
+        try:
+            os.remove(self._segment_path(segment))
+        except OSError as ex:
+            logging.error("Impossible to remove spool segment: " + str(ex))
+        self._segments.remove(segment)
+        if segment == self._read_segment:
+            self._read_segment = self._segments[0] if self._segments else 0
+            self._read_offset = 0
+
+    def _enforce_limits(self):
+        now = time.time()
+        for segment in list(self._segments):
+            if segment == self._active_segment:
+                break
+            path = self._segment_path(segment)
+            too_old = self._max_age > 0 and now - os.path.getmtime(path) > self._max_age
+            too_big = 0 < self._max_size < self.get_size()
+            if not too_old and not too_big:
+                break
+            logging.warning("Spool limit reached, segment " + str(segment) + " discarded.")
+            self._delete_segment(segment)
+            self._discarded_segments += 1
+
+    def append(self, topic: str, payload, qos: int, content_type: Optional[str] = None) -> bool:
+        """ Append a message to the spool.
+
+        :return: True if the message was written, False otherwise.
+        """
+        data = SpoolRecord(topic, payload, qos, content_type).encode()
+        with self._mutex:
+            try:
+                if self._active_file.tell() > 0 and self._active_file.tell() + len(data) > self._segment_size:
+                    self._rotate()
+                    self._enforce_limits()
+                self._active_file.write(data)
+                self._unsynced += 1
+                self._spooled += 1
+                if self._unsynced >= self._fsync_batch or \
+                        time.monotonic() - self._last_sync >= self._fsync_interval:
+                    self._sync()
+            except (OSError, ValueError) as ex:  # ValueError if the spool was closed
+                logging.error("Impossible to write on spool: " + str(ex))
+                return False
+        return True
+
+    def sync(self, force: bool = False):
+        """ Flush written records to disk if the fsync interval elapsed (or if forced). """
+        with self._mutex:
+            if force or (self._unsynced and time.monotonic() - self._last_sync >= self._fsync_interval):
+                self._sync()
+
+    def peek(self, max_items: int) -> List[SpoolRecord]:
+        """ Read (without removing them) the oldest records of the spool, all of them belong to the same segment. """
+        with self._mutex:
+            self._enforce_limits()
+            while self._segments:
+                if self._read_segment not in self._segments:
+                    self._read_segment, self._read_offset = self._segments[0], 0
+                if self._read_segment == self._active_segment:
+                    if self._active_file.tell() <= self._read_offset:
+                        return []  # everything has been read
+                    self._rotate()  # the active segment is never read while it is written
+
+                records = self._read_records(self._read_segment, self._read_offset, max_items)
+                if records:
+                    return records
+                self._delete_segment(self._read_segment)  # fully read
+                self._store_cursor()
+            return []
+
+    def _read_records(self, segment: int, offset: int, max_items: int) -> List[SpoolRecord]:
+        records = []
+        with open(self._segment_path(segment), "rb") as f:
+            f.seek(offset)
+            while len(records) < max_items:
+                line = f.readline()
+                if not line.endswith(b"\n"):
+                    break  # end of segment or truncated record
+                offset += len(line)
+                try:
+                    records.append(SpoolRecord.decode(line, segment, offset))
+                except (ValueError, KeyError) as ex:
+                    logging.error("Corrupted spool record skipped: " + str(ex))
+        if not records and offset != self._read_offset:
+            self._read_offset = offset  # only corrupted records were found
+        return records
+
+    def advance(self, record: SpoolRecord):
+        """ Remove from the spool all the records up to (and including) the given one. """
+        with self._mutex:
+            if record.segment == self._read_segment and record.end_offset > self._read_offset:
+                self._read_offset = record.end_offset
+                self._replayed += 1
+                self._store_cursor()
+
+    def close(self):
+        with self._mutex:
+            if self._active_file.closed:
+                return
+            self._sync()
+            self._active_file.close()
+
+    def is_empty(self) -> bool:
+        with self._mutex:
+            return self._read_segment == self._active_segment and self._active_file.tell() <= self._read_offset
+
+    def get_size(self) -> int:
+        """ The size (in bytes) of the segment files. """
+        size = 0
+        for segment in self._segments:
+            try:
+                size += os.path.getsize(self._segment_path(segment))
+            except OSError:
+                pass
+        return size
+
+    def get_folder(self) -> str:
+        return self._folder
+
+    def get_stats(self) -> dict:
+        with self._mutex:
+            return {"segments": len(self._segments), "size": self.get_size(), "spooled": self._spooled,
+                    "replayed": self._replayed, "discarded_segments": self._discarded_segments}
+
+
+class InflightStore(object):
+    """ A snapshot on disk of the QoS>0 messages handed to the MQTT client and not yet acknowledged.
+        After a restart, the messages of the snapshot are published again (at least once delivery): messages published
+        in the last "interval" seconds before a crash could be missing, acknowledged ones could be delivered twice.
+    """
+
+    def __init__(self, path: str, interval: float = DEFAULT_INFLIGHT_SNAPSHOT_INTERVAL):
+        """
+        :param path: The snapshot file.
+        :param interval: The minimum number of seconds between two snapshots.
+        """
+        self._path = path
+        self._interval = interval
+        self._mutex = Lock()
+        self._last_save = 0.0
+        folder = os.path.dirname(path)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+
+    def load(self) -> List[SpoolRecord]:
+        """ Read the messages of the last snapshot. """
+        records = []
+        try:
+            with open(self._path, "rb") as snapshot:
+                for line in snapshot:
+                    try:
+                        records.append(SpoolRecord.decode(line, 0, 0))
+                    except (ValueError, KeyError):
+                        logging.warning("Corrupted record in in-flight snapshot: " + self._path)
+        except FileNotFoundError:
+            pass
+        except OSError as ex:
+            logging.error("Impossible to read in-flight snapshot: " + str(ex))
+        return records
+
+    def save(self, messages: List[tuple]):
+        """ Replace the snapshot (the file is removed if there are no messages).
+
+        :param messages: A list of (topic, payload, qos, content_type).
+        """
+        with self._mutex:
+            self._last_save = time.monotonic()
+            try:
+                if not messages:
+                    if os.path.exists(self._path):
+                        os.remove(self._path)
+                    return
+                tmp_path = self._path + ".tmp"
+                with open(tmp_path, "wb") as snapshot:
+                    for topic, payload, qos, content_type in messages:
+                        snapshot.write(SpoolRecord(topic, payload, qos, content_type).encode())
+                os.replace(tmp_path, self._path)  # atomic: a crash never leaves a partial snapshot
+            except OSError as ex:
+                logging.error("Impossible to write in-flight snapshot: " + str(ex))
+
+    def is_due(self) -> bool:
+        """ True if the snapshot interval elapsed since the last snapshot. """
+        return time.monotonic() - self._last_save >= self._interval
+
+    def get_path(self) -> str:
+        return self._path
+
+
+class SpoolReplayer(Thread):
+    """ This thread replays the spooled messages, at a limited rate, while the MQTT connection is available. """
+
+    def __init__(self, spool: ObservationSpool, publish_function: Callable[[str, object, int, Optional[str]], bool],
+                 is_connected: Callable[[], bool], replay_rate: float = DEFAULT_SPOOL_REPLAY_RATE,
+                 thread_name: str = "spool-replayer"):
+        """
+        :param spool: The spool to replay.
+        :param publish_function: A function that publishes a message (topic, payload, qos, content_type),
+                                 it returns True on success.
+        :param is_connected: A function that tells if the MQTT connection is available.
+        :param replay_rate: The maximum number of messages replayed per second.
+        :param thread_name: The name of the thread.
+        """
+        super().__init__(name=thread_name, daemon=True)
+        self._spool = spool
+        self._publish_function = publish_function
+        self._is_connected = is_connected
+        self._replay_rate = max(1.0, replay_rate)
+        self._wake_up = Event()
+        self._stopped = False
+
+    def notify(self):
+        """ Wake up the replayer, e.g. when the MQTT connection is established again. """
+        self._wake_up.set()
+
+    def stop(self):
+        self._stopped = True
+        self._wake_up.set()
+
+    def run(self):
+        interval = 1.0 / self._replay_rate
+        while not self._stopped:
+            self._wake_up.wait(1.0)
+            self._wake_up.clear()
+            self._spool.sync()
+
+            replayed = 0
+            while not self._stopped and self._is_connected():
+                records = self._spool.peek(max(1, int(self._replay_rate)))
+                if not records:
+                    break
+                for record in records:
+                    if not self._is_connected() or not self._publish_function(
+                            record.topic, record.payload, record.qos, record.content_type):
+                        break
+                    self._spool.advance(record)
+                    replayed += 1
+                    time.sleep(interval)
+                else:
+                    continue
+                break  # publication failed, retry later
+
+            if replayed:
+                logging.info(str(replayed) + " spooled message(s) replayed.")
+
@@ -0,0 +1,54 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#############################################################################
+#      _____ __________  ___    __                                          #
+#     / ___// ____/ __ \/   |  / /                                          #
+#     \__ \/ /   / /_/ / /| | / /                                           #
+#    ___/ / /___/ _, _/ ___ |/ /___                                         #
+#   /____/\____/_/ |_/_/  |_/_____/   Smart City Resource Adaptation Layer  #
+#                                                                           #
+# LINKS Foundation, (c) 2017-2020                                           #
+# developed by Jacopo Foglietti & Luca Mannella                             #
+# SCRAL is distributed under a BSD-style license -- See file LICENSE.md     #
+#                                                                           #
+#############################################################################
+"""
+    SCRAL - clock tests
+"""
+
+import unittest
+
+import arrow
+
+from scral_core import clock
+
+
+class ParseISOTest(unittest.TestCase):
+
+    def test_same_value_as_arrow(self):
+        for text in ("2020-02-14T10:20:30.123456+00:00", "2020-02-14T10:20:30Z", "2020-02-14 10:20:30,5+0130",
+                     "2020-02-14T10:20:30-05:00", "2020-02-14T10:20:30", "2020-02-29T00:00:00Z",
+                     "2020-02-14T24:00:00Z", "2020/02/14T10:20:30Z"):
+            self.assertEqual(clock.parse_iso(text), arrow.get(text).float_timestamp, text)
+
+    def test_malformed_timestamps(self):
+        for text in ("", "garbage", "2020-02-14X10:20:30Z", "2020-02-14T10-20-30Z", "2020-02-14T10:20:30.Z",
+                     "2020-02-14T10:20:30+1:00", "2020-02-14T10:20Z:30"):
+            with self.assertRaises(ValueError, msg=text):
+                clock.parse_iso(text)
+
+    def test_out_of_range_fields(self):
+        for text in ("2020-02-30T10:20:30Z", "2019-02-29T00:00:00Z", "2020-04-31T00:00:00Z", "2020-13-01T00:00:00Z",
+                     "2020-00-10T00:00:00Z", "2020-01-00T00:00:00Z", "0000-01-01T00:00:00Z", "2020-02-14T25:00:00Z",
+                     "2020-02-14T24:00:01Z", "2020-02-14T24:00:00.5Z", "2020-02-14T10:60:00Z", "2020-02-14T10:20:60Z",
+                     "2020-02-14T10:20:30+24:00", "2020-02-14T10:20:30+01:60"):
+            with self.assertRaises(ValueError, msg=text):
+                clock.parse_iso(text)
+
+    def test_format_round_trip(self):
+        timestamp = 1581675630.123456
+        self.assertAlmostEqual(clock.parse_iso(clock.format_iso(timestamp)), timestamp, places=6)
+
+
+if __name__ == "__main__":
+    unittest.main()
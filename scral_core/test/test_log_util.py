@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#############################################################################
+#      _____ __________  ___    __                                          #
+#     / ___// ____/ __ \/   |  / /                                          #
+#     \__ \/ /   / /_/ / /| | / /                                           #
+#    ___/ / /___/ _, _/ ___ |/ /___                                         #
+#   /____/\____/_/ |_/_/  |_/_____/   Smart City Resource Adaptation Layer  #
+#                                                                           #
+# LINKS Foundation, (c) 2017-2020                                           #
+# developed by Jacopo Foglietti & Luca Mannella                             #
+# SCRAL is distributed under a BSD-style license -- See file LICENSE.md     #
+#                                                                           #
+#############################################################################
+"""
+    SCRAL - log_util tests
+"""
+
+import logging
+import threading
+import unittest
+
+from scral_core import log_util
+
+
+class ThreadRecorder(log_util.LazyJSON):
+    """ A LazyJSON that records the threads serializing it. """
+
+    __slots__ = ("threads",)
+
+    def __init__(self, data):
+        super().__init__(data)
+        self.threads = []
+
+    def __str__(self) -> str:
+        self.threads.append(threading.current_thread())
+        return super().__str__()
+
+
+class ListHandler(logging.Handler):
+
+    def __init__(self):
+        super().__init__()
+        self.messages = []
+
+    def emit(self, record: logging.LogRecord):
+        self.messages.append(self.format(record))
+
+
+class AsyncHandlerTest(unittest.TestCase):
+
+    def setUp(self):
+        # a logger outside the hierarchy: no other handler (e.g. of the test runner) formats the records
+        self.logger = logging.Logger("scral-test-async-handler", logging.DEBUG)
+        self.handler = ListHandler()
+        self.queue_handler = log_util.add_async_handler(self.logger, self.handler)
+
+    def tearDown(self):
+        self.logger.removeHandler(self.queue_handler)
+        log_util.stop_async_handlers()
+
+    def test_lazy_json_serialized_by_background_thread(self):
+        argument = ThreadRecorder({"result": 42})
+        self.logger.info("Observation: %s", argument)
+        log_util.stop_async_handlers()  # the queue is drained before returning
+
+        self.assertEqual(self.handler.messages, ['Observation: {"result": 42}'])
+        self.assertEqual(len(argument.threads), 1)
+        self.assertIsNot(argument.threads[0], threading.current_thread())
+
+    def test_exception_formatted_by_background_thread(self):
+        try:
+            raise ValueError("wrong value")
+        except ValueError:
+            self.logger.exception("Failure of %s", "device")
+        log_util.stop_async_handlers()
+
+        self.assertEqual(len(self.handler.messages), 1)
+        self.assertTrue(self.handler.messages[0].startswith("Failure of device\nTraceback"))
+        self.assertIn("ValueError: wrong value", self.handler.messages[0])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#############################################################################
+#      _____ __________  ___    __                                          #
+#     / ___// ____/ __ \/   |  / /                                          #
+#     \__ \/ /   / /_/ / /| | / /                                           #
+#    ___/ / /___/ _, _/ ___ |/ /___                                         #
+#   /____/\____/_/ |_/_/  |_/_____/   Smart City Resource Adaptation Layer  #
+#                                                                           #
+# LINKS Foundation, (c) 2017-2020                                           #
+# developed by Jacopo Foglietti & Luca Mannella                             #
+# SCRAL is distributed under a BSD-style license -- See file LICENSE.md     #
+#                                                                           #
+#############################################################################
+"""
+    SCRAL - MQTTPublisher tests
+    A minimal MQTT v3.1.1 broker (CONNECT, PUBLISH, PINGREQ and DISCONNECT) is used to drop the connection on purpose.
+"""
+
+import socket
+import tempfile
+import time
+import unittest
+from threading import Thread, Lock
+
+from scral_core.mqtt_publisher import MQTTPublisher
+from scral_core.spool import ObservationSpool
+
+MESSAGES = 20
+
+
+class FakeBroker(Thread):
+    """ It records each PUBLISH received (connection index, payload, dup flag).
+        The first "drops" connections never acknowledge the messages and are closed after "expected" publications.
+    """
+
+    def __init__(self, drops: int, expected: int):
+        super().__init__(name="fake-broker", daemon=True)
+        self._server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self._server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self._server.bind(("127.0.0.1", 0))
+        self._server.listen(1)
+        self._drops = drops
+        self._expected = expected
+        self._mutex = Lock()
+        self.received = []
+        self.connections = 0
+
+    def get_port(self) -> int:
+        return self._server.getsockname()[1]
+
+    def close(self):
+        self._server.close()
+
+    def run(self):
+        while True:
+            try:
+                connection, _ = self._server.accept()
+            except OSError:
+                return
+            with self._mutex:
+                index = self.connections
+                self.connections += 1
+            try:
+                self._serve(connection, index)
+            except OSError:
+                pass
+            finally:
+                connection.close()
+
+    def _serve(self, connection: socket.socket, index: int):
+        received = 0
+        while True:
+            header = self._read(connection, 1)
+            if not header:
+                return
+            length, multiplier = 0, 1
+            while True:
+                byte = self._read(connection, 1)[0]
+                length += (byte & 0x7F) * multiplier
+                multiplier *= 128
+                if not byte & 0x80:
+                    break
+            body = self._read(connection, length)
+            packet_type = header[0] >> 4
+
+            if packet_type == 1:  # CONNECT
+                connection.sendall(b"\x20\x02\x00\x00")
+            elif packet_type == 3:  # PUBLISH
+                qos = (header[0] >> 1) & 0x03
+                topic_length = int.from_bytes(body[:2], "big")
+                position = 2 + topic_length
+                mid = body[position:position + 2] if qos else b""
+                payload = body[position + len(mid):].decode("utf-8")
+                with self._mutex:
+                    self.received.append((index, payload, bool(header[0] & 0x08)))
+                received += 1
+                if index >= self._drops:
+                    connection.sendall(b"\x40\x02" + mid)  # PUBACK
+                elif received >= self._expected:
+                    return  # connection lost without acknowledging anything
+            elif packet_type == 12:  # PINGREQ
+                connection.sendall(b"\xd0\x00")
+            elif packet_type == 14:  # DISCONNECT
+                return
+
+    @staticmethod
+    def _read(connection: socket.socket, size: int) -> bytes:
+        data = b""
+        while len(data) < size:
+            chunk = connection.recv(size - len(data))
+            if not chunk:
+                return b""
+            data += chunk
+        return data
+
+
+def wait_until(condition, timeout: float = 30.0) -> bool:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.05)
+    return condition()
+
+
+class SpoolOwnershipTest(unittest.TestCase):
+
+    def test_unacknowledged_messages_delivered_once_per_connection(self):
+        """ After each connection loss, unacknowledged messages are sent again only by the spool replayer. """
+        broker = FakeBroker(drops=2, expected=MESSAGES)
+        broker.start()
+        with tempfile.TemporaryDirectory() as folder:
+            publisher = MQTTPublisher("test-publisher", "127.0.0.1", broker.get_port(), keepalive=10,
+                                      spool=ObservationSpool(folder), spool_replay_rate=1000)
+            try:
+                publisher.connect()
+                self.assertTrue(wait_until(publisher.is_connected))
+                for i in range(MESSAGES):
+                    publisher.publish("test/topic", str(i), 1)
+
+                self.assertTrue(wait_until(lambda: broker.connections == 3 and publisher.get_pending_messages() == 0
+                                           and not publisher.get_spool().peek(1)))
+                time.sleep(1.5)  # nothing else has to be sent
+            finally:
+                publisher.disconnect(5)
+                broker.close()
+
+        expected = sorted(str(i) for i in range(MESSAGES))
+        for index in range(3):
+            payloads = [payload for connection, payload, _ in broker.received if connection == index]
+            self.assertEqual(sorted(payloads), expected, "connection " + str(index))
+        # after a connection loss, Paho does not send again (with DUP flag) the messages moved to the spool
+        self.assertFalse([payload for connection, payload, dup in broker.received if dup])
+
+
+if __name__ == "__main__":
+    unittest.main()
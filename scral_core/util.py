@@ -18,18 +18,19 @@
 import argparse
 import json
 from logging import Logger
+from logging.handlers import QueueHandler
 import logging
 import os
-import re
 import sys
 
 from configparser import ConfigParser
-from typing import Union, Optional, Dict
+from typing import Callable, List, Union, Optional, Dict
 
 from arrow.arrow import Arrow
 
+from scral_core import clock, log_util
 from scral_core.constants import CREDITS, DEFAULT_CONFIG, DEFAULT_LOG_FORMATTER, DEFAULT_URL, DEFAULT_MODULE_NAME, \
-    MODULE_NAME_KEY, ENDPOINT_PORT_KEY, ENDPOINT_URL_KEY, GOST_PREFIX_KEY, OPT_LIST, \
+    DEFAULT_LOG_DATE_FORMAT, MODULE_NAME_KEY, ENDPOINT_PORT_KEY, ENDPOINT_URL_KEY, GOST_PREFIX_KEY, OPT_LIST, \
     PREFERENCE_PATH_KEY, PREFERENCE_FILE_KEY, CATALOG_NAME_KEY, CONFIG_PATH_KEY, \
     FILENAME_CONFIG, FILENAME_COMMAND_FILE, OGC_SERVER_USERNAME, OGC_SERVER_PASSWORD, \
     D_CONFIG_KEY, D_CUSTOM_MODE, DEFAULT_REST_PORT, VERBOSE_KEY, OGC_FILE_KEY, ERROR_MISSING_ENV_VARIABLE, D_OGC_USER, \
@@ -37,16 +38,23 @@ from scral_core.constants import CREDITS, DEFAULT_CONFIG, DEFAULT_LOG_FORMATTER,
 
 
 def init_logger(debug_level: Union[int, str]):
-    """ This function configure the logger according to the specified debug_level taken from logging class. """
+    """ This function configure the logger according to the specified debug_level taken from logging class.
+        Records are written on stderr by a background thread.
+    """
 
-    logging.basicConfig(format="%(message)s")
-    logging.getLogger().setLevel(level=debug_level)
-    logging.getLogger().handlers[0].setFormatter(logging.Formatter(DEFAULT_LOG_FORMATTER, datefmt="(%b-%d) %H:%M:%S"))
+    root = logging.getLogger()
+    root.setLevel(level=debug_level)
+    if not any(isinstance(handler, QueueHandler) for handler in root.handlers):
+        for handler in list(root.handlers):  # e.g. added by a logging call executed before this function
+            root.removeHandler(handler)
+        handler = logging.StreamHandler()
+        handler.setFormatter(logging.Formatter(DEFAULT_LOG_FORMATTER, datefmt=DEFAULT_LOG_DATE_FORMAT))
+        log_util.add_async_handler(root, handler)
 
 
 def init_mirrored_logger(log_name: str, debug_level: Union[int, str], output_filename: Optional[str] = None) -> Logger:
     """ This function configure the logger according to the specified debug_level taken from logging class.
-        It is possible also to specify a filename on which the log will be mirrored.
+        It is possible also to specify a filename on which the log will be mirrored (by a background thread).
 
     :param log_name: The name assigned to the new generated log.
     :param output_filename: A filename (or filepath) on which the log will be mirrored.
@@ -59,8 +67,8 @@ def init_mirrored_logger(log_name: str, debug_level: Union[int, str], output_fil
     if output_filename:
         fh = logging.FileHandler(output_filename)
         fh.setLevel(level=debug_level)
-        fh.setFormatter(logging.Formatter(DEFAULT_LOG_FORMATTER, datefmt="(%b-%d) %H:%M:%S"))
-        logger.addHandler(fh)
+        fh.setFormatter(logging.Formatter(DEFAULT_LOG_FORMATTER, datefmt=DEFAULT_LOG_DATE_FORMAT))
+        log_util.add_async_handler(logger, fh)
 
     return logger
 
@@ -286,6 +294,56 @@ def load_from_file(filename: str) -> dict:
         raise FileNotFoundError("File: "+filename+" not found or you don't have permission to read it!")
 
 
+def get_optional_preference(preferences: Optional[dict], key: str, default):
+    """ Retrieve an optional configuration value.
+        If a preference dictionary is given (e.g. the "mqtt" section of preference.json) the value is taken from it,
+        otherwise (custom mode) it is taken from the environmental variable named as the upper case key.
+        Values read from environment are converted to the type of the default value (JSON is used for lists and dicts,
+        booleans accept true/false, yes/no, on/off and 1/0). If the value cannot be converted, an error is logged and
+        the default value is returned. If the default value is None, the raw string is returned.
+
+    :param preferences: A dictionary of preferences or None if environmental variables have to be used.
+    :param key: The name of the preference.
+    :param default: The value returned if the preference is not configured.
+    :return: The configured value or the default one.
+    """
+    if preferences is not None:
+        return preferences.get(key, default)
+
+    env_name = key.upper()
+    value = os.environ.get(env_name)
+    if value is None:
+        return default
+    if isinstance(default, bool):  # bool("false") is True: the value has to be parsed explicitly
+        lowered = value.strip().lower()
+        if lowered in ("1", "true", "yes", "on"):
+            return True
+        if lowered in ("0", "false", "no", "off"):
+            return False
+        logging.error("Invalid boolean value '" + value + "' for environmental variable " + env_name +
+                      ", default value will be used: " + str(default))
+        return default
+    if isinstance(default, (int, float)):
+        try:
+            return type(default)(value.strip())
+        except ValueError:
+            logging.error("Invalid " + type(default).__name__ + " value '" + value + "' for environmental variable " +
+                          env_name + ", default value will be used: " + str(default))
+            return default
+    if isinstance(default, (list, dict)):
+        try:
+            parsed = json.loads(value)
+        except ValueError:
+            parsed = None
+        if not isinstance(parsed, type(default)):
+            logging.error("Invalid JSON " + type(default).__name__ + " '" + value + "' for environmental variable " +
+                          env_name + ", default value will be used: " + str(default))
+            return default
+        return parsed
+    # A None default has no type to convert to: the raw string is returned (e.g. client_id or instance_name).
+    return value
+
+
 def write_to_file(filename: str, data):
     """ Update a configuration file (it will be created if does not exists.
 
@@ -298,10 +356,32 @@ def write_to_file(filename: str, data):
         outfile.write('\n')
 
 
-def signal_handler(signal, frame):
-    """ This signal handler overwrite the default behaviour of SIGKILL (pressing CTRL+C). """
+_shutdown_hooks: List[Callable[[], None]] = []
+_shutting_down = False
 
-    logging.critical('You pressed Ctrl+C!')
+
+def add_shutdown_hook(hook: Callable[[], None]):
+    """ Register a function executed by "signal_handler" before exiting (e.g. to drain publishing queues). """
+    _shutdown_hooks.append(hook)
+
+
+def signal_handler(signal, frame):
+    """ This signal handler overwrite the default behaviour of SIGINT (pressing CTRL+C) and SIGTERM (e.g. docker stop).
+        The shutdown hooks are executed (in reverse registration order) before exiting,
+        a second signal received meanwhile forces the exit.
+    """
+    global _shutting_down
+    if _shutting_down:
+        logging.critical("Signal " + str(signal) + " received again, forcing exit!")
+        sys.exit(1)
+    _shutting_down = True
+
+    logging.critical("Signal " + str(signal) + " received, SCRAL is shutting down...")
+    for hook in reversed(_shutdown_hooks):
+        try:
+            hook()
+        except Exception as ex:
+            logging.error("Exception caught during shutdown: {0}".format(ex))
     print("\nSCRAL is turning down now, thanks for choosing SCRAL!\n"+CREDITS)
     sys.exit(0)
 
@@ -334,23 +414,19 @@ def build_ogc_unit_of_measure(property_name: str) -> Dict[str, str]:
     return uom
 
 
-def from_utc_to_query(utc_timestamp: Arrow, remove_milliseconds: bool = True, html_formatting: bool = False) -> str:
-    """ This function convert an arrow UTC timestamp in a data format adapted for a REST request.
+def from_utc_to_query(utc_timestamp: Union[Arrow, float], remove_milliseconds: bool = True,
+                      html_formatting: bool = False) -> str:
+    """ This function convert a UTC timestamp in a data format adapted for a REST request.
 
-    :param utc_timestamp: A timestamp in Arrow format (e.g. 2019-05-13T11:22:33+01:00).
+    :param utc_timestamp: A timestamp in Arrow format (e.g. 2019-05-13T11:22:33+01:00) or in seconds since the epoch
+                          (e.g. clock.utc_now(), faster).
     :param remove_milliseconds: if is set to True, milliseconds are removed from timestamp.
     :param html_formatting: If true the string is HTML encoded (e.g.: ':' converted to "%3A".
     :return: A string timestamp adapted for a REST query (e.g. 2019-05-13T11%3A22%3A33Z).
     """
-    time_stamp = str(utc_timestamp).split('+')[0]
-    if remove_milliseconds:
-        time_stamp = str(utc_timestamp).split('.')[0]
-    time_stamp += 'Z'
-
-    if html_formatting:
-        return re.sub(':', '%3A', str(time_stamp))
-
-    return time_stamp
+    if isinstance(utc_timestamp, Arrow):
+        utc_timestamp = utc_timestamp.float_timestamp
+    return clock.format_query(utc_timestamp, remove_milliseconds, html_formatting)
 
 
 def to_html_documentation(module_name: str, link: str,
@@ -16,6 +16,18 @@ class OGCObservation:
     def get_id(self) -> int:
         return self._id
 
+    def get_datastream_id(self) -> int:
+        return self._ogc_datastream_id
+
+    def get_phenomenon_time(self) -> str:
+        return self._phenomenon_time
+
+    def get_result_time(self) -> str:
+        return self._result_time
+
+    def get_result(self):
+        return self._result
+
     def get_rest_payload(self) -> dict:
         return {
             "phenomenonTime": self._phenomenon_time,
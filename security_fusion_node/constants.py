@@ -41,6 +41,7 @@ MODULE_ID_KEY = "module_id"
 TYPE_MODULE_KEY = "type_module"
 
 FIGHT_KEY = "fighting_detection"
+FIGHT_PROPERTY = "FD-Estimation"
 CROWD_KEY = "crowd_density_local"
 FLOW_KEY = "flow_analysis"
 OBJECT_KEY = "object_detection"
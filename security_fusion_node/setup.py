@@ -2,6 +2,6 @@ from setuptools import setup, find_packages
 
 setup(name='scral_ogc', version='1.0', packages=find_packages())
 setup(name='scral_core', version='1.0', packages=find_packages(),
-      install_requires=['requests', 'paho-mqtt', 'arrow', 'config_parser'])
+      install_requires=['requests', 'paho-mqtt==1.5.1', 'arrow', 'config_parser'])
 setup(name='security_fusion_node', version='1.0', packages=find_packages(),
-      install_requires=['requests', 'paho-mqtt', 'arrow', 'config_parser', 'flask', 'cherrypy'])
+      install_requires=['requests', 'paho-mqtt==1.5.1', 'arrow', 'config_parser', 'flask', 'cherrypy'])
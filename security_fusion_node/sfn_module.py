@@ -12,26 +12,27 @@
 # SCRAL is distributed under a BSD-style license -- See file LICENSE.md     #
 #                                                                           #
 #############################################################################
-import json
 import logging
 from typing import Union
 
-import arrow
 from flask import make_response, jsonify, Response
 
 from scral_ogc import OGCObservation, OGCObservedProperty, OGCDatastream
 
 from scral_core.constants import TIMESTAMP_KEY, OPT_COORD, \
-    SUCCESS_RETURN_STRING, ERROR_RETURN_STRING, INTERNAL_SERVER_ERROR
-from scral_core import util
+    SUCCESS_RETURN_STRING, ERROR_RETURN_STRING, INTERNAL_SERVER_ERROR, DUPLICATE_REQUEST, PRIORITY_HIGH
+from scral_core import clock, log_util, util
 from scral_core.rest_module import SCRALRestModule
 
-from security_fusion_node.constants import CAMERA_SENSOR_TYPE, CAMERA_POSITION_KEY, CDG_SENSOR_TYPE, CDG_PROPERTY
+from security_fusion_node.constants import CAMERA_SENSOR_TYPE, CAMERA_POSITION_KEY, CDG_SENSOR_TYPE, CDG_PROPERTY, \
+    FIGHT_PROPERTY
 
 
 class SCRALSecurityFusionNode(SCRALRestModule):
     """ Resource manager for integration of the Security Fusion Node. """
 
+    _default_priorities = {FIGHT_PROPERTY: PRIORITY_HIGH}
+
     def ogc_datastream_registration(self, resource_id: str, sensor_type: str, payload: dict) -> Response:
         """ This function registers new datastream in the OGC model.
 
@@ -43,22 +44,39 @@ class SCRALSecurityFusionNode(SCRALRestModule):
         if self._ogc_config is None:
             return make_response(jsonify({ERROR_RETURN_STRING: INTERNAL_SERVER_ERROR}), 500)
 
-        self._resource_catalog[resource_id] = {}
+        # concurrent registrations of the same resource register its DATASTREAMs only once
+        entry, created = self._resource_catalog.register_if_absent(
+            resource_id, lambda: self._build_catalog_entry(resource_id, sensor_type, payload))
+        if entry is None:
+            return make_response(jsonify({ERROR_RETURN_STRING: INTERNAL_SERVER_ERROR}), 500)
+        if not created:
+            logging.error(sensor_type + ": '" + str(resource_id) + "' already registered!")
+            return make_response(jsonify({ERROR_RETURN_STRING: DUPLICATE_REQUEST}), 422)
+
+        self.update_file_catalog(resource_id)
+        return make_response(jsonify({SUCCESS_RETURN_STRING: "Ok"}), 201)
+
+    def _build_catalog_entry(self, resource_id: str, sensor_type: str, payload: dict) -> Union[dict, None]:
+        """ Register the DATASTREAMs of a resource on the OGC server.
+
+        :return: The resource catalog entry of the resource, None if the registration failed.
+        """
+        entry = {}  # added to the resource catalog only when complete
         for op in self._ogc_config.get_observed_properties():
             property_name = op.get_name()
             if sensor_type == CAMERA_SENSOR_TYPE and property_name != CDG_PROPERTY:
                 coordinates = payload[CAMERA_POSITION_KEY]
-                ok = self._ogc_datastream_registration(resource_id, sensor_type, op, payload, coordinates)
-                if not ok:
-                    return make_response(jsonify({ERROR_RETURN_STRING: INTERNAL_SERVER_ERROR}), 500)
-
+                datastream_id = self._ogc_datastream_registration(resource_id, sensor_type, op, payload, coordinates)
             elif sensor_type == CDG_SENSOR_TYPE and property_name == CDG_PROPERTY:
-                ok = self._ogc_datastream_registration(resource_id, sensor_type, op, payload)
-                if not ok:
-                    return make_response(jsonify({ERROR_RETURN_STRING: INTERNAL_SERVER_ERROR}), 500)
+                datastream_id = self._ogc_datastream_registration(resource_id, sensor_type, op, payload)
+            else:
+                continue
 
-        self.update_file_catalog()
-        return make_response(jsonify({SUCCESS_RETURN_STRING: "Ok"}), 201)
+            if not datastream_id:
+                return None
+            entry[property_name] = datastream_id
+
+        return entry
 
     def ogc_datastream_patch(self, resource_id: str, sensor_type: str, payload: dict) -> Response:
         """ This function update DATASTREAMs values stored in the OGC model (e.g. unitOfMeasurement value).
@@ -110,7 +128,6 @@ class SCRALSecurityFusionNode(SCRALRestModule):
         else:
             datastream.set_id(datastream_id)
             self._ogc_config.add_datastream(datastream)
-            self._resource_catalog[resource_id][property_name] = datastream_id
 
         return datastream_id
 
@@ -122,18 +139,18 @@ class SCRALSecurityFusionNode(SCRALRestModule):
         if not phenomenon_time:
             phenomenon_time = payload.pop("timestamp_1", False)
             if not phenomenon_time:
-                phenomenon_time = str(arrow.utcnow())
-        observation_time = str(arrow.utcnow())
+                phenomenon_time = clock.utc_now_iso()
+        observation_time = clock.utc_now_iso()
 
-        logging.debug("Device: '"+resource_id+"', Property: '"+obs_property+"', Observation:\n"+json.dumps(payload)+".")
+        if log_util.sampled(logging.DEBUG, "observation", resource_id):
+            logging.debug("Device: '%s', Property: '%s', Observation:\n%s.",
+                          resource_id, obs_property, log_util.LazyJSON(payload))
 
         datastream_id = self._resource_catalog[resource_id][obs_property]
-        topic = self._topic_prefix + "Datastreams(" + str(datastream_id) + ")/Observations"
 
         # Create OGC Observation and publish
         ogc_observation = OGCObservation(datastream_id, phenomenon_time, payload, observation_time)
-        observation_payload = json.dumps(ogc_observation.get_rest_payload())
-
-        mqtt_response = self.mqtt_publish(topic, observation_payload)
+        mqtt_response = self.ogc_observation_publish(ogc_observation, device_id=resource_id,
+                                                     observed_property=obs_property)
         self._update_active_devices_counter()
         return mqtt_response
@@ -35,16 +35,17 @@ from urllib import request
 from flask import Flask, request, jsonify, make_response, Response
 
 import scral_core as scral
-from scral_core import util, rest_util
+from scral_core import log_util, util, rest_util
 from scral_core.constants import END_MESSAGE, ENABLE_CHERRYPY, DEFAULT_REST_CONFIG, SUCCESS_RETURN_STRING, \
                                    ENDPOINT_PORT_KEY, ENDPOINT_URL_KEY, MODULE_NAME_KEY, TIMESTAMP_KEY, \
-                                   ERROR_RETURN_STRING, WRONG_REQUEST, INTERNAL_SERVER_ERROR, DUPLICATE_REQUEST, \
+                                   ERROR_RETURN_STRING, WRONG_REQUEST, INTERNAL_SERVER_ERROR, \
                                    UNKNOWN_PROPERTY, WRONG_PAYLOAD_REQUEST
 
 from security_fusion_node.constants import CAMERA_SENSOR_TYPE, CDG_SENSOR_TYPE, CDG_PROPERTY, \
                                            URI_DEFAULT, URI_ACTIVE_DEVICES, URI_CAMERA, URI_CDG, \
                                            CAMERA_ID_KEY, CAMERA_IDS_KEY, MODULE_ID_KEY, TYPE_MODULE_KEY, CDG_KEY, \
-                                           FIGHT_KEY, CROWD_KEY, FLOW_KEY, OBJECT_KEY, GATE_COUNT_KEY
+                                           FIGHT_KEY, CROWD_KEY, FLOW_KEY, OBJECT_KEY, GATE_COUNT_KEY, \
+                                           FIGHT_PROPERTY
 from security_fusion_node.sfn_module import SCRALSecurityFusionNode
 
 flask_instance = Flask(__name__)
@@ -67,7 +68,7 @@ def camera_request() -> Response:
 
     :return: An HTTP Response.
     """
-    logging.debug(camera_request.__name__ + ", " + request.method + " method called from: " + request.remote_addr)
+    logging.debug("%s, %s method called from: %s", camera_request.__name__, request.method, request.remote_addr)
 
     ok, status = rest_util.tests_and_checks(DOC[MODULE_NAME_KEY], scral_module, request)
     if not ok:
@@ -75,23 +76,18 @@ def camera_request() -> Response:
 
     if request.method == "POST":  # POST
         camera_id = request.json[CAMERA_ID_KEY]
-        rc = scral_module.get_resource_catalog()
-
-        if camera_id not in rc:
-            logging.info('Camera: "' + str(camera_id) + '" registration.')
-            response = scral_module.ogc_datastream_registration(camera_id, CAMERA_SENSOR_TYPE, request.json)
-        else:
-            logging.error("Camera already registered!")
-            response = make_response(jsonify({ERROR_RETURN_STRING: DUPLICATE_REQUEST}), 422)
+        logging.info('Camera: "' + str(camera_id) + '" registration.')
+        response = scral_module.ogc_datastream_registration(camera_id, CAMERA_SENSOR_TYPE, request.json)
         return response
 
     elif request.method == "PUT":  # PUT
         camera_id = str(request.json[CAMERA_IDS_KEY][0])
-        logging.info("New OBSERVATION from camera: '"+str(camera_id)+"'.")
+        if log_util.sampled(logging.INFO, "request", camera_id):
+            logging.info("New OBSERVATION from camera: '%s'.", camera_id)
         property_type = request.json[TYPE_MODULE_KEY]
 
         if property_type == FIGHT_KEY:
-            observed_property = "FD-Estimation"
+            observed_property = FIGHT_PROPERTY
         elif property_type == CROWD_KEY:
             observed_property = "CDL-Estimation"
         elif property_type == FLOW_KEY:
@@ -127,7 +123,7 @@ def cdg_request() -> Response:
 
     :return: An HTTP Response.
     """
-    logging.debug(cdg_request.__name__ + ", " + request.method + " method called from: " + request.remote_addr)
+    logging.debug("%s, %s method called from: %s", cdg_request.__name__, request.method, request.remote_addr)
 
     ok, status = rest_util.tests_and_checks(DOC[MODULE_NAME_KEY], scral_module, request)
     if not ok:
@@ -141,17 +137,13 @@ def cdg_request() -> Response:
         return make_response(jsonify({ERROR_RETURN_STRING: WRONG_PAYLOAD_REQUEST}), 400)
 
     if request.method == "POST":  # POST
-        rc = scral_module.get_resource_catalog()
-        if cdg_module_id not in rc:
-            logging.info("CDG: '" + str(cdg_module_id) + "' registration.")
-            response = scral_module.ogc_datastream_registration(cdg_module_id, CDG_SENSOR_TYPE, request.json)
-        else:
-            logging.error("CDG module already registered!")
-            response = make_response(jsonify({ERROR_RETURN_STRING: DUPLICATE_REQUEST}), 422)
+        logging.info("CDG: '" + str(cdg_module_id) + "' registration.")
+        response = scral_module.ogc_datastream_registration(cdg_module_id, CDG_SENSOR_TYPE, request.json)
         return response
 
     elif request.method == "PUT":  # PUT
-        logging.info("New OBSERVATION from CDG: '" + str(cdg_module_id))
+        if log_util.sampled(logging.INFO, "request", cdg_module_id):
+            logging.info("New OBSERVATION from CDG: '%s'", cdg_module_id)
 
         property_type = request.json[TYPE_MODULE_KEY]
         request.json[TIMESTAMP_KEY] = request.json.pop("timestamp_1")  # renaming "timestamp_1" to "timestamp"
@@ -189,7 +181,9 @@ def put_observation(resource_id: str, observed_property: str, payload: dict) ->
         logging.critical("No Security Fusion Node instantiated!")
         return make_response(jsonify({ERROR_RETURN_STRING: INTERNAL_SERVER_ERROR}), 500)
 
-    result = scral_module.ogc_observation_registration(resource_id, observed_property, payload)
+    # OBSERVATIONs of the same device are published in order, the ones of different devices in parallel
+    result = scral_module.execute_ordered(resource_id, scral_module.ogc_observation_registration,
+                                          resource_id, observed_property, payload)
     if result is True:
         return make_response(jsonify({SUCCESS_RETURN_STRING: "Ok"}), 201)
     elif result is None:
@@ -205,7 +199,7 @@ def get_active_devices() -> Response:
     """ This endpoint gives access to the resource catalog.
     :return: A JSON containing thr resource catalog.
     """
-    logging.debug(get_active_devices.__name__ + " method called from: "+request.remote_addr)
+    logging.debug("%s method called from: %s", get_active_devices.__name__, request.remote_addr)
 
     to_ret = jsonify(scral_module.get_active_devices())
     return make_response(to_ret, 200)
@@ -216,7 +210,7 @@ def test_module() -> str:
     """ Checking if SCRAL is running.
     :return: A str containing some information about possible endpoints.
     """
-    logging.debug(test_module.__name__+" method called from: "+request.remote_addr)
+    logging.debug("%s method called from: %s", test_module.__name__, request.remote_addr)
 
     link = DOC[ENDPOINT_URL_KEY] + ":" + str(DOC[ENDPOINT_PORT_KEY])
     deletes = posts = (URI_CAMERA, URI_CDG)
@@ -231,5 +225,6 @@ if __name__ == '__main__':
     sys.stdout.flush()
 
     signal.signal(signal.SIGINT, util.signal_handler)
+    signal.signal(signal.SIGTERM, util.signal_handler)
     main()
     print(END_MESSAGE)
@@ -12,25 +12,45 @@
 # SCRAL is distributed under a BSD-style license -- See file LICENSE.md     #
 #                                                                           #
 #############################################################################
-import json
 import logging
 from typing import Union
 
-import arrow
-from smart_glasses.constants import TAG_ID_KEY, TIMESTAMP_KEY
+from smart_glasses.constants import TAG_ID_KEY, TIMESTAMP_KEY, PROPERTY_INCIDENT_NAME
 
 from scral_ogc import OGCObservation
 from scral_ogc.ogc_datastream import OGCDatastream
-from scral_core import util
+from scral_core import clock, log_util, util
+from scral_core.constants import PRIORITY_HIGH
 from scral_core.rest_module import SCRALRestModule
 
 
 class SCRALSmartGlasses(SCRALRestModule):
 
-    def ogc_datastream_registration(self, glasses_id: str) -> bool:
+    _default_priorities = {PROPERTY_INCIDENT_NAME: PRIORITY_HIGH}
+
+    def ogc_datastream_registration(self, glasses_id: str) -> Union[bool, None]:
+        """ Register the DATASTREAMs of new glasses.
+
+        :return: True if the glasses were registered, False if the registration failed,
+                 None if they were already registered.
+        """
         if self._ogc_config is None:
             return False
 
+        # concurrent registrations of the same glasses register their DATASTREAMs only once
+        entry, created = self._resource_catalog.register_if_absent(
+            glasses_id, lambda: self._build_catalog_entry(glasses_id))
+        if not created:
+            return None if entry is not None else False
+
+        self.update_file_catalog(glasses_id)
+        return True
+
+    def _build_catalog_entry(self, glasses_id: str) -> Union[dict, None]:
+        """ Register the DATASTREAMs of the glasses on the OGC server.
+
+        :return: The resource catalog entry of the glasses, None if the registration failed.
+        """
         # Collect OGC information needed to build DATASTREAMs payload
         thing = self._ogc_config.get_thing()
         thing_id = thing.get_id()
@@ -40,9 +60,7 @@ class SCRALSmartGlasses(SCRALRestModule):
         sensor_id = sensor.get_id()
         sensor_name = sensor.get_name()
 
-        rc = self._resource_catalog
-
-        rc[glasses_id] = {}
+        entry = {}  # added to the resource catalog only when complete
         for op in self._ogc_config.get_observed_properties():
             property_id = op.get_id()
             property_name = op.get_name()
@@ -58,14 +76,13 @@ class SCRALSmartGlasses(SCRALRestModule):
                 datastream, self._ogc_config.URL_DATASTREAMS, self._ogc_config.FILTER_NAME)
 
             if not datastream_id:
-                return False
+                return None
 
             datastream.set_id(datastream_id)
             self._ogc_config.add_datastream(datastream)
-            rc[glasses_id][property_name] = datastream_id
+            entry[property_name] = datastream_id
 
-        self.update_file_catalog()
-        return True
+        return entry
 
     def ogc_observation_registration(self, obs_property: str, payload: dict) -> Union[None, bool]:
         glasses_id = payload[TAG_ID_KEY]
@@ -73,19 +90,18 @@ class SCRALSmartGlasses(SCRALRestModule):
             return None
 
         phenomenon_time = payload.pop(TIMESTAMP_KEY)  # Retrieving and removing the phenomenon time
-        observation_time = str(arrow.utcnow())
+        observation_time = clock.utc_now_iso()
         observation_result = payload
 
-        logging.debug(
-            "Glasses: '"+glasses_id+"', Property: '"+obs_property+"', Observation:\n"+json.dumps(observation_result)+".")
+        if log_util.sampled(logging.DEBUG, "observation", glasses_id):
+            logging.debug("Glasses: '%s', Property: '%s', Observation:\n%s.",
+                          glasses_id, obs_property, log_util.LazyJSON(observation_result))
 
         datastream_id = self._resource_catalog[glasses_id][obs_property]
-        topic = self._topic_prefix + "Datastreams(" + str(datastream_id) + ")/Observations"
 
         # Create OGC Observation and publish
         ogc_observation = OGCObservation(datastream_id, phenomenon_time, observation_result, observation_time)
-        observation_payload = json.dumps(ogc_observation.get_rest_payload())
-
-        mqtt_response = self.mqtt_publish(topic, observation_payload)
+        mqtt_response = self.ogc_observation_publish(ogc_observation, device_id=glasses_id,
+                                                     observed_property=obs_property)
         self._update_active_devices_counter()
         return mqtt_response
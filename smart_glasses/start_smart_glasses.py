@@ -64,7 +64,7 @@ def glasses_request() -> Response:
     """ This function can register new glasses in the OGC server.
     :return: An HTTP Response.
     """
-    logging.debug(glasses_request.__name__ + " method called from: " + request.remote_addr)
+    logging.debug("%s method called from: %s", glasses_request.__name__, request.remote_addr)
 
     ok, status = rest_util.tests_and_checks(DOC[MODULE_NAME_KEY], scral_module, request)
     if not ok:
@@ -74,14 +74,12 @@ def glasses_request() -> Response:
 
     if request.method == "POST":  # POST
         # -> ### DATASTREAM REGISTRATION ###
-        rc = scral_module.get_resource_catalog()
-        if glasses_id in rc:
-            logging.error("Device already registered!")
-            return make_response(jsonify({ERROR_RETURN_STRING: DUPLICATE_REQUEST}), 422)
-
         logging.info("Glasses: '" + str(glasses_id) + "' registration.")
         ok = scral_module.ogc_datastream_registration(glasses_id)
-        if not ok:
+        if ok is None:
+            logging.error("Device already registered!")
+            return make_response(jsonify({ERROR_RETURN_STRING: DUPLICATE_REQUEST}), 422)
+        elif not ok:
             return make_response(jsonify({ERROR_RETURN_STRING: INTERNAL_SERVER_ERROR}), 500)
         else:
             return make_response(jsonify({SUCCESS_RETURN_STRING: "Ok"}), 201)
@@ -96,7 +94,7 @@ def new_glasses_localization() -> Response:
     """ This function can register new glasses location in the OGC server.
     :return: An HTTP Response.
     """
-    logging.debug(new_glasses_localization.__name__ + " method called from: "+request.remote_addr)
+    logging.debug("%s method called from: %s", new_glasses_localization.__name__, request.remote_addr)
     response = put_observation(PROPERTY_LOCALIZATION_NAME, request.json)
     return response
 
@@ -106,7 +104,7 @@ def new_glasses_incident() -> Response:
     """ This function can register new glasses incident in the OGC server.
     :return: An HTTP Response.
     """
-    logging.debug(new_glasses_incident.__name__ + " method called from: "+request.remote_addr)
+    logging.debug("%s method called from: %s", new_glasses_incident.__name__, request.remote_addr)
 
     response = put_observation(PROPERTY_INCIDENT_NAME, request.json)
     return response
@@ -124,7 +122,9 @@ def put_observation(observed_property: str, payload: dict) -> Response:
         return status
 
     glasses_id = payload[TAG_ID_KEY]
-    result = scral_module.ogc_observation_registration(observed_property, payload)
+    # OBSERVATIONs of the same device are published in order, the ones of different devices in parallel
+    result = scral_module.execute_ordered(glasses_id, scral_module.ogc_observation_registration,
+                                          observed_property, payload)
     if result is True:
         return make_response(jsonify({SUCCESS_RETURN_STRING: "Ok"}), 201)
     elif result is None:
@@ -140,7 +140,7 @@ def get_active_devices() -> Response:
     """ This endpoint gives access to the resource catalog.
     :return: A JSON containing thr resource catalog.
     """
-    logging.debug(get_active_devices.__name__ + " method called from: "+request.remote_addr)
+    logging.debug("%s method called from: %s", get_active_devices.__name__, request.remote_addr)
 
     to_ret = jsonify(scral_module.get_active_devices())
     return make_response(to_ret, 200)
@@ -151,7 +151,7 @@ def test_module() -> str:
     """ Checking if SCRAL is running.
         :return: A str containing some information about possible endpoints.
     """
-    logging.debug(test_module.__name__ + " method called from: "+request.remote_addr)
+    logging.debug("%s method called from: %s", test_module.__name__, request.remote_addr)
 
     link = DOC[ENDPOINT_URL_KEY] + ":" + str(DOC[ENDPOINT_PORT_KEY])
     deletes = posts = (URI_GLASSES_REGISTRATION, )
@@ -166,5 +166,6 @@ if __name__ == '__main__':
     sys.stdout.flush()
 
     signal.signal(signal.SIGINT, util.signal_handler)
+    signal.signal(signal.SIGTERM, util.signal_handler)
     main()
     print(END_MESSAGE)
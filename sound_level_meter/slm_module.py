@@ -15,16 +15,13 @@
 import os
 import sys
 import time
-from threading import Thread, Lock
-from datetime import timedelta
+from threading import Thread
 from typing import Optional, Dict, List, Union
 
-import arrow
 import requests
 import json
 import logging
 
-from arrow import Arrow
 from flask import Flask, Response
 from urllib3.exceptions import NewConnectionError, MaxRetryError
 
@@ -32,7 +29,7 @@ from scral_ogc import OGCDatastream, OGCObservedProperty
 
 from scral_core.constants import REST_HEADERS, CATALOG_FILENAME, ENABLE_CHERRYPY, COORD, \
                                  ERROR_MISSING_ENV_VARIABLE, ERROR_MISSING_PARAMETER
-from scral_core import util, rest_util
+from scral_core import clock, log_util, util, rest_util
 from scral_core.ogc_configuration import OGCConfiguration
 
 from microphone.microphone_module import SCRALMicrophone
@@ -54,9 +51,6 @@ class SCRALSoundLevelMeter(SCRALMicrophone):
         """
         super().__init__(ogc_config, config_filename, catalog_name)
 
-        self._publish_mutex = Lock()
-        self._observation_cnt_mutex = Lock()
-
         self._sequences = []
 
         self._url_login = url_login
@@ -87,12 +81,6 @@ class SCRALSoundLevelMeter(SCRALMicrophone):
     def get_cloud_token(self) -> str:
         return self._cloud_token
 
-    def get_publish_mutex(self) -> Lock:
-        return self._publish_mutex
-
-    def get_observation_cnt_mutex(self) -> Lock:
-        return self._observation_cnt_mutex
-
     def update_cloud_token(self):
         """ Updates the cloud access token by using available credentials """
         self._cloud_token = rest_util.get_server_access_token(self._url_login, self._credential, REST_HEADERS,
@@ -196,19 +184,29 @@ class SCRALSoundLevelMeter(SCRALMicrophone):
             device_description = values["description"]
 
             # Check whether device has been already registered
-            if device_id in self._resource_catalog:
+            entry, created = self._resource_catalog.register_if_absent(
+                device_id, lambda: self._build_catalog_entry(device_id, device_name, device_coordinates,
+                                                             device_description))
+            if not created:
                 logging.debug("Device: " + device_name + " already registered with id: " + device_id)
-            else:
-                self._resource_catalog[device_id] = {}
-                self._resource_catalog[device_id][DEVICE_NAME_KEY] = device_name
-                # Iterate over ObservedProperties
-                for ogc_property in self._ogc_config.get_observed_properties():
-                    self._new_datastream_slm(ogc_property, device_id, device_name, device_coordinates, device_description)
 
         self.update_file_catalog()
         logging.info("\n\n--- End of OGC DATASTREAMs registration. "
                      + str(len(self._ogc_config.get_datastreams()))+" datastreams were registered. ---\n")
 
+    def _build_catalog_entry(self, device_id: str, device_name: str, device_coordinates: COORD,
+                             device_description: str) -> dict:
+        """ Register the DATASTREAMs of a device (one for each OBSERVED PROPERTY).
+
+        :return: The resource catalog entry of the device.
+        """
+        entry = {DEVICE_NAME_KEY: device_name}
+        # Iterate over ObservedProperties
+        for ogc_property in self._ogc_config.get_observed_properties():
+            entry[ogc_property.get_name()] = self._new_datastream_slm(
+                ogc_property, device_id, device_name, device_coordinates, device_description)
+        return entry
+
     def new_datastream(self, device_id: str, ogc_obs_property: OGCObservedProperty):
         """ This method have to be called when you want to add a new DATASTREAM.
 
@@ -223,21 +221,26 @@ class SCRALSoundLevelMeter(SCRALMicrophone):
         if ogc_obs_property not in self.get_ogc_config().get_observed_properties():
             ogc_obs_property = self._ogc_config.add_observed_property(ogc_obs_property)
 
-        try:
-            datastream_id = self._resource_catalog[device_id][ogc_obs_property.get_name()]
-        except KeyError:
-            device_coordinates = self._active_microphones[device_id]["coordinates"]
-            device_name = self._active_microphones[device_id]["name"]
-            device_description = self._active_microphones[device_id]["description"]
+        device_coordinates = self._active_microphones[device_id]["coordinates"]
+        device_name = self._active_microphones[device_id]["name"]
+        device_description = self._active_microphones[device_id]["description"]
 
-            datastream_id = self._new_datastream_slm(
-                ogc_obs_property, device_id, device_name, device_coordinates, device_description)
+        # concurrent calls for the same property register only one DATASTREAM
+        property_name = ogc_obs_property.get_name()
+        datastream_id, created = self._resource_catalog.register_datastream_if_absent(
+            device_id, property_name, lambda: self._new_datastream_slm(
+                ogc_obs_property, device_id, device_name, device_coordinates, device_description))
+        if created:
+            logging.debug("Added Datastream: " + str(datastream_id) + " to the resource catalog for device: "
+                          + device_id + " and property: " + property_name)
+            self.update_file_catalog(device_id)
 
         return datastream_id
 
     def _new_datastream_slm(self, ogc_property: OGCObservedProperty, device_id: str, device_name: str,
                             device_coordinates: COORD, device_description: str) -> int:
-        """ This method creates a new DATASTREAM. It is a private method, externally you should call "new_datastream".
+        """ This method creates a new DATASTREAM on the OGC server, without changing the resource catalog.
+            It is a private method, externally you should call "new_datastream".
 
         :param ogc_property: The OBSERVED PROPERTY.
         :param device_id: The physical device ID.
@@ -270,14 +273,6 @@ class SCRALSoundLevelMeter(SCRALMicrophone):
 
         datastream.set_id(datastream_id)
         self._ogc_config.add_datastream(datastream)
-
-        # Store device/property information in local resource catalog
-        if property_name not in self._resource_catalog[device_id].keys():
-            self._resource_catalog[device_id][property_name] = datastream_id
-            logging.debug("Added Datastream: " + str(datastream_id) + " to the resource catalog for device: "
-                          + device_id + " and property: " + property_name)
-
-        self.update_file_catalog()
         return datastream_id
 
     class SLMThread(Thread):
@@ -300,7 +295,6 @@ class SCRALSoundLevelMeter(SCRALMicrophone):
             self._device_id = device_id
             self._url_sequences = url_sequences
             self._slm_module = slm_module
-            self._counter_mutex = slm_module.get_observation_cnt_mutex()
 
         def run(self):
             self._logger.info("Starting Thread: " + self._thread_name)
@@ -315,7 +309,7 @@ class SCRALSoundLevelMeter(SCRALMicrophone):
                                       "\nImpossible to establish a connection with " + self._url_sequences)
 
             sequences_data = self._init_sequences(resp)
-            query_ts_end = util.from_utc_to_query(arrow.utcnow())
+            query_ts_end = util.from_utc_to_query(clock.utc_now())
 
             # ### LAeq values averaged on 5 minutes ###
             start_timer_avg5min = time.time()
@@ -348,19 +342,20 @@ class SCRALSoundLevelMeter(SCRALMicrophone):
                         payload = resp.json()  # ['value']
 
                         if payload["value"] and len(payload["value"]) >= 1:  # is the payload not empty?
-                            self._logger.info("Sequence: " + property_name + "\n" + json.dumps(payload))
+                            if log_util.sampled(logging.INFO, "sequence", self._device_id, self._logger):
+                                self._logger.info("Sequence: %s\n%s", property_name, log_util.LazyJSON(payload))
 
                             datastream_id = rc[self._device_id][property_name]
                             observation_result = {"valueType": property_name, "response": payload}
                             phenomenon_time = payload["value"][0]["startTime"]
-                            ok = self._slm_module.ogc_observation_registration(
-                                datastream_id, phenomenon_time, observation_result)
-                            if ok:
-                                self._counter_mutex.acquire()
-                                try:
-                                    self._slm_module._update_active_devices_counter()
-                                finally:
-                                    self._counter_mutex.release()
+                            if not self._slm_module.begin_activity():
+                                return  # the module is shutting down
+                            try:
+                                # the OBSERVATION is counted by ogc_observation_registration
+                                self._slm_module.ogc_observation_registration(
+                                    datastream_id, phenomenon_time, observation_result)
+                            finally:
+                                self._slm_module.end_activity()
                         else:
                             self._logger.error("Property: '"+property_name+"' has NULL payload!")
                             self._logger.info("Timestamp: " + seq["time"])
@@ -371,7 +366,7 @@ class SCRALSoundLevelMeter(SCRALMicrophone):
 
                     # UPDATE INTERVALS
                     query_ts_start = query_ts_end
-                    query_ts_end = util.from_utc_to_query(arrow.utcnow())
+                    query_ts_end = util.from_utc_to_query(clock.utc_now())
 
                     for seq in sequences_data:
                         property_name = seq["valueType"]
@@ -380,14 +375,14 @@ class SCRALSoundLevelMeter(SCRALMicrophone):
                             if time_elapsed_avg_laeq >= MIN5_IN_SECONDS:  # updates only if time is elapsed
                                 start_timer_avg5min = time.time()
 
-                                min10_ago_in_seconds = arrow.utcnow() - timedelta(seconds=600)
+                                min10_ago_in_seconds = clock.utc_now() - 600
                                 seq["time"] = build_time_token(min10_ago_in_seconds, MIN5_IN_SECONDS)
                         elif property_name == "Annoyance":                # updates only if time is elapsed
                             if time_elapsed_annoyance >= 60:
                                 start_timer_annoyance = time.time()
 
                                 # min2_ago_in_seconds = arrow.utcnow() - timedelta(seconds=120)
-                                min10_ago_in_seconds = arrow.utcnow() - timedelta(seconds=600)
+                                min10_ago_in_seconds = clock.utc_now() - 600
                                 seq["time"] = build_time_token(min10_ago_in_seconds, 60)
                         else:
                             seq["time"] = '?startTime=' + query_ts_start + '&endTime=' + query_ts_end
@@ -420,7 +415,7 @@ class SCRALSoundLevelMeter(SCRALMicrophone):
             :return: An array of sequences properly initialized.
             """
 
-            time_token = build_time_token(arrow.utcnow(), UPDATE_INTERVAL)
+            time_token = build_time_token(clock.utc_now(), UPDATE_INTERVAL)
 
             sequences_data = []
             for sequence in resp.json()['value']:
@@ -437,12 +432,12 @@ class SCRALSoundLevelMeter(SCRALMicrophone):
                     # min2_ago_in_seconds = arrow.utcnow() - timedelta(seconds=120)
                     # data["time"] = build_time_token(min2_ago_in_seconds, 60)
 
-                    min10_ago_in_seconds = arrow.utcnow() - timedelta(seconds=600)
+                    min10_ago_in_seconds = clock.utc_now() - 600
                     data["time"] = build_time_token(min10_ago_in_seconds, 60)
                 elif sequence_name == "Avg5minLAeq":
                     data["url_prefix"] = prefix + "/single"
 
-                    min10_ago_in_seconds = arrow.utcnow() - timedelta(seconds=600)
+                    min10_ago_in_seconds = clock.utc_now() - 600
                     data["time"] = build_time_token(min10_ago_in_seconds, MIN5_IN_SECONDS)
                 elif sequence_name == "CPBLZeq":
                     data["url_prefix"] = prefix + "/array"
@@ -455,15 +450,15 @@ class SCRALSoundLevelMeter(SCRALMicrophone):
             return sequences_data
 
 
-def build_time_token(utc_ts_end: Arrow, update_interval: float) -> str:
+def build_time_token(utc_ts_end: float, update_interval: float) -> str:
     """ This function build a time_token according to HTTP request format.
 
-    :param utc_ts_end: An arrow timestamp
+    :param utc_ts_end: A UTC timestamp in seconds since the epoch (e.g. clock.utc_now())
     :param update_interval: An amount of second that you want to subtract from the "utc_ts_end"
     :return: A string like this: '?startTime=<start_time>&endTime=<end_time>'
     """
     # Set time-window size in order to define the number of values you retrieve for each request (in UTC)
-    utc_ts_start = utc_ts_end - timedelta(seconds=update_interval)
+    utc_ts_start = utc_ts_end - update_interval
 
     # prepare format for URL
     query_ts_end = util.from_utc_to_query(utc_ts_end)
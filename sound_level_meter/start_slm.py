@@ -98,7 +98,7 @@ def new_sound_event() -> Response:
 
     :return: An HTTP Response.
     """
-    logging.debug(new_sound_event.__name__ + " method called from: "+request.remote_addr)
+    logging.debug("%s method called from: %s", new_sound_event.__name__, request.remote_addr)
 
     ok, status = rest_util.tests_and_checks(DOC[MODULE_NAME_KEY], scral_module, request)
     if not ok:
@@ -125,7 +125,8 @@ def new_sound_event() -> Response:
     elif datastream_id is None:
         return make_response(jsonify({ERROR_RETURN_STRING: INTERNAL_SERVER_ERROR}), 500)
     else:
-        scral_module.ogc_observation_registration(datastream_id, lower_payload[START_TIME_KEY.lower()], payload)
+        scral_module.execute_ordered(datastream_id, scral_module.ogc_observation_registration,
+                                     datastream_id, lower_payload[START_TIME_KEY.lower()], payload)
         return make_response(jsonify({SUCCESS_RETURN_STRING: "Ok"}), 201)
 
 
@@ -134,7 +135,7 @@ def get_active_devices() -> Response:
     """ This endpoint gives access to the resource catalog.
     :return: A JSON containing thr resource catalog.
     """
-    logging.debug(get_active_devices.__name__ + " method called from: "+request.remote_addr)
+    logging.debug("%s method called from: %s", get_active_devices.__name__, request.remote_addr)
 
     rc_to_ret = {}
     rc_copy = copy.deepcopy(scral_module.get_active_devices())
@@ -152,8 +153,8 @@ def get_resource_catalog() -> Response:
     """ This endpoint gives access to the resource catalog.
     :return: A JSON containing thr resource catalog.
     """
-    logging.debug(get_resource_catalog.__name__ + " method called from: "+request.remote_addr)
-    return make_response(jsonify(scral_module.get_resource_catalog()), 200)
+    logging.debug("%s method called from: %s", get_resource_catalog.__name__, request.remote_addr)
+    return make_response(jsonify(scral_module.get_resource_catalog().snapshot()), 200)
 
 
 @flask_instance.route(URI_DEFAULT, methods=["GET"])
@@ -161,7 +162,7 @@ def test_module() -> str:
     """ Checking if SCRAL is running.
         :return: A str containing some information about possible endpoints.
     """
-    logging.debug(test_module.__name__ + " method called from: "+request.remote_addr)
+    logging.debug("%s method called from: %s", test_module.__name__, request.remote_addr)
 
     link = DOC[ENDPOINT_URL_KEY]+":"+str(DOC[ENDPOINT_PORT_KEY])
     posts = ()
@@ -176,5 +177,6 @@ if __name__ == '__main__':
     sys.stdout.flush()
 
     signal.signal(signal.SIGINT, util.signal_handler)
+    signal.signal(signal.SIGTERM, util.signal_handler)
     main()
     print(END_MESSAGE)
@@ -63,7 +63,7 @@ def register_device() -> Response:
     """ This function can be used to register a new device in the OGC server.
     :return: An HTTP Response.
     """
-    logging.debug(register_device.__name__ + " method called from: " + request.remote_addr)
+    logging.debug("%s method called from: %s", register_device.__name__, request.remote_addr)
 
     ok, status = rest_util.tests_and_checks(DOC[MODULE_NAME_KEY], scral_module, request)
     if not ok:
@@ -83,7 +83,7 @@ def delete_device() -> Response:
     """ This function can be used to register a new device in the OGC server.
         :return: An HTTP Response.
     """
-    logging.debug(delete_device.__name__ + " method called from: " + request.remote_addr)
+    logging.debug("%s method called from: %s", delete_device.__name__, request.remote_addr)
 
     ok, status = rest_util.tests_and_checks(DOC[MODULE_NAME_KEY], scral_module, request)
     if not ok:
@@ -100,7 +100,7 @@ def new_device_localization() -> Response:
 
     :return: An HTTP request.
     """
-    logging.debug(new_device_localization.__name__ + " method called from: "+request.remote_addr)
+    logging.debug("%s method called from: %s", new_device_localization.__name__, request.remote_addr)
 
     ok, status = rest_util.tests_and_checks(DOC[MODULE_NAME_KEY], scral_module, request)
     if not ok:
@@ -110,7 +110,8 @@ def new_device_localization() -> Response:
     device_id = payload[DEVICE_ID_KEY]
 
     # you should use the same property_name used in the ogc_config.conf file
-    result = scral_module.ogc_observation_registration("Property1", payload)
+    # OBSERVATIONs of the same device are published in order, the ones of different devices in parallel
+    result = scral_module.execute_ordered(device_id, scral_module.ogc_observation_registration, "Property1", payload)
     if result is True:
         return make_response(jsonify({SUCCESS_RETURN_STRING: "Ok"}), 201)
     elif result is None:
@@ -126,7 +127,7 @@ def get_active_devices() -> Response:
     """ This endpoint gives access to the resource catalog.
     :return: A JSON containing thr resource catalog.
     """
-    logging.debug(get_active_devices.__name__ + " method called from: "+request.remote_addr)
+    logging.debug("%s method called from: %s", get_active_devices.__name__, request.remote_addr)
 
     to_ret = jsonify(scral_module.get_active_devices())
     return make_response(to_ret, 200)
@@ -137,7 +138,7 @@ def test_module() -> str:
     """ Checking if SCRAL is running.
         :return: A str containing some information about possible endpoints.
     """
-    logging.debug(test_module.__name__ + " method called from: "+request.remote_addr)
+    logging.debug("%s method called from: %s", test_module.__name__, request.remote_addr)
 
     link = DOC[ENDPOINT_URL_KEY] + ":" + str(DOC[ENDPOINT_PORT_KEY])
     posts = (URI_DEVICE_REGISTRATION, )
@@ -153,5 +154,6 @@ if __name__ == '__main__':
     sys.stdout.flush()
 
     signal.signal(signal.SIGINT, util.signal_handler)
+    signal.signal(signal.SIGTERM, util.signal_handler)
     main()
     print(END_MESSAGE)
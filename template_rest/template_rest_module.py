@@ -12,16 +12,13 @@
 # SCRAL is distributed under a BSD-style license -- See file LICENSE.md     #
 #                                                                           #
 #############################################################################
-import json
 import logging
 from typing import Union
 
-import arrow
-
 from scral_ogc import OGCObservation
 from scral_ogc.ogc_datastream import OGCDatastream
 
-from scral_core import util
+from scral_core import clock, log_util, util
 from scral_core.constants import CATALOG_FILENAME
 from scral_core.ogc_configuration import OGCConfiguration
 from scral_core.rest_module import SCRALRestModule
@@ -35,9 +32,20 @@ class SCRALTemplate(SCRALRestModule):
         super().__init__(ogc_config, config_filename, catalog_name)
 
     def ogc_datastream_registration(self, device_id: str) -> bool:
+        """ Register the DATASTREAMs of a device, if it was already registered its entry is replaced. """
         if self._ogc_config is None:
             return False
 
+        if self._resource_catalog.register(device_id, lambda: self._build_catalog_entry(device_id)) is None:
+            return False
+        self.update_file_catalog(device_id)
+        return True
+
+    def _build_catalog_entry(self, device_id: str) -> Union[dict, None]:
+        """ Register the DATASTREAMs of a device on the OGC server.
+
+        :return: The resource catalog entry of the device, None if the registration failed.
+        """
         # Collect OGC information needed to build DATASTREAMs payload
         thing = self._ogc_config.get_thing()
         thing_id = thing.get_id()
@@ -48,9 +56,7 @@ class SCRALTemplate(SCRALRestModule):
         sensor_id = sensor.get_id()
         sensor_name = sensor.get_name()
 
-        rc = self._resource_catalog
-
-        rc[device_id] = {}
+        entry = {}  # added to the resource catalog only when complete
         for op in self._ogc_config.get_observed_properties():
             property_id = op.get_id()
             property_name = op.get_name()
@@ -66,14 +72,13 @@ class SCRALTemplate(SCRALRestModule):
                 datastream, self._ogc_config.URL_DATASTREAMS, self._ogc_config.FILTER_NAME)
 
             if not datastream_id:
-                return False
+                return None
 
             datastream.set_id(datastream_id)
             self._ogc_config.add_datastream(datastream)
-            rc[device_id][property_name] = datastream_id
+            entry[property_name] = datastream_id
 
-        self.update_file_catalog()
-        return True
+        return entry
 
     def ogc_observation_registration(self, obs_property: str, payload: dict) -> Union[None, bool]:
         device_id = payload[DEVICE_ID_KEY]
@@ -81,19 +86,18 @@ class SCRALTemplate(SCRALRestModule):
             return None
 
         phenomenon_time = payload.pop("timestamp")  # Retrieving and removing the phenomenon time
-        observation_time = str(arrow.utcnow())
+        observation_time = clock.utc_now_iso()
         observation_result = payload
 
-        logging.debug(
-            "Device: '"+device_id+"', Property: '"+obs_property+"', Observation:\n"+json.dumps(observation_result)+".")
+        if log_util.sampled(logging.DEBUG, "observation", device_id):
+            logging.debug("Device: '%s', Property: '%s', Observation:\n%s.",
+                          device_id, obs_property, log_util.LazyJSON(observation_result))
 
         datastream_id = self._resource_catalog[device_id][obs_property]
-        topic = self._topic_prefix + "Datastreams(" + str(datastream_id) + ")/Observations"
 
         # Create OGC Observation and publish
         ogc_observation = OGCObservation(datastream_id, phenomenon_time, observation_result, observation_time)
-        observation_payload = json.dumps(ogc_observation.get_rest_payload())
-
-        mqtt_response = self.mqtt_publish(topic, observation_payload)
+        mqtt_response = self.ogc_observation_publish(ogc_observation, device_id=device_id,
+                                                     observed_property=obs_property)
         self._update_active_devices_counter()
         return mqtt_response
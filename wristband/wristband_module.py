@@ -16,19 +16,41 @@ import json
 import logging
 from typing import Union
 
-import arrow
-from wristband.constants import TAG_ID_KEY, TIME_KEY
+from wristband.constants import TAG_ID_KEY, TIME_KEY, PROPERTY_BUTTON_NAME
 
 from scral_ogc import OGCObservation, OGCDatastream
+from scral_core import clock, log_util
+from scral_core.constants import PRIORITY_HIGH
 from scral_core.rest_module import SCRALRestModule
 
 
 class SCRALWristband(SCRALRestModule):
 
+    _default_priorities = {PROPERTY_BUTTON_NAME: PRIORITY_HIGH}
+
     def ogc_datastream_registration(self, wristband_id: str, payload: dict) -> bool:
-        if self._ogc_config is None:
+        """ Register the DATASTREAMs of a wristband, if it was already registered its entry is overwritten. """
+        def build_entry() -> Union[dict, None]:
+            if wristband_id in self._resource_catalog:
+                logging.warning("Device '" + str(wristband_id) + "' already registered... It will be overwritten on RC!")
+            return self._build_catalog_entry(wristband_id, payload)
+
+        # serialized with the automatic registration of "ogc_observation_registration"
+        entry = self._resource_catalog.register(wristband_id, build_entry)
+        if entry is None:
             return False
 
+        self.update_file_catalog(wristband_id)
+        return True
+
+    def _build_catalog_entry(self, wristband_id: str, payload: dict) -> Union[dict, None]:
+        """ Register the DATASTREAMs of a wristband on the OGC server.
+
+        :return: The resource catalog entry of the wristband, None if the registration failed.
+        """
+        if self._ogc_config is None:
+            return None
+
         # Collect OGC information needed to build DATASTREAMs payload
         thing = self._ogc_config.get_thing()
         thing_id = thing.get_id()
@@ -43,10 +65,9 @@ class SCRALWristband(SCRALRestModule):
 
         if not sensor_id:
             logging.error("Wearable type: <"+wearable_type+"> is not registered in OGC Model.")
-            return False
+            return None
 
-        # with self._lock:
-        self._resource_catalog[wristband_id] = {}
+        entry = {}
         for op in self._ogc_config.get_observed_properties():
             property_id = op.get_id()
             property_name = op.get_name()
@@ -63,8 +84,7 @@ class SCRALWristband(SCRALRestModule):
             datastream.set_id(datastream_id)
             self._ogc_config.add_datastream(datastream)
 
-            # with self._lock:
-            self._resource_catalog[wristband_id][property_name] = datastream_id
+            entry[property_name] = datastream_id
 
             topic = self._topic_prefix + "Datastreams"
             mqtt_payload = {"wristband_id": wristband_id,
@@ -73,52 +93,48 @@ class SCRALWristband(SCRALRestModule):
             self.mqtt_publish(topic, json.dumps(mqtt_payload), to_print=False)
             # what should happens if an MQTT message is not properly sent?
 
-        # with self._lock:
-        self.update_file_catalog()
-
-        return True
+        return entry
 
     def ogc_observation_registration(self, obs_property: str, payload: dict) -> Union[bool, None]:
         wristband_id = payload[TAG_ID_KEY]
         if wristband_id not in self._resource_catalog:
             logging.warning("Wristband '"+wristband_id+"' not yet registered, it will be automatically registered.")
-            ok = self.ogc_datastream_registration(wristband_id, payload)
-            if not ok:
+            # messages of different topics are handled in parallel: only one of them registers the wristband
+            entry, created = self._resource_catalog.register_if_absent(
+                wristband_id, lambda: self._build_catalog_entry(wristband_id, payload))
+            if entry is None:
                 logging.error("Registration of wristband: '"+wristband_id+"' failed!")
                 return None
+            if created:
+                self.update_file_catalog(wristband_id)
 
         phenomenon_time = payload.pop(TIME_KEY, False)  # Retrieving and removing the phenomenon time
         if not phenomenon_time:
-            phenomenon_time = str(arrow.utcnow())
-        observation_time = str(arrow.utcnow())
+            phenomenon_time = clock.utc_now_iso()
+        observation_time = clock.utc_now_iso()
 
-        logging.debug(
-            "Wristband: '"+wristband_id+"', Property: '"+obs_property+"', Observation:\n"+json.dumps(payload)+".")
+        if log_util.sampled(logging.DEBUG, "observation", wristband_id):
+            logging.debug("Wristband: '%s', Property: '%s', Observation:\n%s.",
+                          wristband_id, obs_property, log_util.LazyJSON(payload))
 
         datastream_id = self._resource_catalog[wristband_id][obs_property]
-        topic = self._topic_prefix + "Datastreams(" + str(datastream_id) + ")/Observations"
 
         # Create OGC Observation and publish
         ogc_observation = OGCObservation(datastream_id, phenomenon_time, payload, observation_time)
-        observation_payload = json.dumps(ogc_observation.get_rest_payload())
-
-        mqtt_result = self.mqtt_publish(topic=topic, payload=observation_payload, to_print=False)
+        mqtt_result = self.ogc_observation_publish(ogc_observation, to_print=False, device_id=wristband_id,
+                                                   observed_property=obs_property)
         self._update_active_devices_counter()
         return mqtt_result
 
     def ogc_service_observation_registration(self, datastream: OGCDatastream, payload: dict) -> bool:
         phenomenon_time = payload.pop(TIME_KEY, False)  # Retrieving and removing the phenomenon time
         if not phenomenon_time:
-            phenomenon_time = str(arrow.utcnow())
-        observation_time = str(arrow.utcnow())
-
-        logging.debug(
-            "Service: '" + datastream.get_name() + "', Observation:\n" + json.dumps(payload) + ".")
+            phenomenon_time = clock.utc_now_iso()
+        observation_time = clock.utc_now_iso()
 
-        topic = self._topic_prefix + "Datastreams(" + str(datastream.get_id()) + ")/Observations"
+        if log_util.sampled(logging.DEBUG, "observation", datastream.get_name()):
+            logging.debug("Service: '%s', Observation:\n%s.", datastream.get_name(), log_util.LazyJSON(payload))
 
         # Create OGC Observation and publish
         ogc_observation = OGCObservation(datastream.get_id(), phenomenon_time, payload, observation_time)
-        observation_payload = json.dumps(ogc_observation.get_rest_payload())
-
-        return self.mqtt_publish(topic=topic, payload=observation_payload)
+        return self.ogc_observation_publish(ogc_observation)
@@ -51,7 +51,7 @@ def main():
 
 @flask_instance.route(URI_WRISTBAND, methods=["POST", "DELETE"])
 def wristband_request() -> Response:
-    logging.debug(wristband_request.__name__ + " method called from: " + request.remote_addr)
+    logging.debug("%s method called from: %s", wristband_request.__name__, request.remote_addr)
 
     ok, status = rest_util.tests_and_checks(DOC[MODULE_NAME_KEY], scral_module, request)
     if not ok:
@@ -60,12 +60,7 @@ def wristband_request() -> Response:
     wristband_id = request.json[TAG_ID_KEY]
 
     if request.method == "POST":  # Device Registration
-        rc = scral_module.get_resource_catalog()
-        if wristband_id not in rc:
-            logging.info("Wristband: '" + str(wristband_id) + "' registration.")
-        else:
-            logging.warning("Device '" + str(wristband_id) + "' already registered... It will be overwritten on RC!")
-
+        logging.info("Wristband: '" + str(wristband_id) + "' registration.")
         ok = scral_module.ogc_datastream_registration(wristband_id, request.json)
         if not ok:
             return make_response(jsonify({ERROR_RETURN_STRING: INTERNAL_SERVER_ERROR}), 500)
@@ -82,7 +77,7 @@ def get_active_devices() -> Response:
     """ This endpoint gives access to the resource catalog.
     :return: A JSON containing thr resource catalog.
     """
-    logging.debug(get_active_devices.__name__+" method called from: "+request.remote_addr)
+    logging.debug("%s method called from: %s", get_active_devices.__name__, request.remote_addr)
 
     to_ret = jsonify(scral_module.get_active_devices())
     return make_response(to_ret, 200)
@@ -93,7 +88,7 @@ def test_module() -> str:
     """ Checking if SCRAL is running.
     :return: A str containing some information about possible endpoints.
     """
-    logging.debug(test_module.__name__ + " method called from: "+request.remote_addr)
+    logging.debug("%s method called from: %s", test_module.__name__, request.remote_addr)
 
     to_ret = util.to_html_documentation(
                                     module_name=DOC[MODULE_NAME_KEY],
@@ -110,5 +105,6 @@ if __name__ == '__main__':
     sys.stdout.flush()
 
     signal.signal(signal.SIGINT, util.signal_handler)
+    signal.signal(signal.SIGTERM, util.signal_handler)
     main()
     print(END_MESSAGE)
@@ -14,20 +14,19 @@ import json
 import logging
 import os
 import sys
-import time
 
 import paho.mqtt.client as mqtt
 
 from scral_core.constants import CATALOG_FILENAME, DEFAULT_KEEPALIVE, BROKER_DEFAULT_PORT, \
                                  ERROR_MISSING_PARAMETER, ERROR_MISSING_ENV_VARIABLE, \
                                  MQTT_KEY, MQTT_SUB_BROKER_KEY, MQTT_SUB_BROKER_PORT_KEY, MQTT_SUB_BROKER_KEEP_KEY
-from scral_core import mqtt_util, util
+from scral_core import log_util, mqtt_util, util
 from scral_core.ogc_configuration import OGCConfiguration
 
 from wristband.constants import PROPERTY_LOCALIZATION_NAME, PROPERTY_BUTTON_NAME, TAG_ID_KEY, SENSOR_ASSOCIATION_NAME
 from wristband.wristband_module import SCRALWristband
 
-from wristband_mqtt.constants import CLIENT_ID, BUTTON_SUBTOPIC, DEFAULT_SUBSCRIPTION_WB, \
+from wristband_mqtt.constants import CLIENT_ID, BUTTON_SUBTOPIC, \
                                      ASSOCIATION_SUBTOPIC, LOCALIZATION_SUBTOPIC, LISTENING_DEFAULT_QOS
 
 MESSAGE_RECEIVED: int = 0
@@ -45,11 +44,12 @@ class SCRALMQTTWristband(SCRALWristband):
         super().__init__(ogc_config, config_filename, catalog_name)
 
         # Creating an MQTT Subscriber
-        self._mqtt_subscriber = mqtt.Client(CLIENT_ID)
+        self._mqtt_subscriber = self._create_mqtt_subscriber(CLIENT_ID)
         self._mqtt_subscriber.connected_flag = False  # create connection flag in client
-        self._mqtt_subscriber.on_connect = mqtt_util.on_connect
-        self._mqtt_subscriber.on_disconnect = self.automatic_reconnection
         self._mqtt_subscriber.on_message = self.on_message_received
+        # network loop, reconnections and re-subscriptions are managed by a dedicated thread
+        self._reconnection = mqtt_util.ReconnectionManager(self._mqtt_subscriber, CLIENT_ID + "-network",
+                                                           mqtt_util.on_connect)
 
         # Retrieving MQTT subscribing info from config_filename
         if config_filename:
@@ -95,19 +95,14 @@ class SCRALMQTTWristband(SCRALWristband):
         logging.info("Try to connect to broker: %s:%s for LISTENING..."
                      % (self._sub_broker_address, self._sub_broker_port))
         logging.debug("MQTT Client ID is: " + str(self._mqtt_subscriber._client_id))
-        self._mqtt_subscriber.connect(self._sub_broker_address, self._sub_broker_port, self._sub_broker_keepalive)
-        # Two connection to the same broker are apparently problematic...
-        # while not self._mqtt_subscriber.connected_flag:  # wait in loop
-        #     logging.debug("Waiting...")
-        #     time.sleep(1)
+        self._reconnection.connect(self._sub_broker_address, self._sub_broker_port, self._sub_broker_keepalive)
 
     def mqtt_subscriptions(self, device: str):
         topic = self._topic_prefix+"SCRAL/"+device+"/Localization"
 
         logging.info("Subscribing to MQTT topic: " + topic)
-        self._mqtt_subscriber.subscribe(topic, LISTENING_DEFAULT_QOS)
+        self._reconnection.subscribe(topic, LISTENING_DEFAULT_QOS)  # restored at each reconnection
         logging.info("Start listening...")
-        self._mqtt_subscriber.loop_start()
 
         # ToDo: Here we can add dynamic discovery phase in the future as did in gps_tracker_poll
         # if dynamic_discovery:
@@ -121,10 +116,14 @@ class SCRALMQTTWristband(SCRALWristband):
     def on_message_received(self, client, userdata, msg):
         global MESSAGE_RECEIVED
         MESSAGE_RECEIVED += 1
+        # messages of the same topic are handled in order, the ones of different topics in parallel
+        self.submit_ordered(msg.topic, self._handle_message, msg, MESSAGE_RECEIVED)
 
+    def _handle_message(self, msg: mqtt.MQTTMessage, message_number: int):
         topic = msg.topic
         payload = json.loads(msg.payload)
-        logging.info("Messages Number: "+str(MESSAGE_RECEIVED)+" - Device: "+payload[TAG_ID_KEY]+" -  topic: "+topic)
+        if log_util.sampled(logging.INFO, "message", payload[TAG_ID_KEY]):
+            logging.info("Messages Number: %d - Device: %s -  topic: %s", message_number, payload[TAG_ID_KEY], topic)
 
         result = None
         if LOCALIZATION_SUBTOPIC in topic:
@@ -143,15 +142,3 @@ class SCRALMQTTWristband(SCRALWristband):
 
         if not result:
             logging.error("Error sending an MQTT message.\n"+topic+"\n"+payload)
-
-    def automatic_reconnection(self, client, userdata, rc):
-        time.sleep(10)
-        logging.error("Broker connection lost! Try to re-connecting to '" + str(client._host) + "'...")
-        client.reconnect()
-        time.sleep(5)
-        counter = 1
-        while not client.connected_flag:  # wait in loop
-            logging.debug("Waiting "+str(counter)+"s...")
-            time.sleep(1)
-        logging.info("Re-subscribing to topics again...")
-        self.mqtt_subscriptions(DEFAULT_SUBSCRIPTION_WB)
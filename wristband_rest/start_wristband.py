@@ -55,7 +55,7 @@ def main():
 
 @flask_instance.route(URI_WRISTBAND, methods=["POST", "DELETE"])
 def wristband_request() -> Response:
-    logging.debug(wristband_request.__name__ + " method called from: " + request.remote_addr)
+    logging.debug("%s method called from: %s", wristband_request.__name__, request.remote_addr)
 
     ok, status = rest_util.tests_and_checks(DOC[MODULE_NAME_KEY], scral_module, request)
     if not ok:
@@ -68,12 +68,7 @@ def wristband_request() -> Response:
         return make_response(jsonify({ERROR_RETURN_STRING: WRONG_REQUEST}), 400)
 
     if request.method == "POST":  # Device Registration
-        rc = scral_module.get_resource_catalog()
-        if wristband_id not in rc:
-            logging.info("Wristband: '" + str(wristband_id) + "' registration.")
-        else:
-            logging.warning("Device '" + str(wristband_id) + "' already registered... It will be overwritten on RC!")
-
+        logging.info("Wristband: '" + str(wristband_id) + "' registration.")
         ok = scral_module.ogc_datastream_registration(wristband_id, request.json)
         if not ok:
             return make_response(jsonify({ERROR_RETURN_STRING: INTERNAL_SERVER_ERROR}), 500)
@@ -87,7 +82,7 @@ def wristband_request() -> Response:
 
 @flask_instance.route(URI_WRISTBAND_ASSOCIATION, methods=["PUT"])
 def new_wristband_association_request() -> Response:
-    logging.debug(new_wristband_association_request.__name__+" method called from: "+request.remote_addr)
+    logging.debug("%s method called from: %s", new_wristband_association_request.__name__, request.remote_addr)
 
     ok, status = rest_util.tests_and_checks(DOC[MODULE_NAME_KEY], scral_module, request)
     if not ok:
@@ -106,7 +101,8 @@ def new_wristband_association_request() -> Response:
         logging.critical('No Virtual DATASTREAM registered for Virtual SENSOR: "' + SENSOR_ASSOCIATION_NAME + '"')
         return make_response(jsonify({ERROR_RETURN_STRING: INTERNAL_SERVER_ERROR}), 500)
 
-    result = scral_module.ogc_service_observation_registration(vds, request.json)
+    result = scral_module.execute_ordered(vds.get_id(), scral_module.ogc_service_observation_registration,
+                                          vds, request.json)
     if result is True:
         return make_response(jsonify({SUCCESS_RETURN_STRING: "Ok"}), 201)
     else:
@@ -116,7 +112,7 @@ def new_wristband_association_request() -> Response:
 
 @flask_instance.route(URI_WRISTBAND_LOCALIZATION, methods=["PUT"])
 def new_wristband_localization() -> Response:
-    logging.debug(new_wristband_localization.__name__ + " method called from: "+request.remote_addr)
+    logging.debug("%s method called from: %s", new_wristband_localization.__name__, request.remote_addr)
 
     response = put_observation(PROPERTY_LOCALIZATION_NAME, request.json)
     return response
@@ -124,7 +120,7 @@ def new_wristband_localization() -> Response:
 
 @flask_instance.route(URI_WRISTBAND_BUTTON, methods=["PUT"])
 def new_wristband_button() -> Response:
-    logging.debug(new_wristband_button.__name__ + " method called from: "+request.remote_addr)
+    logging.debug("%s method called from: %s", new_wristband_button.__name__, request.remote_addr)
 
     response = put_observation(PROPERTY_BUTTON_NAME, request.json)
     return response
@@ -142,7 +138,9 @@ def put_observation(observed_property: str, payload: json) -> Response:
         logging.error("Inside request missing field: " + str(ke))
         return make_response(jsonify({ERROR_RETURN_STRING: WRONG_REQUEST}), 400)
 
-    result = scral_module.ogc_observation_registration(observed_property, payload)
+    # OBSERVATIONs of the same device are published in order, the ones of different devices in parallel
+    result = scral_module.execute_ordered(wristband_id, scral_module.ogc_observation_registration,
+                                          observed_property, payload)
     if result is True:
         return make_response(jsonify({SUCCESS_RETURN_STRING: "Ok"}), 201)
     elif result is None:
@@ -158,7 +156,7 @@ def get_active_devices() -> Response:
     """ This endpoint gives access to the resource catalog.
     :return: A JSON containing thr resource catalog.
     """
-    logging.debug(get_active_devices.__name__+" method called from: "+request.remote_addr)
+    logging.debug("%s method called from: %s", get_active_devices.__name__, request.remote_addr)
 
     to_ret = jsonify(scral_module.get_active_devices())
     return make_response(to_ret, 200)
@@ -169,7 +167,7 @@ def test_module() -> str:
     """ Checking if SCRAL is running.
     :return: A str containing some information about possible endpoints.
     """
-    logging.debug(test_module.__name__ + " method called from: "+request.remote_addr)
+    logging.debug("%s method called from: %s", test_module.__name__, request.remote_addr)
 
     to_ret = util.to_html_documentation(
                                     module_name=DOC[MODULE_NAME_KEY],
@@ -187,5 +185,6 @@ if __name__ == '__main__':
     sys.stdout.flush()
 
     signal.signal(signal.SIGINT, util.signal_handler)
+    signal.signal(signal.SIGTERM, util.signal_handler)
     main()
     print(END_MESSAGE)